@@ -0,0 +1,6 @@
+from .asyncviews import async_patterns
+from .urls import urlpatterns as sync_urlpatterns
+
+app_name = 'api'
+
+urlpatterns = async_patterns(sync_urlpatterns)
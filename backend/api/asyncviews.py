@@ -0,0 +1,86 @@
+"""Вью API для ASGI: выполнение в ограниченном пуле потоков.
+
+В Django 3.2 нет асинхронного ORM (он появился в 4.1), а синхронные вью
+под ASGI выполняются через sync_to_async(thread_sensitive=True) в одном
+общем потоке процесса, и запросы выстраиваются к нему в очередь. Здесь
+вью целиком, вместе с запросами к БД и рендером ответа, выполняется в
+пуле из ASYNC_VIEW_THREADS потоков, а цикл событий uvicorn остается
+свободным для приема соединений и отдачи ответов медленным клиентам.
+Размер пула заодно ограничивает число соединений с БД на воркер.
+"""
+from concurrent.futures import ThreadPoolExecutor
+from functools import wraps
+from threading import Lock
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.db import close_old_connections
+from django.urls import URLPattern, URLResolver
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.ASYNC_VIEW_THREADS,
+                thread_name_prefix='async-view',
+            )
+    return _executor
+
+
+def run_view(view, request, *args, **kwargs):
+    """Выполняет вью и рендерит ответ в потоке пула.
+
+    Сигналы request_started и request_finished под ASGI приходят в
+    другом потоке, поэтому устаревшие соединения потока пула закрываются
+    здесь. Потоковый ответ читается целиком: ASGI-обработчик Django 3.2
+    перебирает его в цикле событий, где ORM недоступен.
+    """
+    close_old_connections()
+    try:
+        response = view(request, *args, **kwargs)
+        if hasattr(response, 'render'):
+            response.render()
+        if response.streaming:
+            response.streaming_content = list(response.streaming_content)
+        return response
+    finally:
+        close_old_connections()
+
+
+def async_view(view):
+    """Асинхронная обертка над синхронным вью."""
+
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await sync_to_async(
+            run_view, thread_sensitive=False, executor=get_executor()
+        )(view, request, *args, **kwargs)
+
+    return wrapper
+
+
+def async_patterns(patterns):
+    """Копия списка маршрутов, в которой все вью обернуты async_view."""
+    result = []
+    for pattern in patterns:
+        if isinstance(pattern, URLResolver):
+            result.append(URLResolver(
+                pattern.pattern,
+                async_patterns(pattern.url_patterns),
+                pattern.default_kwargs,
+                pattern.app_name,
+                pattern.namespace,
+            ))
+        else:
+            result.append(URLPattern(
+                pattern.pattern,
+                async_view(pattern.callback),
+                pattern.default_args,
+                pattern.name,
+            ))
+    return result
@@ -0,0 +1,375 @@
+"""Наполнение БД тестовыми данными и замеры основных эндпоинтов API.
+
+Используется командой benchmark и набором pytest-benchmark в
+backend/benchmarks. Замеры идут внутри транзакции, которая затем
+откатывается, поэтому колбэки transaction.on_commit (версии кеша,
+раскладка лент, фоновые задачи) выполняются явно, см. run_on_commit.
+"""
+import random
+import statistics
+from collections import namedtuple
+from contextlib import contextmanager
+from io import StringIO
+from time import perf_counter
+
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS, connection, connections
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from recipes.counters import reconcile_counters
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                            ShoppingCart, Tag)
+from recipes.signals import bump_ingredients_version
+from users.models import Subscription, User
+
+PREFIX = 'bench'
+IMAGE = (
+    'data:image/gif;base64,'
+    'R0lGODlhAQABAIAAAP///wAAACH5BAEAAAAALAAAAAABAAEAAAICRAEAOw=='
+)
+DEFAULT_SIZES = {
+    'users': 50,
+    'recipes': 500,
+    'ingredients_per_recipe': 8,
+    'favorites': 20,
+    'carts': 5,
+    'subscriptions': 10,
+}
+TAGS_COUNT = 3
+INGREDIENTS_COUNT = 300
+BATCH_SIZE = 1000
+
+Dataset = namedtuple('Dataset', 'reader tags ingredients recipes sizes')
+Scenario = namedtuple('Scenario', 'name authenticated request')
+
+
+@contextmanager
+def run_on_commit(using=DEFAULT_DB_ALIAS):
+    """Выполняет колбэки on_commit, отложенные внутри блока.
+
+    Во внешней транзакции они иначе не выполнились бы вовсе. Здесь они
+    выполняются сразу по выходе из блока, как после фиксации в режиме
+    autocommit, вместе с колбэками, которые добавят сами.
+    """
+    db = connections[using]
+    start = len(db.run_on_commit)
+    yield
+    while len(db.run_on_commit) > start:
+        callbacks = db.run_on_commit[start:]
+        del db.run_on_commit[start:]
+        for _, callback in callbacks:
+            callback()
+
+
+def bulk_create(model, objects):
+    model.objects.bulk_create(objects, batch_size=BATCH_SIZE)
+
+
+def sample(rng, population, count):
+    return rng.sample(population, min(count, len(population)))
+
+
+def seed_catalog():
+    """Теги и ингредиенты; уже существующие ингредиенты переиспользуются."""
+    Tag.objects.bulk_create(
+        (
+            Tag(name=f'{PREFIX} {index}', color=f'#BE{index:04X}',
+                slug=f'{PREFIX}-{index}')
+            for index in range(TAGS_COUNT)
+        ),
+        ignore_conflicts=True,
+    )
+    if Ingredient.objects.count() < INGREDIENTS_COUNT:
+        Ingredient.objects.bulk_create(
+            (
+                Ingredient(name=f'{PREFIX} ингредиент {index}',
+                           measurement_unit='г')
+                for index in range(INGREDIENTS_COUNT)
+            ),
+            batch_size=BATCH_SIZE,
+            ignore_conflicts=True,
+        )
+    tags = list(Tag.objects.filter(slug__startswith=f'{PREFIX}-'))
+    ingredients = list(
+        Ingredient.objects.values_list('id', flat=True)[:INGREDIENTS_COUNT]
+    )
+    return tags, ingredients
+
+
+def seed_recipes(rng, users, tags, ingredients, sizes):
+    bulk_create(Recipe, [
+        Recipe(
+            author_id=users[index % len(users)],
+            name=f'{PREFIX} рецепт {index}',
+            text='Текст рецепта',
+            image='recipes/bench.png',
+            cooking_time=rng.randint(1, 120),
+        )
+        for index in range(sizes['recipes'])
+    ])
+    recipes = list(
+        Recipe.objects.filter(
+            name__startswith=f'{PREFIX} рецепт'
+        ).values_list('id', flat=True)
+    )
+    bulk_create(Recipe.tags.through, [
+        Recipe.tags.through(recipe_id=recipe, tag_id=tag.id)
+        for recipe in recipes
+        for tag in sample(rng, tags, rng.randint(1, 2))
+    ])
+    bulk_create(IngredientInRecipe, [
+        IngredientInRecipe(
+            recipe_id=recipe, ingredient_id=ingredient,
+            amount=rng.randint(1, 50),
+        )
+        for recipe in recipes
+        for ingredient in sample(
+            rng, ingredients, sizes['ingredients_per_recipe']
+        )
+    ])
+    return recipes
+
+
+def seed_relations(rng, users, recipes, sizes):
+    bulk_create(Favorite, [
+        Favorite(user_id=user, recipe_id=recipe)
+        for user in users
+        for recipe in sample(rng, recipes, sizes['favorites'])
+    ])
+    bulk_create(ShoppingCart, [
+        ShoppingCart(user_id=user, recipe_id=recipe)
+        for user in users
+        for recipe in sample(rng, recipes, sizes['carts'])
+    ])
+    bulk_create(Subscription, [
+        Subscription(user_id=user, author_id=author)
+        for user in users
+        for author in sample(
+            rng, [other for other in users if other != user],
+            sizes['subscriptions'],
+        )
+    ])
+
+
+def seed(random_seed=0, **sizes):
+    """Создает пользователей, рецепты и связи пакетными вставками.
+
+    bulk_create не отправляет сигналы, поэтому счетчики, списки покупок,
+    ленты подписок и версии кеша после вставки пересчитываются явно.
+    """
+    with run_on_commit():
+        return seed_dataset(random_seed, sizes)
+
+
+def seed_dataset(random_seed, sizes):
+    sizes = {**DEFAULT_SIZES, **sizes}
+    rng = random.Random(random_seed)
+    tags, ingredients = seed_catalog()
+    bulk_create(User, [
+        User(
+            username=f'{PREFIX}_user_{index}',
+            email=f'{PREFIX}_user_{index}@example.com',
+            first_name='Бенчмарк', last_name=str(index), password='!',
+        )
+        for index in range(sizes['users'])
+    ])
+    users = list(
+        User.objects.filter(
+            username__startswith=f'{PREFIX}_user_'
+        ).values_list('id', flat=True)
+    )
+    recipes = seed_recipes(rng, users, tags, ingredients, sizes)
+    seed_relations(rng, users, recipes, sizes)
+    reconcile_counters(fix=True)
+    call_command('rebuild_shopping_lists', stdout=StringIO())
+    call_command('rebuild_feeds', stdout=StringIO())
+    bump_ingredients_version()
+    return Dataset(
+        reader=User.objects.get(pk=users[0]),
+        tags=tags,
+        ingredients=ingredients,
+        recipes=recipes,
+        sizes=sizes,
+    )
+
+
+def recipe_payload(dataset, amount=1):
+    return {
+        'name': f'{PREFIX} новый рецепт',
+        'text': 'Текст рецепта',
+        'cooking_time': 10,
+        'image': IMAGE,
+        'tags': [dataset.tags[0].id],
+        'ingredients': [
+            {'id': ingredient, 'amount': amount}
+            for ingredient in dataset.ingredients[
+                :dataset.sizes['ingredients_per_recipe']
+            ]
+        ],
+    }
+
+
+def get_scenarios(dataset):
+    own_recipe = Recipe.objects.filter(author=dataset.reader).first()
+    updates = iter(range(1, 10 ** 9))
+    tag = dataset.tags[0].slug
+    name = Ingredient.objects.get(pk=dataset.ingredients[0]).name[:3]
+    return [
+        Scenario('recipes_list', True, lambda client: client.get(
+            '/api/recipes/'
+        )),
+        Scenario('recipes_list_filtered', True, lambda client: client.get(
+            f'/api/recipes/?tags={tag}&is_favorited=1'
+        )),
+        Scenario('recipes_list_anonymous', False, lambda client: client.get(
+            '/api/recipes/'
+        )),
+        Scenario('recipes_feed', True, lambda client: client.get(
+            '/api/recipes/feed/'
+        )),
+        Scenario('subscriptions', True, lambda client: client.get(
+            '/api/users/subscriptions/?recipes_limit=3'
+        )),
+        Scenario('ingredients_search', False, lambda client: client.get(
+            '/api/ingredients/', {'name': name}
+        )),
+        Scenario('download_shopping_cart', True, lambda client: client.get(
+            '/api/recipes/download_shopping_cart/?format=txt'
+        )),
+        Scenario('recipe_create', True, lambda client: client.post(
+            '/api/recipes/', recipe_payload(dataset), format='json'
+        )),
+        Scenario('recipe_update', True, lambda client: client.patch(
+            f'/api/recipes/{own_recipe.id}/',
+            recipe_payload(dataset, amount=next(updates) % 50 + 1),
+            format='json',
+        )),
+    ]
+
+
+def get_client(dataset, scenario):
+    client = APIClient()
+    if scenario.authenticated:
+        client.force_authenticate(dataset.reader)
+    return client
+
+
+def perform(client, scenario):
+    """Выполняет запрос сценария, дочитывая потоковый ответ.
+
+    Колбэки on_commit запроса входят в его время и число SQL-запросов.
+    """
+    with run_on_commit():
+        response = scenario.request(client)
+    if response.status_code >= 400:
+        raise AssertionError(
+            f'{scenario.name}: статус {response.status_code}'
+        )
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+def measure(dataset, scenario, repeat, warmup=1):
+    """Задержка (мс), число SQL-запросов и пропускная способность."""
+    client = get_client(dataset, scenario)
+    for _ in range(warmup):
+        perform(client, scenario)
+    timings, queries = [], []
+    for _ in range(repeat):
+        with CaptureQueriesContext(connection) as context:
+            started = perf_counter()
+            perform(client, scenario)
+            timings.append(perf_counter() - started)
+        queries.append(len(context))
+    return {
+        'latency_ms': latency_summary(timings),
+        'queries': {'min': min(queries), 'max': max(queries)},
+        'throughput_rps': repeat / sum(timings),
+    }
+
+
+def latency_summary(timings):
+    milliseconds = [timing * 1000 for timing in timings]
+    return {
+        'min': min(milliseconds),
+        'median': statistics.median(milliseconds),
+        'mean': statistics.mean(milliseconds),
+        'p95': percentile(milliseconds, 0.95),
+        'max': max(milliseconds),
+    }
+
+
+def connection_modes():
+    """Настройки соединения для замера: новое, постоянное, из пула.
+
+    Пул есть только у бэкенда foodgram.backends.postgresql.
+    """
+    modes = {
+        'new': {'CONN_MAX_AGE': 0, 'POOL': None},
+        'persistent': {
+            'CONN_MAX_AGE': None, 'POOL': None, 'CONN_HEALTH_CHECKS': True,
+        },
+    }
+    if hasattr(connection, 'pool'):
+        modes['pool'] = {'CONN_MAX_AGE': 0, 'POOL': {'max_size': 1}}
+    return modes
+
+
+def get_connection(mode):
+    """Отдельное от основного соединение с БД в режиме mode."""
+    default = connections[DEFAULT_DB_ALIAS]
+    return type(default)(
+        {**default.settings_dict, **connection_modes()[mode]},
+        f'benchmark-{mode}',
+    )
+
+
+def request_cycle(db):
+    """Работа с соединением за один HTTP-запрос из одного SELECT 1.
+
+    Django проверяет и закрывает соединение по сигналам request_started
+    и request_finished, здесь они вызываются напрямую.
+    """
+    db.close_if_unusable_or_obsolete()
+    with db.cursor() as cursor:
+        cursor.execute('SELECT 1')
+    db.close_if_unusable_or_obsolete()
+
+
+def close_connection(db):
+    db.close()
+    if getattr(db, 'pool', None) is not None:
+        db.pool.close()
+
+
+def measure_connections(repeat, warmup=1):
+    """Задержка (мс) установки соединения на запрос в каждом режиме.
+
+    saved_ms — на сколько медиана режима меньше, чем с новым соединением
+    на каждый запрос (CONN_MAX_AGE=0 без пула).
+    """
+    results = {}
+    for mode in connection_modes():
+        db = get_connection(mode)
+        try:
+            for _ in range(warmup):
+                request_cycle(db)
+            timings = []
+            for _ in range(repeat):
+                started = perf_counter()
+                request_cycle(db)
+                timings.append(perf_counter() - started)
+        finally:
+            close_connection(db)
+        results[mode] = {'latency_ms': latency_summary(timings)}
+    new = results['new']['latency_ms']['median']
+    for result in results.values():
+        result['saved_ms'] = new - result['latency_ms']['median']
+    return results
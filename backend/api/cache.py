@@ -0,0 +1,87 @@
+from hashlib import md5
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework import status
+from rest_framework.response import Response
+
+from recipes.signals import (get_ingredients_version, get_recipes_version,
+                             get_tags_version, get_user_version)
+
+RESPONSE_CACHE_PREFIX = 'api:responses'
+
+
+def normalized_query(request):
+    """Параметры запроса в каноническом виде: порядок не важен."""
+    return '&'.join(
+        f'{key}={value}'
+        for key in sorted(request.query_params)
+        for value in sorted(request.query_params.getlist(key))
+    )
+
+
+class AnonymousResponseCacheMixin:
+    """Кеширует ответы list и retrieve для анонимных пользователей.
+
+    Для анонимов ответ не зависит от пользователя, поэтому ключ состоит из
+    схемы, хоста, пути и нормализованной строки запроса: схема и хост
+    входят в абсолютные ссылки на изображения. В ключ входит поколение данных
+    рецептов: сигналы записи меняют его, и старые ответы больше не
+    читаются, а вытесняются из кеша по таймауту.
+    """
+
+    def get_response_cache_key(self, request):
+        digest = md5(
+            f'{request.scheme}://{request.get_host()}{request.path}'
+            f'?{normalized_query(request)}'.encode()
+        ).hexdigest()
+        return f'{RESPONSE_CACHE_PREFIX}:{get_recipes_version()}:{digest}'
+
+    def cached_response(self, handler, request, *args, **kwargs):
+        if request.user.is_authenticated:
+            return handler(request, *args, **kwargs)
+        key = self.get_response_cache_key(request)
+        data = cache.get(key)
+        if data is not None:
+            return Response(data)
+        response = handler(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.cached_response(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
+
+
+def make_etag(request, *parts):
+    """ETag из версий данных, пути и формата ответа, без обращения к БД."""
+    return md5(
+        ':'.join(
+            (
+                *map(str, parts),
+                request.get_full_path(),
+                request.META.get('HTTP_ACCEPT', ''),
+            )
+        ).encode()
+    ).hexdigest()
+
+
+def tags_etag(request, *args, **kwargs):
+    return make_etag(request, get_tags_version())
+
+
+def ingredients_etag(request, *args, **kwargs):
+    return make_etag(request, get_ingredients_version())
+
+
+def recipe_etag(request, *args, **kwargs):
+    user_version = (
+        get_user_version(request.user.id)
+        if request.user.is_authenticated else ''
+    )
+    return make_etag(request, get_recipes_version(), user_version)
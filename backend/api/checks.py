@@ -0,0 +1,24 @@
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+)
+
+
+@register(Tags.caches, deploy=True)
+def check_shared_cache(app_configs, **kwargs):
+    """Кеш версий данных и ответов API должен быть общим для воркеров."""
+    if settings.CACHES['default']['BACKEND'] not in PROCESS_LOCAL_CACHES:
+        return []
+    return [Warning(
+        'Кеш по умолчанию свой у каждого процесса: изменения в одном '
+        'воркере не сбрасывают кеш ответов, ETag и индекс ингредиентов '
+        'в остальных.',
+        hint=(
+            'Задайте CACHE_BACKEND=django_redis.cache.RedisCache и '
+            'CACHE_LOCATION, как в docker-compose.yml.'
+        ),
+        id='api.W001',
+    )]
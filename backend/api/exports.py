@@ -0,0 +1,90 @@
+import csv
+import os
+from io import BytesIO
+
+from django.conf import settings
+from reportlab.lib.pagesizes import A4
+from reportlab.pdfbase import pdfmetrics
+from reportlab.pdfbase.ttfonts import TTFont
+from reportlab.pdfgen import canvas
+
+TITLE = 'Список покупок'
+CSV_HEADER = ('Ингредиент', 'Количество', 'Единица измерения')
+PDF_FONT_NAME = 'ShoppingCartFont'
+PDF_FONT_SIZE = 12
+PDF_MARGIN = 50
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+def export_txt(items):
+    yield f'{TITLE}:\n--------------\n'
+    for index, item in enumerate(items, start=1):
+        yield (
+            f'{index}. {item["name"]} - {item["amount"]} '
+            f'{item["measurement_unit"]}.\n'
+        )
+
+
+class Echo:
+    """Файлоподобный объект, который возвращает записанную строку."""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(items):
+    writer = csv.writer(Echo())
+    yield '\ufeff' + writer.writerow(CSV_HEADER)
+    for item in items:
+        yield writer.writerow(
+            (item['name'], item['amount'], item['measurement_unit'])
+        )
+
+
+def get_pdf_font():
+    if PDF_FONT_NAME in pdfmetrics.getRegisteredFontNames():
+        return PDF_FONT_NAME
+    if not os.path.exists(settings.PDF_FONT_PATH):
+        return 'Helvetica'
+    pdfmetrics.registerFont(TTFont(PDF_FONT_NAME, settings.PDF_FONT_PATH))
+    return PDF_FONT_NAME
+
+
+def export_pdf(items):
+    """Выгрузка в PDF.
+
+    reportlab собирает документ целиком, поэтому здесь потоково отдаются
+    только готовые байты, а память растет с размером списка.
+    """
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    font = get_pdf_font()
+    _, height = A4
+    line_height = PDF_FONT_SIZE * 1.5
+    y = height - PDF_MARGIN
+    pdf.setFont(font, PDF_FONT_SIZE + 4)
+    pdf.drawString(PDF_MARGIN, y, TITLE)
+    y -= line_height * 2
+    pdf.setFont(font, PDF_FONT_SIZE)
+    for index, item in enumerate(items, start=1):
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        pdf.drawString(
+            PDF_MARGIN, y,
+            f'{index}. {item["name"]} - {item["amount"]} '
+            f'{item["measurement_unit"]}.',
+        )
+        y -= line_height
+    pdf.save()
+    buffer.seek(0)
+    while chunk := buffer.read(PDF_CHUNK_SIZE):
+        yield chunk
+
+
+EXPORTS = {
+    'txt': export_txt,
+    'csv': export_csv,
+    'pdf': export_pdf,
+}
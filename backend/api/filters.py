@@ -1,7 +1,12 @@
-from django.db.models import Case, IntegerField, Q, When
+from threading import Lock
+
+from django import forms
+from django.db.models import Exists, OuterRef
 from django_filters.rest_framework import CharFilter, FilterSet, filters
 
-from recipes.models import Ingredient, Recipe, Tag
+from recipes.models import Favorite, Ingredient, Recipe, ShoppingCart, Tag
+from recipes.signals import get_tags_version
+from .search import search_ingredients
 
 
 class IngredientSearchFilter(FilterSet):
@@ -15,37 +20,62 @@ class IngredientSearchFilter(FilterSet):
 
     @staticmethod
     def name_filter(queryset, name, value):
-        return (
-            queryset.filter(**{f'{name}__icontains': value})
-            .annotate(
-                order=Case(
-                    When(
-                        Q(**{f'{name}__istartswith': value}),
-                        then=1,
-                    ),
-                    When(
-                        Q(**{f'{name}__icontains': value})
-                        & ~Q(**{f'{name}__istartswith': value}),
-                        then=2,
-                    ),
-                    output_field=IntegerField(),
-                )
-            )
-            .order_by('order')
-        )
+        return search_ingredients(queryset, name, value)
+
+
+class TagSlugCache:
+    """Соответствие slug -> id тегов в памяти процесса.
+
+    Перечитывается из БД, когда меняется версия тегов (см.
+    recipes.signals), поэтому фильтр по тегам не обращается к таблице
+    тегов на каждый запрос.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.ids = {}
+        self.lock = Lock()
+
+    def refresh(self):
+        version = get_tags_version()
+        if version != self.version:
+            with self.lock:
+                if version != self.version:
+                    self.ids = dict(Tag.objects.values_list('slug', 'id'))
+                    self.version = version
+
+    def resolve(self, slugs):
+        """id известных тегов, неизвестные slug пропускаются."""
+        self.refresh()
+        return [self.ids[slug] for slug in slugs if slug in self.ids]
+
+
+tag_slugs = TagSlugCache()
+
+
+class SlugListField(forms.Field):
+    """Список значений из повторяющегося параметра: ?tags=a&tags=b."""
+
+    widget = forms.SelectMultiple
+
+    def to_python(self, value):
+        return [slug for slug in value or () if slug]
+
+
+class SlugListFilter(filters.Filter):
+    field_class = SlugListField
 
 
 class RecipeFilter(FilterSet):
-    """Фильтр рецептов."""
+    """Фильтр рецептов.
 
-    author = filters.AllValuesFilter(
-        field_name='author'
-    )
-    tags = filters.ModelMultipleChoiceFilter(
-        field_name='tags__slug',
-        queryset=Tag.objects.all(),
-        to_field_name='slug',
-    )
+    Теги, избранное и корзина проверяются подзапросами EXISTS, а не
+    JOIN, поэтому рецепт попадает в выдачу один раз, сколько бы тегов
+    ни совпало, и DISTINCT не нужен.
+    """
+
+    author = filters.NumberFilter(field_name='author')
+    tags = SlugListFilter(method='filter_tags')
     is_favorited = filters.BooleanFilter(
         field_name='favorites',
         method='_choice_filter',
@@ -54,12 +84,35 @@ class RecipeFilter(FilterSet):
         field_name='shoppingcart',
         method='_choice_filter',
     )
+    relation_models = {'favorites': Favorite, 'shoppingcart': ShoppingCart}
 
     class Meta:
         model = Recipe
         fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
 
+    @staticmethod
+    def filter_tags(queryset, name, slugs):
+        tag_ids = tag_slugs.resolve(slugs)
+        if not tag_ids:
+            return queryset.none()
+        return queryset.filter(
+            Exists(
+                Recipe.tags.through.objects.filter(
+                    recipe=OuterRef('pk'), tag_id__in=tag_ids
+                )
+            )
+        )
+
     def _choice_filter(self, queryset, key, value):
-        if value:
-            return queryset.filter(**{f'{key}__user': self.request.user})
-        return queryset
+        if not value:
+            return queryset
+        user = self.request.user
+        if not user.is_authenticated:
+            return queryset.none()
+        return queryset.filter(
+            Exists(
+                self.relation_models[key].objects.filter(
+                    user=user, recipe=OuterRef('pk')
+                )
+            )
+        )
@@ -0,0 +1,98 @@
+import json
+from datetime import datetime, timezone
+from tempfile import TemporaryDirectory
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test.utils import override_settings
+
+from api.benchmark import (DEFAULT_SIZES, get_scenarios, measure,
+                           measure_connections, seed)
+
+
+class Command(BaseCommand):
+    """Замеры основных эндпоинтов API на сгенерированных данных."""
+
+    help = (
+        'Наполняет БД тестовыми данными, замеряет задержку, число '
+        'SQL-запросов и пропускную способность эндпоинтов и выводит '
+        'JSON-отчет. Отдельно замеряет цену соединения с БД на запрос: '
+        'новое, постоянное и из пула. Все изменения откатываются по '
+        'завершении, колбэки on_commit выполняются после каждого запроса '
+        'и входят в его замер.'
+    )
+
+    def add_arguments(self, parser):
+        for name, default in DEFAULT_SIZES.items():
+            parser.add_argument(
+                f'--{name.replace("_", "-")}', type=int, default=default,
+            )
+        parser.add_argument('--repeat', type=int, default=20)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument(
+            '--scenario', action='append',
+            help='Замерить только указанные сценарии.',
+        )
+        parser.add_argument(
+            '--label', default='',
+            help='Метка отчета, например хеш коммита.',
+        )
+        parser.add_argument(
+            '--output', default='-', help='Файл отчета, "-" для stdout.',
+        )
+
+    def handle(self, *args, **options):
+        sizes = {name: options[name] for name in DEFAULT_SIZES}
+        with TemporaryDirectory() as media, override_settings(
+            CACHES={'default': {
+                'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+                'LOCATION': 'benchmark',
+            }},
+            MEDIA_ROOT=media,
+            ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver'],
+            BACKGROUND_TASKS_ASYNC=False,
+            METRICS_ENABLED=False,
+        ):
+            with transaction.atomic():
+                report = self.run(sizes, options)
+                transaction.set_rollback(True)
+        data = json.dumps(report, ensure_ascii=False, indent=2)
+        if options['output'] == '-':
+            self.stdout.write(data)
+        else:
+            with open(options['output'], 'w', encoding='utf-8') as file:
+                file.write(data + '\n')
+
+    def run(self, sizes, options):
+        dataset = seed(random_seed=options['seed'], **sizes)
+        scenarios = get_scenarios(dataset)
+        if options['scenario']:
+            unknown = set(options['scenario']) - {
+                scenario.name for scenario in scenarios
+            }
+            if unknown:
+                raise CommandError(
+                    f'Неизвестные сценарии: {", ".join(sorted(unknown))}.'
+                )
+            scenarios = [
+                scenario for scenario in scenarios
+                if scenario.name in options['scenario']
+            ]
+        results = {}
+        for scenario in scenarios:
+            self.stderr.write(f'{scenario.name}...')
+            results[scenario.name] = measure(
+                dataset, scenario, options['repeat']
+            )
+        self.stderr.write('connections...')
+        connections = measure_connections(options['repeat'])
+        return {
+            'label': options['label'],
+            'created': datetime.now(timezone.utc).isoformat(),
+            'database': connection.vendor,
+            'sizes': sizes,
+            'repeat': options['repeat'],
+            'scenarios': results,
+            'connections': connections,
+        }
@@ -0,0 +1,240 @@
+import asyncio
+import logging
+from bisect import bisect_left
+from contextvars import ContextVar
+from threading import Lock
+from time import perf_counter
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.db.backends.signals import connection_created
+
+logger = logging.getLogger(__name__)
+
+_collector = ContextVar('metrics_query_collector', default=None)
+
+LATENCY_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10,
+)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89, 144)
+
+
+def escape_label(value):
+    return (
+        str(value).replace('\\', r'\\').replace('"', r'\"')
+        .replace('\n', r'\n')
+    )
+
+
+class Histogram:
+    """Гистограмма в памяти процесса в формате Prometheus.
+
+    У каждого воркера gunicorn свои значения, Prometheus собирает их с
+    каждого процесса отдельно или суммирует при агрегации.
+    """
+
+    def __init__(self, name, documentation, buckets):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = buckets
+        self.series = {}
+        self.lock = Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            counts, count, total = self.series.get(
+                labels, ([0] * len(self.buckets), 0, 0)
+            )
+            index = bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                counts[index] += 1
+            self.series[labels] = (counts, count + 1, total + value)
+
+    def render(self):
+        lines = [
+            f'# HELP {self.name} {self.documentation}',
+            f'# TYPE {self.name} histogram',
+        ]
+        with self.lock:
+            series = sorted(self.series.items())
+        for labels, (counts, count, total) in series:
+            label_text = ','.join(
+                f'{key}="{escape_label(value)}"' for key, value in labels
+            )
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                lines.append(
+                    f'{self.name}_bucket{{{label_text},le="{bound}"}} '
+                    f'{cumulative}'
+                )
+            lines.append(
+                f'{self.name}_bucket{{{label_text},le="+Inf"}} {count}'
+            )
+            lines.append(f'{self.name}_sum{{{label_text}}} {total}')
+            lines.append(f'{self.name}_count{{{label_text}}} {count}')
+        return '\n'.join(lines)
+
+    def clear(self):
+        with self.lock:
+            self.series.clear()
+
+
+REQUEST_DURATION = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Полное время обработки запроса.',
+    LATENCY_BUCKETS,
+)
+DB_QUERIES = Histogram(
+    'foodgram_http_request_db_queries',
+    'Число SQL-запросов на один HTTP-запрос.',
+    QUERY_COUNT_BUCKETS,
+)
+DB_DURATION = Histogram(
+    'foodgram_http_request_db_duration_seconds',
+    'Суммарное время SQL-запросов на один HTTP-запрос.',
+    LATENCY_BUCKETS,
+)
+SERIALIZATION_DURATION = Histogram(
+    'foodgram_http_request_serialization_duration_seconds',
+    'Время во вью и рендерере без учета SQL: сериализация и рендеринг.',
+    LATENCY_BUCKETS,
+)
+HISTOGRAMS = (
+    REQUEST_DURATION, DB_QUERIES, DB_DURATION, SERIALIZATION_DURATION,
+)
+
+
+def render_metrics():
+    return '\n'.join(histogram.render() for histogram in HISTOGRAMS) + '\n'
+
+
+class QueryCollector:
+    """execute_wrapper, считающий запросы и их время на всех БД."""
+
+    def __init__(self, sql_limit):
+        self.count = 0
+        self.duration = 0
+        self.sql_limit = sql_limit
+        self.statements = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            elapsed = perf_counter() - started
+            self.count += 1
+            self.duration += elapsed
+            if len(self.statements) < self.sql_limit:
+                self.statements.append((elapsed, sql))
+
+
+def collect_query(execute, sql, params, many, context):
+    """execute_wrapper всех соединений: передает запрос сборщику запроса.
+
+    Сборщик хранится в ContextVar, который asgiref копирует в потоки
+    sync_to_async, поэтому запросы учитываются и тогда, когда вью под
+    ASGI выполняется в пуле api.asyncviews, а не в потоке middleware.
+    """
+    collector = _collector.get()
+    if collector is None:
+        return execute(sql, params, many, context)
+    return collector(execute, sql, params, many, context)
+
+
+def install_query_collector(connection, **kwargs):
+    if collect_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(collect_query)
+
+
+class InstrumentationMiddleware:
+    """Собирает по каждому вью число запросов, время БД и задержку.
+
+    Включается настройкой METRICS_ENABLED. Медленные запросы (дольше
+    METRICS_SLOW_REQUEST_SECONDS) пишутся в лог вместе с их SQL. Под
+    ASGI работает асинхронно: синхронный middleware первым в цепочке
+    заставил бы Django выполнять все запросы в одном потоке.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.is_async = asyncio.iscoroutinefunction(get_response)
+        if self.is_async:
+            # Как в MiddlewareMixin: Django считает экземпляр корутинной
+            # функцией и не оборачивает его в sync_to_async.
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+            self.process_view = self.process_view_async
+        connection_created.connect(
+            install_query_collector, dispatch_uid='api.metrics'
+        )
+        for connection in connections.all():
+            install_query_collector(connection)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        collector, token, started = self.start(request)
+        try:
+            response = self.get_response(request)
+        finally:
+            _collector.reset(token)
+        self.record(request, response, collector, perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        collector, token, started = self.start(request)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _collector.reset(token)
+        self.record(request, response, collector, perf_counter() - started)
+        return response
+
+    def start(self, request):
+        collector = QueryCollector(settings.METRICS_SLOW_SQL_LIMIT)
+        request._metrics_view_started = None
+        return collector, _collector.set(collector), perf_counter()
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._metrics_view_started = perf_counter()
+
+    async def process_view_async(self, request, view_func, view_args,
+                                 view_kwargs):
+        request._metrics_view_started = perf_counter()
+
+    def record(self, request, response, collector, duration):
+        match = request.resolver_match
+        labels = (
+            ('view', match.view_name if match else '<unresolved>'),
+            ('method', request.method),
+        )
+        REQUEST_DURATION.observe(labels, duration)
+        DB_QUERIES.observe(labels, collector.count)
+        DB_DURATION.observe(labels, collector.duration)
+        if request._metrics_view_started is not None:
+            SERIALIZATION_DURATION.observe(
+                labels,
+                max(
+                    perf_counter() - request._metrics_view_started
+                    - collector.duration,
+                    0,
+                ),
+            )
+        if duration >= settings.METRICS_SLOW_REQUEST_SECONDS:
+            logger.warning(
+                'Медленный запрос %s %s: %.3f с, %d SQL-запросов '
+                '(%.3f с), статус %s\n%s',
+                request.method, request.get_full_path(), duration,
+                collector.count, collector.duration, response.status_code,
+                '\n'.join(
+                    f'{elapsed:.4f} {sql}'
+                    for elapsed, sql in collector.statements
+                ),
+            )
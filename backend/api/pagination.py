@@ -1,7 +1,216 @@
-from rest_framework.pagination import PageNumberPagination
+from base64 import urlsafe_b64decode, urlsafe_b64encode
+from binascii import Error as DecodeError
+from heapq import merge
+from itertools import islice
+import json
+
+from django.db import connections
+from django.db.models import Q
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
 
 
 class LimitPageNumberPagination(PageNumberPagination):
     page_size = 6
     page_size_query_param = 'limit'
     page_query_param = 'page'
+
+
+def estimate_count(queryset):
+    """Оценка числа строк по плану запроса PostgreSQL, без COUNT(*)."""
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.order_by().query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        plan = cursor.fetchone()[0]
+    if isinstance(plan, str):
+        plan = json.loads(plan)
+    return plan[0]['Plan']['Plan Rows']
+
+
+class KeysetPagination(BasePagination):
+    """Пагинация по ключу сортировки (keyset).
+
+    Следующая страница выбирается условием по последней строке текущей,
+    а не OFFSET, поэтому глубокие страницы не медленнее первых, а
+    отдельный COUNT(*) не выполняется. Сортировка берется из
+    view.keyset_ordering и должна быть уникальной, например
+    ('-pub_date', '-id'); сортировка клиента (?ordering=) с курсором
+    несовместима и отклоняется. Оценка числа строк по плану запроса
+    выдается в count только по ?count=true, иначе count равен null.
+    """
+
+    page_size = LimitPageNumberPagination.page_size
+    page_size_query_param = LimitPageNumberPagination.page_size_query_param
+    cursor_query_param = 'cursor'
+    count_query_param = 'count'
+    ordering = ('-pub_date', '-id')
+    invalid_cursor_message = 'Некорректный курсор.'
+    ordering_message = (
+        'Сортировка не поддерживается вместе с курсором, используйте '
+        'постраничную пагинацию (?page=).'
+    )
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return page_size if page_size > 0 else self.page_size
+
+    def get_ordering(self, view):
+        return getattr(view, 'keyset_ordering', self.ordering)
+
+    def encode_cursor(self, values):
+        return urlsafe_b64encode(json.dumps(values).encode()).decode()
+
+    def decode_cursor(self, request, fields):
+        cursor = request.query_params.get(self.cursor_query_param)
+        if not cursor:
+            return None
+        try:
+            values = json.loads(urlsafe_b64decode(cursor.encode()))
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                field.to_python(value) for field, value in zip(fields, values)
+            ]
+        except (DecodeError, ValueError, TypeError, UnicodeDecodeError):
+            raise NotFound(self.invalid_cursor_message)
+
+    @staticmethod
+    def after(ordering, values):
+        """Условие «строго после values» в лексикографическом порядке.
+
+        Дизъюнкция по ключам дополнена нестрогой границей по первому
+        ключу, иначе PostgreSQL не может использовать ее как диапазон
+        индекса и читает его с начала.
+        """
+        condition = Q()
+        for index, name in enumerate(ordering):
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            step = Q(**{f'{name.lstrip("-")}__{lookup}': values[index]})
+            for previous, value in zip(ordering[:index], values):
+                step &= Q(**{previous.lstrip('-'): value})
+            condition |= step
+        first = ordering[0]
+        bound = 'lte' if first.startswith('-') else 'gte'
+        return Q(**{f'{first.lstrip("-")}__{bound}': values[0]}) & condition
+
+    def check_ordering(self, request):
+        if request.query_params.get(api_settings.ORDERING_PARAM):
+            raise ValidationError(
+                {api_settings.ORDERING_PARAM: [self.ordering_message]}
+            )
+
+    def include_count(self, request):
+        return request.query_params.get(
+            self.count_query_param, ''
+        ).lower() in ('1', 'true')
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.check_ordering(request)
+        ordering = self.get_ordering(view)
+        fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in ordering
+        ]
+        queryset = queryset.order_by(*ordering)
+        self.count = (
+            estimate_count(queryset) if self.include_count(request) else None
+        )
+        values = self.decode_cursor(request, fields)
+        if values is not None:
+            queryset = queryset.filter(self.after(ordering, values))
+        page_size = self.get_page_size(request)
+        page = list(queryset[:page_size + 1])
+        self.next_values = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            self.next_values = [
+                field.value_to_string(page[-1]) for field in fields
+            ]
+        return page
+
+    def get_next_link(self):
+        if self.next_values is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_values),
+        )
+
+    def get_paginated_response(self, data):
+        return Response({
+            'count': self.count,
+            'next': self.get_next_link(),
+            'results': data,
+        })
+
+
+class FeedPagination(KeysetPagination):
+    """Keyset-пагинация по нескольким источникам с общим ключом.
+
+    Источник - queryset и сортировка по убыванию, values_list по которой
+    дает ключ (дата, id рецепта). С каждого источника по его индексу
+    берется не больше страницы ключей после курсора, ключи сливаются, и
+    рецепты страницы выбираются из queryset по id.
+    """
+
+    def paginate_sources(self, sources, queryset, request):
+        self.request = request
+        self.check_ordering(request)
+        fields = [
+            queryset.model._meta.get_field(name.lstrip('-'))
+            for name in self.ordering
+        ]
+        self.count = None
+        if self.include_count(request):
+            counts = [estimate_count(source) for source, _ in sources]
+            if None not in counts:
+                self.count = sum(counts)
+        values = self.decode_cursor(request, fields)
+        page_size = self.get_page_size(request)
+        keys = []
+        for source, ordering in sources:
+            source = source.order_by(*ordering)
+            if values is not None:
+                source = source.filter(self.after(ordering, values))
+            keys.append(source.values_list(
+                *(name.lstrip('-') for name in ordering)
+            )[:page_size + 1])
+        page = list(islice(merge(*keys, reverse=True), page_size + 1))
+        self.next_values = None
+        if len(page) > page_size:
+            page = page[:page_size]
+            last = queryset.model(**{
+                field.attname: value for field, value in zip(fields, page[-1])
+            })
+            self.next_values = [
+                field.value_to_string(last) for field in fields
+            ]
+        recipes = queryset.in_bulk([pk for _, pk in page])
+        return [recipes[pk] for _, pk in page if pk in recipes]
+
+
+class KeysetPaginationMixin:
+    """Включает KeysetPagination, если в запросе передан ?cursor=."""
+
+    keyset_pagination_class = KeysetPagination
+
+    @property
+    def paginator(self):
+        if not hasattr(self, '_paginator'):
+            cursor_query_param = (
+                self.keyset_pagination_class.cursor_query_param
+            )
+            if cursor_query_param in self.request.query_params:
+                self._paginator = self.keyset_pagination_class()
+        return super().paginator
@@ -0,0 +1,68 @@
+import json
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler
+from django.http.multipartparser import MultiPartParserError
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import DataAndFiles, MultiPartParser
+
+
+class UploadTooLarge(MultiPartParserError):
+    pass
+
+
+class ImageUploadLimitHandler(FileUploadHandler):
+    """Обрывает разбор multipart-запроса, как только лимит превышен.
+
+    Длина тела проверяется до чтения, размер файла - по мере поступления
+    данных, так что слишком большой файл не дочитывается до конца.
+    Сами данные передаются следующим обработчикам (память или временный
+    файл).
+    """
+
+    def handle_raw_input(self, input_data, META, content_length, boundary,
+                         encoding=None):
+        if settings.DATA_UPLOAD_MAX_MEMORY_SIZE is None:
+            return
+        limit = (
+            settings.RECIPE_IMAGE_MAX_SIZE
+            + settings.DATA_UPLOAD_MAX_MEMORY_SIZE
+        )
+        if content_length > limit:
+            raise UploadTooLarge(
+                f'Размер запроса превышает {limit} байт.'
+            )
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.RECIPE_IMAGE_MAX_SIZE:
+            raise UploadTooLarge(
+                f'Размер файла превышает '
+                f'{settings.RECIPE_IMAGE_MAX_SIZE} байт.'
+            )
+        return raw_data
+
+    def file_complete(self, file_size):
+        return None
+
+
+class MultiPartJSONParser(MultiPartParser):
+    """multipart/form-data, в котором вложенные поля переданы JSON-строкой.
+
+    Поля перечисляются во view.multipart_json_fields, например
+    ingredients='[{"id": 1, "amount": 10}]' и tags='[1, 2]'.
+    """
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        parsed = super().parse(stream, media_type, parser_context)
+        view = (parser_context or {}).get('view')
+        json_fields = getattr(view, 'multipart_json_fields', ())
+        data = {}
+        for key in parsed.data:
+            value = parsed.data[key]
+            if key in json_fields:
+                try:
+                    value = json.loads(value)
+                except ValueError:
+                    raise ParseError(f'Поле {key} должно содержать JSON.')
+            data[key] = value
+        return DataAndFiles(data, parsed.files.dict())
@@ -0,0 +1,45 @@
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ShoppingCartRenderer(BaseRenderer):
+    """Рендерер выгрузки списка покупок.
+
+    Сам файл формирует вью, рендерер нужен DRF для согласования формата
+    по параметру ?format=. Через него проходят только ответы с ошибками,
+    они отдаются как JSON.
+    """
+
+    charset = None
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return JSONRenderer().render(data)
+
+
+class PlainTextRenderer(ShoppingCartRenderer):
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+
+class CSVRenderer(ShoppingCartRenderer):
+    media_type = 'text/csv'
+    format = 'csv'
+    charset = 'utf-8'
+
+
+class PDFRenderer(ShoppingCartRenderer):
+    media_type = 'application/pdf'
+    format = 'pdf'
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Текстовый формат метрик Prometheus, ошибки отдаются как JSON."""
+
+    media_type = 'text/plain'
+    format = 'prometheus'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if isinstance(data, str):
+            return data.encode(self.charset)
+        return JSONRenderer().render(data)
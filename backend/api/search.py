@@ -0,0 +1,193 @@
+import re
+from bisect import bisect_left
+from threading import Lock
+from unicodedata import normalize as unicode_normalize
+
+from django.contrib.postgres.search import TrigramSimilarity
+from django.db import connections
+from django.db.models import Case, IntegerField, Value, When
+from django.db.models.functions import Lower, Replace
+
+SEARCH_RESULTS_LIMIT = 50
+
+NON_WORD_CHARACTERS = re.compile(r'[\W_]+')
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: нижний регистр, ё -> е."""
+    value = unicode_normalize('NFC', value).casefold().replace('ё', 'е')
+    return ' '.join(value.split())
+
+
+def trigrams(value):
+    """Множество триграмм строки по правилам pg_trgm."""
+    result = set()
+    for word in NON_WORD_CHARACTERS.split(normalize(value)):
+        if word:
+            word = f'  {word} '
+            result.update(
+                word[index:index + 3] for index in range(len(word) - 2)
+            )
+    return result
+
+
+def trigram_similarity(first, second):
+    """Аналог функции similarity() из pg_trgm."""
+    first, second = trigrams(first), trigrams(second)
+    if not first or not second:
+        return 0.0
+    return len(first & second) / len(first | second)
+
+
+def rank_key(name, value):
+    """Ключ сортировки: сначала совпадения по началу, затем по сходству.
+
+    Ожидает уже нормализованные строки.
+    """
+    return (
+        not name.startswith(value),
+        -trigram_similarity(name, value),
+        name,
+    )
+
+
+def normalized_field(field):
+    """SQL-аналог normalize() для поля: нижний регистр, ё -> е.
+
+    Выражение совпадает с выражением триграммного индекса
+    recipes_ingredient_search_trgm (миграция 0010).
+    """
+    return Replace(Lower(field), Value('ё'), Value('е'))
+
+
+def trigram_search(queryset, field, value, limit=SEARCH_RESULTS_LIMIT):
+    """Поиск в PostgreSQL по нормализованному полю через pg_trgm."""
+    value = normalize(value)
+    return (
+        queryset.annotate(search_key=normalized_field(field))
+        .filter(search_key__contains=value)
+        .annotate(
+            order=Case(
+                When(search_key__startswith=value, then=1),
+                default=2,
+                output_field=IntegerField(),
+            ),
+            similarity=TrigramSimilarity('search_key', value),
+        )
+        .order_by('order', '-similarity', field)[:limit]
+    )
+
+
+def is_postgresql(queryset):
+    return connections[queryset.db].vendor == 'postgresql'
+
+
+def search_ingredients(queryset, field, value, limit=SEARCH_RESULTS_LIMIT):
+    """Поиск ингредиентов по подстроке с ранжированием результатов.
+
+    В PostgreSQL поиск идет по GIN-индексу pg_trgm, в остальных СУБД
+    (SQLite в тестах) кандидаты ранжируются в памяти процесса. В обоих
+    случаях строки сравниваются после normalize(), как в IngredientIndex.
+    """
+    if is_postgresql(queryset):
+        return trigram_search(queryset, field, value, limit)
+    value = normalize(value)
+    candidates = [
+        (pk, name) for pk, name in queryset.values_list('pk', field)
+        if value in normalize(name)
+    ]
+    candidates.sort(
+        key=lambda candidate: rank_key(normalize(candidate[1]), value)
+    )
+    ids = [pk for pk, _ in candidates[:limit]]
+    if not ids:
+        return queryset.none()
+    return queryset.filter(pk__in=ids).order_by(
+        Case(
+            *[When(pk=pk, then=Value(index)) for index, pk in enumerate(ids)],
+            output_field=IntegerField(),
+        )
+    )
+
+
+class IngredientIndex:
+    """Индекс справочника ингредиентов в памяти процесса.
+
+    Хранит отсортированный массив нормализованных названий. Строится
+    лениво при первом обращении и перестраивается, когда меняется версия
+    справочника (см. recipes.signals), поэтому каждый воркер gunicorn
+    подхватывает изменения при следующем запросе.
+    """
+
+    def __init__(self):
+        self.version = None
+        self.ingredients = []
+        self.keys = []
+        self.positions = []
+        self.lock = Lock()
+
+    def build(self, version):
+        from recipes.models import Ingredient
+
+        ingredients = list(
+            Ingredient.objects.order_by('name', 'id').values(
+                'id', 'name', 'measurement_unit'
+            )
+        )
+        entries = sorted(
+            (normalize(ingredient['name']), position)
+            for position, ingredient in enumerate(ingredients)
+        )
+        self.ingredients = ingredients
+        self.keys = [key for key, _ in entries]
+        self.positions = [position for _, position in entries]
+        self.version = version
+
+    def refresh(self, wait=True):
+        """Перестраивает индекс, если изменилась версия справочника.
+
+        С wait=False не ждет, пока индекс перестраивает другой поток, и
+        возвращает False: индекс холодный или устарел.
+        """
+        from recipes.signals import get_ingredients_version
+
+        version = get_ingredients_version()
+        if version == self.version:
+            return True
+        if not self.lock.acquire(blocking=wait):
+            return False
+        try:
+            if version != self.version:
+                self.build(version)
+        finally:
+            self.lock.release()
+        return True
+
+    def all(self):
+        self.refresh()
+        return self.ingredients
+
+    def search(self, value, limit=SEARCH_RESULTS_LIMIT):
+        """Совпадения по началу названия, затем по подстроке."""
+        self.refresh()
+        value = normalize(value)
+        if not value:
+            return self.ingredients
+        keys, positions = self.keys, self.positions
+        start = bisect_left(keys, value)
+        end = bisect_left(keys, value[:-1] + chr(ord(value[-1]) + 1), start)
+        matches = [
+            (rank_key(keys[index], value), positions[index])
+            for index in range(start, end)
+        ]
+        if len(matches) < limit:
+            matches += [
+                (rank_key(key, value), positions[index])
+                for index, key in enumerate(keys)
+                if value in key and not key.startswith(value)
+            ]
+        matches.sort()
+        return [self.ingredients[position] for _, position in matches[:limit]]
+
+
+ingredient_index = IngredientIndex()
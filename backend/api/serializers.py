@@ -1,15 +1,107 @@
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import UploadedFile
 from django.db import transaction
 from django.shortcuts import get_object_or_404
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
+from PIL import Image
 from rest_framework import serializers
-from rest_framework.validators import UniqueTogetherValidator
+from rest_framework.settings import api_settings
 
+from recipes.feed import schedule_fan_out
+from recipes.images import schedule_renditions
 from recipes.models import (Ingredient, IngredientInRecipe, Recipe, Tag,
-                            Favorite, ShoppingCart)
+                            ShoppingListItem)
+from recipes.relations import subscribe
 from users.models import Subscription, User
 
 
+class DeferredPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """Поле id, которое не обращается к БД при валидации.
+
+    Возвращает целое число, объекты по всем id сразу подставляет
+    сериализатор (см. RecipePostSerializer.resolve_related).
+    """
+
+    def to_internal_value(self, data):
+        if isinstance(data, bool):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+        try:
+            return int(data)
+        except (TypeError, ValueError):
+            self.fail('incorrect_type', data_type=type(data).__name__)
+
+
+class LimitedImageField(serializers.ImageField):
+    """Изображение с ограничением размера файла и сторон.
+
+    Размеры читаются из заголовка файла до полного декодирования.
+    """
+
+    default_error_messages = {
+        'too_large': 'Размер изображения превышает {max_size} байт.',
+        'too_big': 'Стороны изображения не должны превышать {max_side} px.',
+    }
+
+    def check_size(self, size):
+        if size > settings.RECIPE_IMAGE_MAX_SIZE:
+            self.fail('too_large', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
+
+    def to_internal_value(self, data):
+        self.check_size(data.size)
+        try:
+            with Image.open(data) as image:
+                width, height = image.size
+        except (OSError, Image.DecompressionBombError):
+            self.fail('invalid_image')
+        finally:
+            data.seek(0)
+        if max(width, height) > settings.RECIPE_IMAGE_MAX_DIMENSION:
+            self.fail(
+                'too_big', max_side=settings.RECIPE_IMAGE_MAX_DIMENSION
+            )
+        return super().to_internal_value(data)
+
+
+class RecipeImageField(Base64ImageField, LimitedImageField):
+    """Изображение рецепта: строка base64 или файл из multipart-запроса."""
+
+    def to_internal_value(self, data):
+        if isinstance(data, UploadedFile):
+            return LimitedImageField.to_internal_value(self, data)
+        if isinstance(data, str):
+            self.check_size(len(data) * 3 // 4)
+        return super().to_internal_value(data)
+
+
+class ImageRenditionsField(serializers.Field):
+    """Ссылки на уменьшенные копии изображения рецепта.
+
+    Пока копии не построены, возвращается пустой словарь и клиент
+    показывает исходное изображение.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = 'renditions'
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def to_representation(self, renditions):
+        request = self.context.get('request')
+        return {
+            size: {
+                extension: (
+                    request.build_absolute_uri(default_storage.url(name))
+                    if request else default_storage.url(name)
+                )
+                for extension, name in files.items()
+            }
+            for size, files in renditions.items()
+            if size != 'source'
+        }
+
+
 class SubscriptionsSerializer(serializers.ModelSerializer):
     """Сериализатор для подписок."""
 
@@ -21,23 +113,19 @@ class SubscriptionsSerializer(serializers.ModelSerializer):
         fields = ['user', 'author', 'id']
 
     def validate(self, data):
-        request = self.context.get('request')
-        user = data['user']['id']
-        author = data['author']['id']
-        follow_exist = request.user.follower.all().exists()
-        if user == author:
+        if data['user']['id'] == data['author']['id']:
             raise serializers.ValidationError(
                 [[['Вы не можете подписаться на самого себя']]]
             )
-        elif follow_exist:
-            raise serializers.ValidationError([[['Вы уже подписаны']]])
         return data
 
     def create(self, validated_data):
-        author = validated_data.get('author')
-        author = get_object_or_404(User, pk=author.get('id'))
-        user = User.objects.get(id=validated_data["user"]["id"])
-        user.follower.create(author=author)
+        author = validated_data['author']['id']
+        if not subscribe(validated_data['user']['id'], author):
+            get_object_or_404(User, pk=author)
+            raise serializers.ValidationError(
+                {api_settings.NON_FIELD_ERRORS_KEY: [[['Вы уже подписаны']]]}
+            )
         return validated_data
 
 
@@ -60,6 +148,8 @@ class UserSerializer(UserCreateSerializer):
         model = User
 
     def get_is_subscribed(self, author):
+        if hasattr(author, 'is_subscribed'):
+            return author.is_subscribed
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return request.user.follower.filter(author=author.id).exists()
@@ -103,7 +193,7 @@ class IngredientInRecipeSerializer(serializers.ModelSerializer):
 class AddToIngredientInRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор добавления количества ингредиентов."""
 
-    id = serializers.PrimaryKeyRelatedField(queryset=Ingredient.objects.all())
+    id = DeferredPrimaryKeyRelatedField(queryset=Ingredient.objects.all())
     amount = serializers.IntegerField(write_only=True)
 
     class Meta:
@@ -132,6 +222,7 @@ class RecipeSerializer(serializers.ModelSerializer):
     )
     is_favorited = serializers.SerializerMethodField(read_only=True)
     is_in_shopping_cart = serializers.SerializerMethodField(read_only=True)
+    images = ImageRenditionsField()
 
     class Meta:
         fields = (
@@ -143,18 +234,23 @@ class RecipeSerializer(serializers.ModelSerializer):
             'is_in_shopping_cart',
             'name',
             'image',
+            'images',
             'text',
             'cooking_time',
         )
         model = Recipe
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return request.user.favorites.filter(recipe=obj).exists()
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         request = self.context.get('request')
         if request and request.user.is_authenticated:
             return request.user.shoppingcart.filter(recipe=obj).exists()
@@ -165,13 +261,13 @@ class RecipePostSerializer(serializers.ModelSerializer):
     """Сериализатор создания рецептов."""
 
     author = UserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = DeferredPrimaryKeyRelatedField(
         queryset=Tag.objects.all(), many=True
     )
     ingredients = AddToIngredientInRecipeSerializer(
         source='recipesingredients', many=True
     )
-    image = Base64ImageField(max_length=None, use_url=True)
+    image = RecipeImageField(max_length=None, use_url=True)
 
     class Meta:
         fields = (
@@ -204,6 +300,39 @@ class RecipePostSerializer(serializers.ModelSerializer):
             )
         return ingredients
 
+    @staticmethod
+    def resolve_related(queryset, ids, message, errors, field):
+        """Загружает объекты по id одним запросом.
+
+        Отсутствующие id добавляются в errors[field] одним сообщением.
+        """
+        objects = queryset.in_bulk(set(ids))
+        missing = sorted(set(ids) - objects.keys())
+        if missing:
+            errors[field] = [message.format(', '.join(map(str, missing)))]
+        return objects
+
+    def validate(self, data):
+        errors = {}
+        if 'tags' in data:
+            tags = self.resolve_related(
+                Tag.objects.all(), data['tags'],
+                'Не найдены теги с id: {}.', errors, 'tags',
+            )
+        if 'recipesingredients' in data:
+            ingredients = self.resolve_related(
+                Ingredient.objects.all(),
+                [item['id'] for item in data['recipesingredients']],
+                'Не найдены ингредиенты с id: {}.', errors, 'ingredients',
+            )
+        if errors:
+            raise serializers.ValidationError(errors)
+        if 'tags' in data:
+            data['tags'] = [tags[pk] for pk in data['tags']]
+        for item in data.get('recipesingredients', []):
+            item['id'] = ingredients[item['id']]
+        return data
+
     def add_ingredients_and_tags(self, tags, ingredients, recipe):
         recipe.tags.set(tags)
         instances = [
@@ -217,6 +346,47 @@ class RecipePostSerializer(serializers.ModelSerializer):
         IngredientInRecipe.objects.bulk_create(instances)
         return recipe
 
+    @staticmethod
+    def update_ingredients(recipe, ingredients):
+        """Приводит состав рецепта к ingredients, меняя только разницу.
+
+        Изменившиеся количества обновляются одним bulk_update, удаляются
+        и добавляются только исчезнувшие и новые строки. Возвращает
+        прежний состав {id ингредиента: количество}.
+        """
+        existing = {
+            item.ingredient_id: item
+            for item in recipe.recipesingredients.all()
+        }
+        old_amounts = {
+            ingredient: item.amount for ingredient, item in existing.items()
+        }
+        amounts = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        changed = []
+        for ingredient, amount in amounts.items():
+            item = existing.get(ingredient)
+            if item is not None and item.amount != amount:
+                item.amount = amount
+                changed.append(item)
+        if changed:
+            IngredientInRecipe.objects.bulk_update(changed, ['amount'])
+        removed = old_amounts.keys() - amounts.keys()
+        if removed:
+            recipe.recipesingredients.filter(
+                ingredient_id__in=removed
+            ).delete()
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe=recipe, ingredient_id=ingredient, amount=amount
+            )
+            for ingredient, amount in amounts.items()
+            if ingredient not in existing
+        )
+        return old_amounts, amounts
+
     @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
@@ -225,59 +395,50 @@ class RecipePostSerializer(serializers.ModelSerializer):
         recipe = self.add_ingredients_and_tags(
             tags=tags, ingredients=ingredients, recipe=recipe
         )
+        schedule_renditions(recipe)
+        schedule_fan_out(recipe)
         return recipe
 
     @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('recipesingredients')
-        instance.tags.clear()
-        instance.ingredients.clear()
-        instance = self.add_ingredients_and_tags(tags, ingredients, instance)
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('recipesingredients', None)
+        if tags is not None:
+            instance.tags.set(tags)
+        if ingredients is not None:
+            ShoppingListItem.objects.change_recipe(
+                instance, *self.update_ingredients(instance, ingredients)
+            )
         super().update(instance, validated_data)
+        schedule_renditions(instance)
         return instance
 
 
-class FavoriteSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = Favorite
-        fields = '__all__'
-        read_only_fields = ('__all__',)
-        validators = [
-            UniqueTogetherValidator(
-                queryset=Favorite.objects.all(),
-                fields=('user', 'recipe'),
-                message='Вы уже добавляли это рецепт в избранное.'
-            )
-        ]
+class RecipeIdsSerializer(serializers.Serializer):
+    """Список id рецептов для пакетных операций с избранным и корзиной."""
 
+    recipes = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPES_BATCH_MAX_SIZE,
+    )
 
-class ShoppingCartSerializer(serializers.ModelSerializer):
-    class Meta:
-        model = ShoppingCart
-        fields = '__all__'
-        read_only_fields = ('__all__',)
-        validators = [
-            UniqueTogetherValidator(
-                queryset=ShoppingCart.objects.all(),
-                fields=('user', 'recipe'),
-                message='Этот рецепт уже в списке покупок.'
-            )
-        ]
+    def validate_recipes(self, recipes):
+        return list(dict.fromkeys(recipes))
 
 
 class ShortRecipeResponseSerializer(serializers.ModelSerializer):
+    images = ImageRenditionsField()
 
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'image', 'cooking_time')
+        fields = ('id', 'name', 'image', 'images', 'cooking_time')
         read_only_fields = ('__all__',)
 
 
 class FollowerSerializer(serializers.ModelSerializer):
     is_subscribed = serializers.SerializerMethodField()
-    recipes = RecipeSerializer(many=True)
-    recipes_count = serializers.SerializerMethodField()
+    recipes = ShortRecipeResponseSerializer(many=True, read_only=True)
 
     class Meta:
         model = User
@@ -287,6 +448,3 @@ class FollowerSerializer(serializers.ModelSerializer):
     @staticmethod
     def get_is_subscribed(obj):
         return True
-
-    def get_recipes_count(self, obj):
-        return obj.recipes.count()
@@ -0,0 +1,93 @@
+import asyncio
+from threading import Barrier, current_thread
+from unittest import mock
+
+from django.core.cache import cache
+from django.test import AsyncClient, TransactionTestCase, override_settings
+from rest_framework.authtoken.models import Token
+
+from api import asyncviews
+from api.metrics import DB_QUERIES, HISTOGRAMS
+from recipes.models import Ingredient, ShoppingCart, Tag
+from .test_recipes import RECIPES_URL
+from .utils import make_recipe, make_user
+
+
+@override_settings(ROOT_URLCONF='foodgram.asgi_urls')
+class AsyncViewsTest(TransactionTestCase):
+    """Вью API под ASGI выполняются в пуле потоков api.asyncviews."""
+
+    def setUp(self):
+        cache.clear()
+        self.user = make_user('reader')
+        self.tag = Tag.objects.create(name='Обед', color='#000001',
+                                      slug='lunch')
+        self.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+        self.recipe = make_recipe(
+            self.user, tags=[self.tag], ingredients=[(self.ingredient, 3)]
+        )
+        ShoppingCart.objects.create(user=self.user, recipe=self.recipe)
+        self.token = Token.objects.create(user=self.user).key
+        self.client = AsyncClient()
+
+    async def test_read_endpoints(self):
+        for url, check in (
+            (RECIPES_URL, lambda data: data['count'] == 1),
+            (f'{RECIPES_URL}{self.recipe.id}/',
+             lambda data: data['name'] == 'Рецепт'),
+            ('/api/tags/', lambda data: data[0]['slug'] == 'lunch'),
+            ('/api/ingredients/?name=сол',
+             lambda data: data[0]['name'] == 'Соль'),
+        ):
+            with self.subTest(url=url):
+                response = await self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertTrue(check(response.json()))
+
+    async def test_views_run_in_pool(self):
+        threads = []
+        run_view = asyncviews.run_view
+
+        def record(*args, **kwargs):
+            threads.append(current_thread().name)
+            return run_view(*args, **kwargs)
+
+        with mock.patch.object(asyncviews, 'run_view', record):
+            response = await self.client.get('/api/tags/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(threads), 1)
+        self.assertTrue(threads[0].startswith('async-view'))
+
+    async def test_streaming_download(self):
+        response = await self.client.get(
+            f'{RECIPES_URL}download_shopping_cart/?format=txt',
+            authorization=f'Token {self.token}',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Соль', b''.join(response.streaming_content).decode())
+
+    @override_settings(METRICS_ENABLED=True, METRICS_SLOW_REQUEST_SECONDS=60)
+    async def test_metrics_keep_views_concurrent(self):
+        for histogram in HISTOGRAMS:
+            histogram.clear()
+        barrier = Barrier(2, timeout=5)
+        run_view = asyncviews.run_view
+
+        def wait_for_other(*args, **kwargs):
+            barrier.wait()
+            return run_view(*args, **kwargs)
+
+        with mock.patch.object(asyncviews, 'run_view', wait_for_other):
+            responses = await asyncio.gather(
+                self.client.get('/api/tags/'), self.client.get('/api/tags/')
+            )
+        self.assertEqual(
+            [response.status_code for response in responses], [200, 200]
+        )
+        self.assertIn(
+            'foodgram_http_request_db_queries_sum'
+            '{view="api:tags-list",method="GET"} 2',
+            DB_QUERIES.render(),
+        )
@@ -0,0 +1,225 @@
+import json
+import os
+from io import StringIO
+from tempfile import TemporaryDirectory
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import CommandError, call_command
+from django.db import transaction
+from django.test import TestCase, override_settings
+
+from api.benchmark import run_on_commit
+from recipes.management.commands import load_ingredients
+from recipes.models import (ImportCheckpoint, Ingredient, IngredientInRecipe,
+                            Recipe, Tag)
+from users.models import User
+from .utils import make_recipe, make_user
+
+
+class LoadIngredientsTest(TestCase):
+    """Пакетная загрузка справочника ингредиентов."""
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+
+    def write(self, name, content):
+        path = os.path.join(self.directory.name, name)
+        with open(path, 'w', encoding='utf-8') as file:
+            file.write(content)
+        return path
+
+    def load(self, *args):
+        stdout = StringIO()
+        call_command('load_ingredients', *args, stdout=stdout)
+        return stdout.getvalue()
+
+    def test_json_is_idempotent(self):
+        path = self.write('ingredients.json', json.dumps([
+            {'name': 'мука', 'measurement_unit': 'г'},
+            {'name': 'мука', 'measurement_unit': 'г'},
+            {'name': 'соль', 'measurement_unit': 'г'},
+        ], ensure_ascii=False))
+        self.assertIn('добавлено: 2, пропущено: 1', self.load(path))
+        self.assertIn('добавлено: 0, пропущено: 3', self.load(path))
+        self.assertEqual(Ingredient.objects.count(), 2)
+
+    def test_csv(self):
+        path = self.write('ingredients.csv', 'мука,г\nмолоко,мл\n')
+        self.load(path, '--batch-size', '1')
+        self.assertEqual(
+            set(Ingredient.objects.values_list('name', 'measurement_unit')),
+            {('мука', 'г'), ('молоко', 'мл')},
+        )
+
+    def test_json_is_read_in_chunks(self):
+        items = [
+            {'name': f'ингредиент {index}', 'measurement_unit': 'г'}
+            for index in range(200)
+        ]
+        path = self.write('ingredients.json', json.dumps(items))
+        chunk_size = load_ingredients.READ_CHUNK_SIZE
+        load_ingredients.READ_CHUNK_SIZE = 7
+        self.addCleanup(
+            setattr, load_ingredients, 'READ_CHUNK_SIZE', chunk_size
+        )
+        self.load(path)
+        self.assertEqual(Ingredient.objects.count(), 200)
+
+    def test_broken_file(self):
+        path = self.write('ingredients.json', '[{"name": "мука"')
+        with self.assertRaises(CommandError):
+            self.load(path)
+
+    def test_shipped_data(self):
+        self.load()
+        self.assertEqual(Ingredient.objects.count(), 2188)
+
+
+class RecipeExportImportTest(TestCase):
+    """Выгрузка и загрузка рецептов в формате JSON Lines."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.tag = Tag.objects.create(name='Завтрак', color='#000001',
+                                     slug='breakfast')
+        cls.ingredient = Ingredient.objects.create(name='мука',
+                                                   measurement_unit='г')
+
+    def setUp(self):
+        self.directory = TemporaryDirectory()
+        self.addCleanup(self.directory.cleanup)
+        self.path = os.path.join(self.directory.name, 'recipes.jsonl')
+        for index in range(3):
+            make_recipe(
+                self.author, name=f'Рецепт {index}', tags=[self.tag],
+                ingredients=[(self.ingredient, index + 1)],
+            )
+        call_command('export_recipes', self.path, '--chunk-size', '2',
+                     stderr=StringIO())
+        self.exported = list(
+            Recipe.objects.order_by('id').values_list('name', 'pub_date')
+        )
+        Recipe.objects.all().delete()
+
+    def load(self, *args):
+        call_command('import_recipes', self.path, '--chunk-size', '2',
+                     *args, stdout=StringIO())
+
+    def test_round_trip(self):
+        self.load()
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'name', 'pub_date'
+            )),
+            self.exported,
+        )
+        self.assertEqual(
+            sorted(IngredientInRecipe.objects.values_list(
+                'amount', flat=True
+            )),
+            [1, 2, 3],
+        )
+        self.assertEqual(self.tag.recipes.count(), 3)
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.recipes_count, 3)
+
+    def test_resume_from_checkpoint(self):
+        ImportCheckpoint.objects.create(name=self.path, line_number=2)
+        self.load()
+        self.assertEqual(
+            list(Recipe.objects.values_list('name', flat=True)),
+            ['Рецепт 2'],
+        )
+
+    def test_failed_chunk_is_not_duplicated(self):
+        with open(self.path, encoding='utf-8') as file:
+            lines = file.readlines()
+        broken = json.loads(lines[2])
+        broken['tags'] = ['missing']
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.writelines([*lines[:2], json.dumps(broken) + '\n'])
+        with self.assertRaises(CommandError):
+            self.load()
+        self.assertEqual(
+            ImportCheckpoint.objects.get(name=self.path).line_number, 2
+        )
+        with open(self.path, 'w', encoding='utf-8') as file:
+            file.writelines(lines)
+        self.load()
+        self.assertEqual(
+            sorted(Recipe.objects.values_list('name', flat=True)),
+            ['Рецепт 0', 'Рецепт 1', 'Рецепт 2'],
+        )
+
+    def import_with_media(self, stored):
+        media = os.path.join(self.directory.name, 'media')
+        os.makedirs(os.path.join(media, 'recipes'))
+        with open(os.path.join(media, 'recipes', 'test.png'), 'wb') as file:
+            file.write(b'exported')
+        storage = TemporaryDirectory()
+        self.addCleanup(storage.cleanup)
+        with override_settings(MEDIA_ROOT=storage.name):
+            default_storage.save('recipes/test.png', ContentFile(stored))
+            self.load('--media', media)
+            names = set(Recipe.objects.values_list('image', flat=True))
+            self.assertEqual(len(names), 1)
+            name = names.pop()
+            with default_storage.open(name) as file:
+                self.assertEqual(file.read(), b'exported')
+        return name
+
+    def test_image_with_taken_name_is_saved_aside(self):
+        self.assertNotEqual(
+            self.import_with_media(b'other'), 'recipes/test.png'
+        )
+
+    def test_identical_image_is_reused(self):
+        self.assertEqual(
+            self.import_with_media(b'exported'), 'recipes/test.png'
+        )
+
+    def test_unknown_reference(self):
+        self.tag.delete()
+        with self.assertRaises(CommandError):
+            self.load()
+        self.assertFalse(Recipe.objects.exists())
+
+
+class BenchmarkCommandTest(TestCase):
+    """Команда benchmark выдает отчет и не оставляет данных."""
+
+    def test_on_commit_callbacks_run(self):
+        calls = []
+        with run_on_commit():
+            transaction.on_commit(lambda: (
+                calls.append('request'),
+                transaction.on_commit(lambda: calls.append('task')),
+            ))
+        self.assertEqual(calls, ['request', 'task'])
+
+    def test_report(self):
+        stdout = StringIO()
+        call_command(
+            'benchmark', '--users', '3', '--recipes', '5', '--repeat', '1',
+            '--subscriptions', '1', stdout=stdout, stderr=StringIO(),
+        )
+        report = json.loads(stdout.getvalue())
+        self.assertEqual(report['sizes']['recipes'], 5)
+        self.assertEqual(
+            set(report['scenarios']),
+            {
+                'recipes_list', 'recipes_list_filtered',
+                'recipes_list_anonymous', 'recipes_feed',
+                'subscriptions',
+                'ingredients_search', 'download_shopping_cart',
+                'recipe_create', 'recipe_update',
+            },
+        )
+        self.assertEqual(
+            set(report['connections']), {'new', 'persistent'}
+        )
+        self.assertFalse(User.objects.exists())
+        self.assertFalse(Recipe.objects.exists())
@@ -0,0 +1,84 @@
+from types import SimpleNamespace
+
+from django.test import SimpleTestCase
+from psycopg2.extensions import (TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_INERROR,
+                                 TRANSACTION_STATUS_UNKNOWN)
+
+from foodgram.backends.postgresql.base import ConnectionPool, Database
+
+
+class FakeConnection:
+    """Соединение psycopg2 без сервера: только состояние транзакции."""
+
+    def __init__(self):
+        self.closed = 0
+        self.info = SimpleNamespace(
+            transaction_status=TRANSACTION_STATUS_IDLE
+        )
+        self.rollbacks = 0
+
+    def rollback(self):
+        self.rollbacks += 1
+        self.info.transaction_status = TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = 1
+
+
+class ConnectionPoolTest(SimpleTestCase):
+    """Пул переиспользует соединения и ограничивает их число."""
+
+    def setUp(self):
+        self.pool = ConnectionPool(max_size=2, timeout=0.01)
+        self.created = []
+
+    def connect(self):
+        self.created.append(FakeConnection())
+        return self.created[-1]
+
+    def test_reuses_released_connection(self):
+        connection = self.pool.acquire(self.connect)
+        self.pool.release(connection)
+        self.assertIs(self.pool.acquire(self.connect), connection)
+        self.assertEqual(len(self.created), 1)
+
+    def test_rolls_back_unfinished_transaction(self):
+        connection = self.pool.acquire(self.connect)
+        connection.info.transaction_status = TRANSACTION_STATUS_INERROR
+        self.pool.release(connection)
+        self.assertEqual(connection.rollbacks, 1)
+        self.assertIs(self.pool.acquire(self.connect), connection)
+
+    def test_drops_broken_connection(self):
+        connection = self.pool.acquire(self.connect)
+        connection.info.transaction_status = TRANSACTION_STATUS_UNKNOWN
+        self.pool.release(connection)
+        self.assertTrue(connection.closed)
+        self.assertIsNot(self.pool.acquire(self.connect), connection)
+
+    def test_drops_connection_failing_check(self):
+        connection = self.pool.acquire(self.connect)
+        self.pool.release(connection)
+        self.assertIsNot(
+            self.pool.acquire(self.connect, lambda idle: False), connection
+        )
+        self.assertTrue(connection.closed)
+
+    def test_waits_for_free_slot(self):
+        first = self.pool.acquire(self.connect)
+        self.pool.acquire(self.connect)
+        with self.assertRaises(Database.OperationalError):
+            self.pool.acquire(self.connect)
+        self.pool.release(first)
+        self.assertIs(self.pool.acquire(self.connect), first)
+
+    def test_failed_connect_frees_slot(self):
+        def fail():
+            raise Database.OperationalError
+
+        for _ in range(3):
+            with self.assertRaises(Database.OperationalError):
+                self.pool.acquire(fail)
+        self.pool.acquire(self.connect)
+        self.pool.acquire(self.connect)
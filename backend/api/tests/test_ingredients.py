@@ -0,0 +1,99 @@
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.search import (SEARCH_RESULTS_LIMIT, ingredient_index,
+                        trigram_search, trigram_similarity)
+from recipes.models import Ingredient
+from recipes.signals import bump_ingredients_version
+
+INGREDIENTS_URL = '/api/ingredients/'
+
+
+class IngredientSearchTest(TestCase):
+    """Поиск ингредиентов для автодополнения."""
+
+    @classmethod
+    def setUpTestData(cls):
+        Ingredient.objects.bulk_create(
+            Ingredient(name=name, measurement_unit='г')
+            for name in (
+                'абрикосовое варенье', 'варенье', 'вишневое варенье',
+                'варенье из вишни', 'Сахар', 'мука',
+            )
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def search(self, value):
+        response = self.client.get(INGREDIENTS_URL, {'name': value})
+        self.assertEqual(response.status_code, 200)
+        return [ingredient['name'] for ingredient in response.data]
+
+    def test_prefix_matches_go_first(self):
+        names = self.search('варенье')
+        self.assertEqual(names[:2], ['варенье', 'варенье из вишни'])
+        self.assertEqual(len(names), 4)
+
+    def test_search_is_case_insensitive(self):
+        self.assertEqual(self.search('сах'), ['Сахар'])
+
+    def test_results_are_capped(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.bulk_create(
+                Ingredient(name=f'соль {index}', measurement_unit='г')
+                for index in range(SEARCH_RESULTS_LIMIT + 10)
+            )
+            bump_ingredients_version()
+        self.assertEqual(len(self.search('соль')), SEARCH_RESULTS_LIMIT)
+
+    def test_warm_index_does_not_query_database(self):
+        self.search('мука')
+        with self.assertNumQueries(0):
+            self.assertEqual(self.search('мук'), ['мука'])
+
+    def test_index_is_invalidated_on_save_and_delete(self):
+        self.assertEqual(self.search('соль'), [])
+        with self.captureOnCommitCallbacks(execute=True):
+            salt = Ingredient.objects.create(
+                name='соль', measurement_unit='г'
+            )
+        self.assertEqual(self.search('соль'), ['соль'])
+        with self.captureOnCommitCallbacks(execute=True):
+            salt.delete()
+        self.assertEqual(self.search('соль'), [])
+
+    def test_database_search_when_index_is_disabled(self):
+        expected = self.search('варенье')
+        with override_settings(INGREDIENT_INDEX_ENABLED=False):
+            with self.assertNumQueries(2):
+                self.assertEqual(self.search('варенье'), expected)
+
+    def test_database_search_while_index_is_rebuilt(self):
+        self.search('мука')
+        with self.captureOnCommitCallbacks(execute=True):
+            bump_ingredients_version()
+        with ingredient_index.lock:
+            with self.assertNumQueries(2):
+                self.assertEqual(self.search('мук'), ['мука'])
+
+    def test_yo_is_folded_by_every_backend(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            Ingredient.objects.create(name='Мёд', measurement_unit='г')
+        for enabled in (True, False):
+            with override_settings(INGREDIENT_INDEX_ENABLED=enabled):
+                self.assertEqual(self.search('мед'), ['Мёд'])
+                self.assertEqual(self.search('МЁД'), ['Мёд'])
+
+    def test_trigram_search_compares_normalized_name(self):
+        sql = str(
+            trigram_search(Ingredient.objects.all(), 'name', 'МЁД').query
+        )
+        self.assertIn('REPLACE(LOWER("recipes_ingredient"."name"), ё, е)', sql)
+        self.assertIn('LIKE %мед%', sql)
+
+    def test_trigram_similarity(self):
+        self.assertEqual(trigram_similarity('мука', 'Мука'), 1)
+        self.assertEqual(trigram_similarity('мука', 'сахар'), 0)
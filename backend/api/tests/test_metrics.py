@@ -0,0 +1,51 @@
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from api.metrics import HISTOGRAMS
+from .utils import make_user
+
+METRICS_URL = '/api/_metrics'
+
+
+@override_settings(METRICS_ENABLED=True, METRICS_SLOW_REQUEST_SECONDS=60)
+class MetricsTest(TestCase):
+    """Метрики запросов и их выдача в формате Prometheus."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.admin = make_user('admin', is_staff=True)
+        cls.user = make_user('user')
+
+    def setUp(self):
+        for histogram in HISTOGRAMS:
+            histogram.clear()
+        self.client = APIClient()
+
+    def test_requests_are_recorded(self):
+        self.client.get('/api/tags/')
+        self.client.force_authenticate(self.admin)
+        response = self.client.get(METRICS_URL)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response['Content-Type'].startswith('text/plain'))
+        text = response.content.decode()
+        self.assertIn(
+            'foodgram_http_request_duration_seconds_count'
+            '{view="api:tags-list",method="GET"} 1',
+            text,
+        )
+        self.assertIn(
+            'foodgram_http_request_db_queries_sum'
+            '{view="api:tags-list",method="GET"} 1',
+            text,
+        )
+
+    def test_staff_only(self):
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 401)
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.get(METRICS_URL).status_code, 403)
+
+    @override_settings(METRICS_SLOW_REQUEST_SECONDS=0)
+    def test_slow_requests_are_logged_with_sql(self):
+        with self.assertLogs('api.metrics', 'WARNING') as logs:
+            self.client.get('/api/tags/')
+        self.assertIn('SELECT', logs.output[0])
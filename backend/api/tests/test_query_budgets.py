@@ -0,0 +1,397 @@
+from tempfile import TemporaryDirectory
+
+from django.core.cache import cache
+from django.test import TestCase, override_settings
+from rest_framework.test import APIClient
+
+from recipes.models import (Favorite, FeedItem, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, Tag)
+from users.models import Subscription, User
+from .test_recipes import IMAGE, RECIPES_URL
+from .utils import QueryBudgetMixin, make_recipe, make_user
+
+USERS_URL = '/api/users/'
+
+# Максимальное число SQL-запросов на действие. Увеличивать осознанно:
+# число запросов не должно зависеть от объема выдачи.
+QUERY_BUDGETS = {
+    'recipes-list': 6,
+    'recipes-retrieve': 5,
+    'recipes-create': 13,
+    'recipes-update': 14,
+    'recipes-partial-update': 15,
+    'recipes-destroy': 20,
+    'recipes-favorite': 5,
+    'recipes-delete-favorite': 4,
+    'recipes-shopping-cart': 9,
+    'recipes-delete-shopping-cart': 7,
+    'recipes-download-shopping-cart': 2,
+    'recipes-favorite-batch': 4,
+    'recipes-delete-favorite-batch': 4,
+    'recipes-shopping-cart-batch': 8,
+    'recipes-delete-shopping-cart-batch': 7,
+    'recipes-feed': 6,
+    'users-list': 2,
+    'users-retrieve': 1,
+    'users-me': 0,
+    'users-me-partial-update': 1,
+    'users-set-password': 1,
+    'users-subscriptions': 3,
+    'users-subscribe': 4,
+    'users-delete-subscribe': 5,
+    'tags-list': 1,
+    'tags-retrieve': 1,
+    'ingredients-list': 1,
+    'ingredients-search': 1,
+    'ingredients-retrieve': 1,
+}
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=False)
+class QueryBudgetTest(QueryBudgetMixin, TestCase):
+    """Число SQL-запросов каждого действия API не растет с объемом данных.
+
+    Каждое действие проверяется на 1, 10 и 100 связанных строках.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader = make_user('reader')
+        cls.author = make_user('author')
+        cls.tag = Tag.objects.create(name='Обед', color='#000001',
+                                     slug='lunch')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {index:03}', measurement_unit='г')
+            for index in range(100)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.reader)
+
+    def check(self, action, populate, request):
+        with self.subTest(action=action):
+            self.assertQueriesDoNotGrow(
+                QUERY_BUDGETS[action], populate, request
+            )
+
+    def create_recipe(self, author, ingredients_count=2):
+        recipe = make_recipe(author, tags=[self.tag])
+        self.set_ingredients(recipe, ingredients_count)
+        return recipe
+
+    def set_ingredients(self, recipe, count):
+        recipe.recipesingredients.all().delete()
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(recipe=recipe, ingredient=ingredient, amount=1)
+            for ingredient in self.ingredients[:count]
+        )
+
+    def top_up(self, queryset, size, create):
+        for _ in range(size - queryset.count()):
+            create()
+
+    def recipe_payload(self, count, amount=1):
+        return {
+            'name': 'Рецепт',
+            'text': 'Текст',
+            'cooking_time': 10,
+            'image': IMAGE,
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': ingredient.id, 'amount': amount}
+                for ingredient in self.ingredients[:count]
+            ],
+        }
+
+    def test_recipe_list(self):
+        def populate(size):
+            def create():
+                recipe = self.create_recipe(self.author)
+                Favorite.objects.create(user=self.reader, recipe=recipe)
+                ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+            self.top_up(Recipe.objects.all(), size, create)
+
+        self.check(
+            'recipes-list', populate,
+            lambda: self.client.get(f'{RECIPES_URL}?limit=100'),
+        )
+
+    def test_recipe_feed(self):
+        Subscription.objects.create(user=self.reader, author=self.author)
+
+        def populate(size):
+            def create():
+                recipe = self.create_recipe(self.author)
+                FeedItem.objects.create(
+                    user=self.reader, recipe=recipe, pub_date=recipe.pub_date
+                )
+            self.top_up(self.reader.feed_items, size, create)
+
+        self.check(
+            'recipes-feed', populate,
+            lambda: self.client.get(f'{RECIPES_URL}feed/?limit=100'),
+        )
+
+    def test_recipe_detail_actions(self):
+        recipe = self.create_recipe(self.reader)
+        url = f'{RECIPES_URL}{recipe.id}/'
+        self.check(
+            'recipes-retrieve',
+            lambda size: self.set_ingredients(recipe, size),
+            lambda: self.client.get(url),
+        )
+        sizes = iter(())
+
+        def update_payload(size):
+            nonlocal sizes
+            sizes = iter([size])
+
+        self.check(
+            'recipes-create', update_payload,
+            lambda: self.client.post(
+                RECIPES_URL, self.recipe_payload(next(sizes)), format='json'
+            ),
+        )
+        self.check(
+            'recipes-update',
+            lambda size: (
+                self.set_ingredients(recipe, size), update_payload(size)
+            ),
+            lambda: self.client.put(
+                url, self.recipe_payload(next(sizes), amount=3),
+                format='json',
+            ),
+        )
+        self.check(
+            'recipes-partial-update',
+            lambda size: (
+                self.set_ingredients(recipe, size), update_payload(size)
+            ),
+            lambda: self.client.patch(
+                url, self.recipe_payload(next(sizes), amount=2),
+                format='json',
+            ),
+        )
+
+    def test_recipe_destroy(self):
+        recipes = iter(())
+        fans = User.objects.filter(username__startswith='fan')
+
+        def populate(size):
+            nonlocal recipes
+            self.top_up(fans, size, lambda: make_user(f'fan{fans.count()}'))
+            recipe = self.create_recipe(self.reader, size)
+            for user in fans.all():
+                Favorite.objects.create(user=user, recipe=recipe)
+                ShoppingCart.objects.create(user=user, recipe=recipe)
+            recipes = iter([recipe])
+
+        self.check(
+            'recipes-destroy', populate,
+            lambda: self.client.delete(f'{RECIPES_URL}{next(recipes).id}/'),
+        )
+
+    def test_favorite_and_cart(self):
+        recipe = self.create_recipe(self.author)
+        url = f'{RECIPES_URL}{recipe.id}/'
+        for relation, action in (
+            ('favorite', 'recipes-favorite'),
+            ('shopping_cart', 'recipes-shopping-cart'),
+        ):
+            def populate(size):
+                self.client.delete(f'{url}{relation}/')
+                self.set_ingredients(recipe, size)
+
+            self.check(
+                action, populate,
+                lambda: self.client.post(f'{url}{relation}/'),
+            )
+            self.check(
+                action.replace('recipes-', 'recipes-delete-'),
+                lambda size: (
+                    self.set_ingredients(recipe, size),
+                    self.client.post(f'{url}{relation}/'),
+                ),
+                lambda: self.client.delete(f'{url}{relation}/'),
+            )
+
+    def test_batch_favorite_and_cart(self):
+        recipes = []
+
+        def top_up(size):
+            self.top_up(
+                Recipe.objects.all(), size,
+                lambda: recipes.append(self.create_recipe(self.author)),
+            )
+
+        for relation, model, action in (
+            ('favorite', Favorite, 'recipes-favorite-batch'),
+            ('shopping_cart', ShoppingCart, 'recipes-shopping-cart-batch'),
+        ):
+            url = f'{RECIPES_URL}{relation}/'
+
+            def request(method):
+                return getattr(self.client, method)(
+                    url, {'recipes': [recipe.id for recipe in recipes]},
+                    format='json',
+                )
+
+            self.check(
+                action,
+                lambda size: (top_up(size), model.objects.all().delete()),
+                lambda: request('post'),
+            )
+            self.check(
+                action.replace('recipes-', 'recipes-delete-'),
+                lambda size: (top_up(size), request('post')),
+                lambda: request('delete'),
+            )
+
+    def test_download_shopping_cart(self):
+        def populate(size):
+            self.top_up(
+                ShoppingCart.objects.filter(user=self.reader), size,
+                lambda: ShoppingCart.objects.create(
+                    user=self.reader,
+                    recipe=self.create_recipe(self.author, 5),
+                ),
+            )
+
+        self.check(
+            'recipes-download-shopping-cart', populate,
+            lambda: self.client.get(
+                f'{RECIPES_URL}download_shopping_cart/?format=txt'
+            ),
+        )
+
+    def test_user_actions(self):
+        users = User.objects.exclude(pk=self.reader.pk)
+        self.check(
+            'users-list',
+            lambda size: self.top_up(
+                users, size,
+                lambda: make_user(f'user{users.count()}'),
+            ),
+            lambda: self.client.get(f'{USERS_URL}?limit=100'),
+        )
+        self.check(
+            'users-retrieve',
+            lambda size: self.top_up(
+                self.author.recipes, size,
+                lambda: self.create_recipe(self.author),
+            ),
+            lambda: self.client.get(f'{USERS_URL}{self.author.id}/'),
+        )
+        self.check(
+            'users-me', lambda size: None,
+            lambda: self.client.get(f'{USERS_URL}me/'),
+        )
+
+    def test_user_updates(self):
+        def populate(size):
+            self.top_up(
+                self.reader.recipes, size,
+                lambda: self.create_recipe(self.reader),
+            )
+            self.reader.set_password('pass')
+            self.reader.save()
+
+        self.check(
+            'users-me-partial-update', populate,
+            lambda: self.client.patch(
+                f'{USERS_URL}me/',
+                {'first_name': 'Новое', 'last_name': 'Имя'},
+                format='json',
+            ),
+        )
+        self.check(
+            'users-set-password', populate,
+            lambda: self.client.post(
+                f'{USERS_URL}set_password/',
+                {'current_password': 'pass', 'new_password': 'Nw-pass-2024'},
+                format='json',
+            ),
+        )
+
+    def test_subscriptions(self):
+        def populate(size):
+            def create():
+                author = make_user(f'author{Subscription.objects.count()}')
+                for _ in range(3):
+                    self.create_recipe(author)
+                Subscription.objects.create(user=self.reader, author=author)
+            self.top_up(self.reader.follower, size, create)
+
+        self.check(
+            'users-subscriptions', populate,
+            lambda: self.client.get(
+                f'{USERS_URL}subscriptions/?limit=100&recipes_limit=3'
+            ),
+        )
+
+    def test_subscribe(self):
+        url = f'{USERS_URL}{self.author.id}/subscribe/'
+
+        def populate(size):
+            self.top_up(
+                self.author.recipes, size,
+                lambda: self.create_recipe(self.author),
+            )
+            self.reader.follower.all().delete()
+
+        self.check(
+            'users-subscribe', populate, lambda: self.client.post(url)
+        )
+        self.check(
+            'users-delete-subscribe',
+            lambda size: Subscription.objects.get_or_create(
+                user=self.reader, author=self.author
+            ),
+            lambda: self.client.delete(url),
+        )
+
+    def test_tags(self):
+        self.check(
+            'tags-list',
+            lambda size: self.top_up(
+                Tag.objects.all(), size,
+                lambda: Tag.objects.create(
+                    name=f'Тег {Tag.objects.count()}',
+                    color=f'#F{Tag.objects.count():05X}',
+                    slug=f'tag{Tag.objects.count()}',
+                ),
+            ),
+            lambda: self.client.get('/api/tags/'),
+        )
+        self.check(
+            'tags-retrieve', lambda size: None,
+            lambda: self.client.get(f'/api/tags/{self.tag.id}/'),
+        )
+
+    def test_ingredients(self):
+        def populate(size):
+            self.top_up(
+                Ingredient.objects.all(), size,
+                lambda: Ingredient.objects.create(
+                    name=f'Ингр {Ingredient.objects.count()}',
+                    measurement_unit='г',
+                ),
+            )
+            cache.clear()
+
+        Ingredient.objects.all().delete()
+        first = Ingredient.objects.create(name='Ингр', measurement_unit='г')
+        for action, url in (
+            ('ingredients-list', '/api/ingredients/'),
+            ('ingredients-search', '/api/ingredients/?name=ингр'),
+            ('ingredients-retrieve', f'/api/ingredients/{first.id}/'),
+        ):
+            self.check(action, populate, lambda: self.client.get(url))
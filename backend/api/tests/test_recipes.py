@@ -0,0 +1,1123 @@
+import json
+from base64 import b64decode
+from io import BytesIO, StringIO
+from tempfile import TemporaryDirectory
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from PIL import Image
+from rest_framework.test import APIClient
+
+from recipes.counters import reconcile_counters
+from recipes.images import make_renditions
+from recipes.models import (Favorite, FeedItem, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from users.models import Subscription, User
+from .utils import make_recipe, make_user
+
+RECIPES_URL = '/api/recipes/'
+IMAGE = (
+    'data:image/gif;base64,'
+    'R0lGODlhAQABAIAAAP///wAAACH5BAEAAAAALAAAAAABAAEAAAICRAEAOw=='
+)
+
+
+class RecipeQueriesTest(TestCase):
+    """Количество запросов к БД при выдаче рецептов не зависит от их числа."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.author = make_user('author')
+        Subscription.objects.create(user=cls.user, author=cls.author)
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(2)
+        ]
+        cls.ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(3)
+        ]
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def create_recipes(self, count):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.add_recipes(count)
+
+    def add_recipes(self, count):
+        for index in range(count):
+            recipe = make_recipe(
+                self.author, name=f'Рецепт {index}', tags=self.tags,
+                ingredients=[
+                    (ingredient, 5) for ingredient in self.ingredients
+                ],
+            )
+            Favorite.objects.create(user=self.user, recipe=recipe)
+            ShoppingCart.objects.create(user=self.user, recipe=recipe)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context), response
+
+    def test_list_queries_do_not_grow_with_page_size(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(1)
+        single, _ = self.count_queries(RECIPES_URL)
+        self.create_recipes(5)
+        full, response = self.count_queries(RECIPES_URL)
+        self.assertEqual(single, full)
+        self.assertEqual(len(response.data['results']), 6)
+
+    def test_anonymous_list_queries_do_not_grow_with_page_size(self):
+        self.create_recipes(1)
+        single, _ = self.count_queries(RECIPES_URL)
+        self.create_recipes(5)
+        full, _ = self.count_queries(RECIPES_URL)
+        self.assertEqual(single, full)
+
+    def test_list_reads_annotated_flags(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(2)
+        _, response = self.count_queries(RECIPES_URL)
+        for recipe in response.data['results']:
+            self.assertTrue(recipe['is_favorited'])
+            self.assertTrue(recipe['is_in_shopping_cart'])
+            self.assertTrue(recipe['author']['is_subscribed'])
+            self.assertEqual(len(recipe['ingredients']), 3)
+            self.assertEqual(len(recipe['tags']), 2)
+
+    def test_retrieve_queries(self):
+        self.client.force_authenticate(self.user)
+        self.create_recipes(1)
+        recipe = Recipe.objects.get()
+        queries, response = self.count_queries(f'{RECIPES_URL}{recipe.id}/')
+        self.assertTrue(response.data['is_favorited'])
+        self.assertLessEqual(queries, 6)
+
+
+class ShoppingCartExportTest(TestCase):
+    """Выгрузка списка покупок."""
+
+    URL = f'{RECIPES_URL}download_shopping_cart/'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('buyer')
+        flour = Ingredient.objects.create(name='мука', measurement_unit='г')
+        salt = Ingredient.objects.create(name='соль', measurement_unit='г')
+        for amount in (100, 200):
+            recipe = make_recipe(
+                cls.user, name=f'Хлеб {amount}', cooking_time=60,
+                ingredients=[(flour, amount), (salt, 5)],
+            )
+            ShoppingCart.objects.create(user=cls.user, recipe=recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def download(self, export_format=None):
+        params = {'format': export_format} if export_format else {}
+        response = self.client.get(self.URL, params)
+        self.assertEqual(response.status_code, 200)
+        return response, b''.join(response.streaming_content)
+
+    def test_txt_sums_amounts_once(self):
+        response, content = self.download()
+        self.assertEqual(
+            response['Content-Type'], 'text/plain; charset=utf-8'
+        )
+        self.assertEqual(
+            content.decode().splitlines()[2:],
+            ['1. мука - 300 г.', '2. соль - 10 г.'],
+        )
+
+    def test_csv(self):
+        response, content = self.download('csv')
+        self.assertEqual(
+            response['Content-Type'], 'text/csv; charset=utf-8'
+        )
+        self.assertIn('мука,300,г', content.decode('utf-8-sig'))
+
+    def test_pdf(self):
+        response, content = self.download('pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(content.startswith(b'%PDF'))
+
+    def test_single_shopping_list_query(self):
+        with CaptureQueriesContext(connection) as context:
+            self.download()
+        self.assertEqual(
+            sum('recipes_shoppinglistitem' in query['sql']
+                for query in context.captured_queries),
+            1,
+        )
+
+
+class ShoppingListTest(TestCase):
+    """Материализованный список покупок."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('buyer')
+        cls.tag = Tag.objects.create(name='Завтрак', slug='breakfast')
+        cls.flour = Ingredient.objects.create(
+            name='мука', measurement_unit='г'
+        )
+        cls.salt = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        cls.recipes = []
+        for amount in (100, 200):
+            recipe = make_recipe(
+                cls.user, name=f'Хлеб {amount}', cooking_time=60,
+                tags=[cls.tag], ingredients=[(cls.flour, amount)],
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        for recipe in self.recipes:
+            self.client.post(f'{RECIPES_URL}{recipe.id}/shopping_cart/')
+
+    def totals(self):
+        return ShoppingListItem.objects.filter(user=self.user).stored_totals()
+
+    def assertTotals(self, expected):
+        self.assertEqual(
+            self.totals(),
+            {
+                (self.user.id, ingredient.id): amount
+                for ingredient, amount in expected.items()
+            },
+        )
+        self.assertEqual(
+            ShoppingListItem.objects.live_totals(),
+            ShoppingListItem.objects.stored_totals(),
+        )
+
+    def test_cart_add_and_remove(self):
+        self.assertTotals({self.flour: 300})
+        self.client.delete(f'{RECIPES_URL}{self.recipes[0].id}/shopping_cart/')
+        self.assertTotals({self.flour: 200})
+        self.client.delete(f'{RECIPES_URL}{self.recipes[1].id}/shopping_cart/')
+        self.assertTotals({})
+
+    def test_recipe_update(self):
+        response = self.client.patch(
+            f'{RECIPES_URL}{self.recipes[0].id}/',
+            {
+                'tags': [self.tag.id],
+                'ingredients': [
+                    {'id': self.flour.id, 'amount': 50},
+                    {'id': self.salt.id, 'amount': 5},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertTotals({self.flour: 250, self.salt: 5})
+
+    def test_partial_update_without_composition(self):
+        recipe = self.recipes[0]
+        response = self.client.patch(
+            f'{RECIPES_URL}{recipe.id}/', {'name': 'Батон'}, format='json'
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.name, 'Батон')
+        self.assertEqual(list(recipe.tags.all()), [self.tag])
+        self.assertTotals({self.flour: 300})
+
+    def test_recipe_update_touches_only_changed_rows(self):
+        recipe = self.recipes[0]
+        flour = recipe.recipesingredients.get()
+        response = self.client.patch(
+            f'{RECIPES_URL}{recipe.id}/',
+            {
+                'tags': [self.tag.id],
+                'ingredients': [
+                    {'id': self.flour.id, 'amount': 100},
+                    {'id': self.salt.id, 'amount': 5},
+                ],
+            },
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(recipe.recipesingredients.values_list('id', 'amount')),
+            {
+                (flour.id, 100),
+                (recipe.recipesingredients.get(ingredient=self.salt).id, 5),
+            },
+        )
+        self.assertTotals({self.flour: 300, self.salt: 5})
+
+    def test_admin_update(self):
+        admin = User.objects.create_superuser(
+            username='admin', email='admin@example.com', password='pass',
+        )
+        recipe = self.recipes[0]
+        flour = recipe.recipesingredients.get()
+        self.client.force_login(admin)
+        response = self.client.post(
+            f'/admin/recipes/recipe/{recipe.id}/change/',
+            {
+                'author': self.user.id,
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'tags': [self.tag.id],
+                'recipesingredients-TOTAL_FORMS': 2,
+                'recipesingredients-INITIAL_FORMS': 1,
+                'recipesingredients-MIN_NUM_FORMS': 1,
+                'recipesingredients-MAX_NUM_FORMS': 1000,
+                'recipesingredients-0-id': flour.id,
+                'recipesingredients-0-recipe': recipe.id,
+                'recipesingredients-0-ingredient': self.flour.id,
+                'recipesingredients-0-amount': 50,
+                'recipesingredients-1-recipe': recipe.id,
+                'recipesingredients-1-ingredient': self.salt.id,
+                'recipesingredients-1-amount': 5,
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTotals({self.flour: 250, self.salt: 5})
+
+    def test_recipe_delete(self):
+        self.recipes[1].delete()
+        self.assertTotals({self.flour: 100})
+
+    def test_rebuild_command_repairs_drift(self):
+        ShoppingListItem.objects.update(total_amount=1)
+        with self.assertRaises(CommandError):
+            call_command(
+                'rebuild_shopping_lists', '--check', stdout=StringIO()
+            )
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        self.assertTotals({self.flour: 300})
+
+
+class CountersTest(TestCase):
+    """Денормализованные счетчики рецептов и пользователей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.author = make_user('author')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.recipes = [
+            make_recipe(self.author, name=f'Рецепт {index}', cooking_time=5)
+            for index in range(2)
+        ]
+
+    def refresh(self, obj):
+        obj.refresh_from_db()
+        return obj
+
+    def test_recipe_counters(self):
+        recipe = self.recipes[0]
+        for action in ('favorite', 'shopping_cart'):
+            self.client.post(f'{RECIPES_URL}{recipe.id}/{action}/')
+        self.assertEqual(self.refresh(recipe).favorites_count, 1)
+        self.assertEqual(recipe.in_carts_count, 1)
+        for action in ('favorite', 'shopping_cart'):
+            self.client.delete(f'{RECIPES_URL}{recipe.id}/{action}/')
+        self.assertEqual(self.refresh(recipe).favorites_count, 0)
+        self.assertEqual(recipe.in_carts_count, 0)
+
+    def test_user_counters(self):
+        self.assertEqual(self.refresh(self.author).recipes_count, 2)
+        self.recipes[0].delete()
+        self.assertEqual(self.refresh(self.author).recipes_count, 1)
+        users_url = f'/api/users/{self.author.id}/subscribe/'
+        self.client.post(users_url)
+        self.assertEqual(self.refresh(self.author).followers_count, 1)
+        self.client.delete(users_url)
+        self.assertEqual(self.refresh(self.author).followers_count, 0)
+
+    def test_ordering_by_favorites_count(self):
+        self.client.post(f'{RECIPES_URL}{self.recipes[0].id}/favorite/')
+        response = self.client.get(RECIPES_URL, {'ordering': '-pub_date'})
+        self.assertEqual(response.data['results'][0]['id'], self.recipes[1].id)
+        response = self.client.get(
+            RECIPES_URL, {'ordering': '-favorites_count'}
+        )
+        self.assertEqual(response.data['results'][0]['id'], self.recipes[0].id)
+
+    def assertNoDrift(self):
+        self.assertFalse(any(reconcile_counters(fix=False).values()))
+        self.assertEqual(
+            ShoppingListItem.objects.live_totals(),
+            ShoppingListItem.objects.stored_totals(),
+        )
+
+    def add_relations(self, users):
+        for user in users:
+            client = APIClient()
+            client.force_authenticate(user)
+            client.post(f'/api/users/{self.author.id}/subscribe/')
+            for recipe in self.recipes:
+                IngredientInRecipe.objects.get_or_create(
+                    recipe=recipe, ingredient=self.ingredient,
+                    defaults={'amount': 10},
+                )
+                for action in ('favorite', 'shopping_cart'):
+                    client.post(f'{RECIPES_URL}{recipe.id}/{action}/')
+
+    def test_recipe_delete_cascade(self):
+        self.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        readers = [self.user] + [
+            make_user(f'reader{index}') for index in range(3)
+        ]
+        self.add_relations(readers)
+        Recipe.objects.filter(pk=self.recipes[0].pk).delete()
+        self.assertNoDrift()
+        self.assertEqual(self.refresh(self.author).recipes_count, 1)
+        self.recipes[1].delete()
+        self.assertNoDrift()
+        self.assertFalse(ShoppingListItem.objects.exists())
+        self.assertEqual(self.author.recipes_count, 1)
+        self.assertEqual(self.refresh(self.author).recipes_count, 0)
+
+    def test_user_delete_cascade(self):
+        self.ingredient = Ingredient.objects.create(
+            name='соль', measurement_unit='г'
+        )
+        reader = make_user('other')
+        self.add_relations([self.user, reader])
+        self.user.delete()
+        self.assertNoDrift()
+        self.assertEqual(self.refresh(self.author).followers_count, 1)
+        self.assertEqual(self.refresh(self.recipes[0]).favorites_count, 1)
+        User.objects.filter(pk=self.author.pk).delete()
+        self.assertNoDrift()
+        self.assertFalse(ShoppingListItem.objects.exists())
+
+    def test_reconcile_command_repairs_drift(self):
+        Recipe.objects.update(favorites_count=7)
+        User.objects.update(recipes_count=0)
+        with self.assertRaises(CommandError):
+            call_command('reconcile_counters', '--check', stdout=StringIO())
+        call_command('reconcile_counters', stdout=StringIO())
+        self.assertEqual(self.refresh(self.recipes[0]).favorites_count, 0)
+        self.assertEqual(self.refresh(self.author).recipes_count, 2)
+
+
+class KeysetPaginationTest(TestCase):
+    """Пагинация ленты рецептов по курсору."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        for index in range(7):
+            make_recipe(cls.author, name=f'Рецепт {index}', cooking_time=5)
+        # Одинаковое время публикации проверяет разбор по id.
+        Recipe.objects.filter(
+            pk__in=Recipe.objects.values('pk')[:3]
+        ).update(pub_date=Recipe.objects.first().pub_date)
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_pages_follow_pub_date_and_id(self):
+        expected = list(
+            Recipe.objects.order_by('-pub_date', '-id')
+            .values_list('id', flat=True)
+        )
+        url, ids, queries = f'{RECIPES_URL}?limit=2&cursor=', [], set()
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('COUNT(', ' '.join(
+                query['sql'] for query in context.captured_queries
+            ))
+            queries.add(len(context))
+            ids += [recipe['id'] for recipe in response.data['results']]
+            url = response.data['next']
+        self.assertEqual(ids, expected)
+        self.assertEqual(len(queries), 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(RECIPES_URL, {'cursor': 'broken'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_range_bound_on_first_key(self):
+        response = self.client.get(RECIPES_URL, {'limit': 2, 'cursor': ''})
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(response.data['next'])
+        sql = context.captured_queries[0]['sql']
+        self.assertRegex(
+            sql, r'WHERE \("recipes_recipe"."pub_date" <= .* AND \('
+        )
+
+    def test_ordering_is_rejected(self):
+        response = self.client.get(
+            RECIPES_URL, {'cursor': '', 'ordering': 'favorites_count'}
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ordering', response.data)
+
+    def test_count_is_optional(self):
+        response = self.client.get(RECIPES_URL, {'cursor': ''})
+        self.assertIsNone(response.data['count'])
+
+    def test_page_number_pagination_is_default(self):
+        response = self.client.get(RECIPES_URL, {'page': 2})
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 1)
+
+
+class AnonymousResponseCacheTest(TestCase):
+    """Кеш ответов API рецептов для анонимных пользователей."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.tag = Tag.objects.create(name='Обед', slug='lunch')
+        cls.recipe = make_recipe(
+            cls.author, name='Суп', cooking_time=30, tags=[cls.tag]
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def test_anonymous_hits_skip_database(self):
+        detail_url = f'{RECIPES_URL}{self.recipe.id}/'
+        for url in (RECIPES_URL, detail_url):
+            first = self.client.get(url)
+            with self.assertNumQueries(0):
+                second = self.client.get(url)
+            self.assertEqual(first.data, second.data)
+
+    def test_query_string_is_normalized(self):
+        self.client.get(RECIPES_URL, {'limit': 6, 'tags': 'lunch'})
+        with self.assertNumQueries(0):
+            self.client.get(f'{RECIPES_URL}?tags=lunch&limit=6')
+
+    def test_writes_invalidate(self):
+        self.client.get(RECIPES_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.recipe.name = 'Борщ'
+            self.recipe.save()
+        response = self.client.get(RECIPES_URL)
+        self.assertEqual(response.data['results'][0]['name'], 'Борщ')
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.filter(pk=self.tag.pk).get().save()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(RECIPES_URL)
+        self.assertGreater(len(context), 0)
+
+    def test_host_and_scheme_are_part_of_key(self):
+        self.client.get(RECIPES_URL)
+        for extra, prefix in (
+            ({'HTTP_HOST': 'localhost'}, 'http://localhost/'),
+            ({'secure': True}, 'https://testserver/'),
+        ):
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(RECIPES_URL, **extra)
+            self.assertGreater(len(context), 0)
+            self.assertTrue(
+                response.data['results'][0]['image'].startswith(prefix)
+            )
+
+    def test_only_author_fields_invalidate(self):
+        self.client.get(RECIPES_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.set_password('new-pass')
+            self.author.save()
+            User.objects.get(pk=self.author.pk).save()
+        with self.assertNumQueries(0):
+            self.client.get(RECIPES_URL)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.first_name = 'Повар'
+            self.author.save()
+        response = self.client.get(RECIPES_URL)
+        self.assertEqual(
+            response.data['results'][0]['author']['first_name'], 'Повар'
+        )
+
+    def test_authenticated_requests_are_not_cached(self):
+        self.client.force_authenticate(self.author)
+        self.client.get(RECIPES_URL)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(RECIPES_URL)
+        self.assertGreater(len(context), 0)
+
+
+class ConditionalGetTest(TestCase):
+    """Условные GET-запросы с If-None-Match."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.tag = Tag.objects.create(name='Ужин', slug='dinner')
+        Ingredient.objects.create(name='мука', measurement_unit='г')
+        cls.recipe = make_recipe(cls.user, name='Пирог', cooking_time=30)
+
+    def setUp(self):
+        self.client = APIClient()
+        cache.clear()
+
+    def assertNotModified(self, url):
+        etag = self.client.get(url)['ETag']
+        with self.assertNumQueries(0):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_not_modified(self):
+        for url in (
+            '/api/tags/', f'/api/tags/{self.tag.id}/',
+            '/api/ingredients/', '/api/ingredients/?name=му',
+            f'{RECIPES_URL}{self.recipe.id}/',
+        ):
+            with self.subTest(url=url):
+                self.assertNotModified(url)
+
+    def test_writes_change_etag(self):
+        url = '/api/tags/'
+        etag = self.assertNotModified(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            Tag.objects.create(
+                name='Завтрак', color='#00FF00', slug='breakfast'
+            )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data), 2)
+
+    def test_user_actions_change_recipe_etag(self):
+        self.client.force_authenticate(self.user)
+        url = f'{RECIPES_URL}{self.recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(f'{url}favorite/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.data['is_favorited'])
+
+
+class RecipeFilterTest(TestCase):
+    """Фильтрация рецептов по тегам, избранному и корзине."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.tags = [
+            Tag.objects.create(name=f'Тег {i}', color=f'#00000{i}',
+                               slug=f'tag{i}')
+            for i in range(3)
+        ]
+        cls.recipes = []
+        for index in range(3):
+            recipe = make_recipe(
+                cls.user, name=f'Рецепт {index}',
+                tags=cls.tags[:2] if index < 2 else cls.tags[2:],
+            )
+            cls.recipes.append(recipe)
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[0])
+        Favorite.objects.create(user=cls.user, recipe=cls.recipes[2])
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        cache.clear()
+
+    def get_ids(self, query):
+        response = self.client.get(f'{RECIPES_URL}?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data['count'], sorted(
+            recipe['id'] for recipe in response.data['results']
+        )
+
+    def test_multiple_tags_do_not_duplicate(self):
+        self.assertEqual(
+            self.get_ids('tags=tag0&tags=tag1'),
+            (2, sorted(recipe.id for recipe in self.recipes[:2])),
+        )
+
+    def test_tags_with_favorites(self):
+        self.assertEqual(
+            self.get_ids('tags=tag0&tags=tag1&tags=tag2&is_favorited=1'),
+            (2, sorted([self.recipes[0].id, self.recipes[2].id])),
+        )
+
+    def test_unknown_tag(self):
+        self.assertEqual(self.get_ids('tags=missing'), (0, []))
+
+    def test_tag_slugs_are_cached(self):
+        def slug_lookups(query):
+            with CaptureQueriesContext(connection) as context:
+                self.get_ids(query)
+            return [
+                sql['sql'] for sql in context.captured_queries
+                if sql['sql'].startswith('SELECT "recipes_tag"."slug"')
+            ]
+
+        self.assertEqual(len(slug_lookups('tags=tag0')), 1)
+        self.assertEqual(slug_lookups('tags=tag1'), [])
+
+    def test_anonymous_favorites_filter(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.get_ids('is_favorited=1'), (0, []))
+
+
+class RecipeWriteTest(TestCase):
+    """Проверка тегов и ингредиентов при записи рецепта."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = make_user('author')
+        cls.tag = Tag.objects.create(name='Обед', color='#000001',
+                                     slug='lunch')
+        Ingredient.objects.bulk_create(
+            Ingredient(name=f'Ингредиент {i}', measurement_unit='г')
+            for i in range(30)
+        )
+        cls.ingredients = list(Ingredient.objects.order_by('id'))
+
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def post(self, ingredient_ids, tag_ids):
+        return self.client.post(
+            RECIPES_URL,
+            {
+                'name': 'Рецепт',
+                'text': 'Текст',
+                'cooking_time': 10,
+                'image': IMAGE,
+                'tags': tag_ids,
+                'ingredients': [
+                    {'id': pk, 'amount': 1} for pk in ingredient_ids
+                ],
+            },
+            format='json',
+        )
+
+    def count_post_queries(self, count):
+        with CaptureQueriesContext(connection) as context:
+            response = self.post(
+                [ingredient.id for ingredient in self.ingredients[:count]],
+                [self.tag.id],
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        return len(context)
+
+    def test_queries_do_not_grow_with_ingredients(self):
+        self.assertEqual(
+            self.count_post_queries(1), self.count_post_queries(30)
+        )
+
+    def test_missing_ids_are_reported_together(self):
+        response = self.post(
+            [self.ingredients[0].id, 9001, 9002], [self.tag.id, 9003]
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(
+            response.data,
+            {
+                'tags': ['Не найдены теги с id: 9003.'],
+                'ingredients': ['Не найдены ингредиенты с id: 9001, 9002.'],
+            },
+        )
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(BACKGROUND_TASKS_ASYNC=False)
+    def test_image_renditions(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.post([self.ingredients[0].id], [self.tag.id])
+        self.assertEqual(response.status_code, 201)
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.renditions['source'], recipe.image.name)
+        images = self.client.get(f'{RECIPES_URL}{recipe.id}/').data['images']
+        self.assertEqual(set(images), {'small', 'medium'})
+        for size, files in images.items():
+            self.assertEqual(set(files), {'webp', 'jpeg'})
+            for name in recipe.renditions[size].values():
+                self.assertTrue(default_storage.exists(name))
+
+    def test_renditions_of_same_named_images(self):
+        recipes = {}
+        for color, name in (('red', 'photo.png'), ('blue', 'photo.jpg')):
+            buffer = BytesIO()
+            Image.new('RGB', (8, 8), color).save(
+                buffer, 'PNG' if name.endswith('png') else 'JPEG'
+            )
+            recipes[color] = Recipe.objects.create(
+                author=self.author, name=name, text='Текст', cooking_time=1,
+                image=default_storage.save(
+                    f'recipes/{name}', ContentFile(buffer.getvalue())
+                ),
+            )
+            self.assertTrue(
+                make_renditions(recipes[color].id, recipes[color].image.name)
+            )
+        red = recipes['red']
+        self.assertTrue(make_renditions(red.id, red.image.name))
+        for color, recipe in recipes.items():
+            recipe.refresh_from_db()
+            name = recipe.renditions['small']['jpeg']
+            with default_storage.open(name) as file:
+                pixel = Image.open(file).convert('RGB').getpixel((0, 0))
+            self.assertEqual(
+                max(range(3), key=pixel.__getitem__),
+                0 if color == 'red' else 2,
+            )
+        self.assertEqual(
+            len(default_storage.listdir(f'recipes/renditions/{red.id}')[1]),
+            4,
+        )
+
+    def post_multipart(self, image):
+        return self.client.post(
+            RECIPES_URL,
+            {
+                'name': 'Рецепт',
+                'text': 'Текст',
+                'cooking_time': 10,
+                'image': SimpleUploadedFile(
+                    'image.gif', image, content_type='image/gif'
+                ),
+                'tags': json.dumps([self.tag.id]),
+                'ingredients': json.dumps(
+                    [{'id': self.ingredients[0].id, 'amount': 2}]
+                ),
+            },
+            format='multipart',
+        )
+
+    def test_multipart_upload(self):
+        response = self.post_multipart(b64decode(IMAGE.split(',')[1]))
+        self.assertEqual(response.status_code, 201, response.data)
+        recipe = Recipe.objects.get()
+        self.assertEqual(recipe.image.width, 1)
+        self.assertEqual(
+            list(recipe.recipesingredients.values_list('amount', flat=True)),
+            [2],
+        )
+
+    @override_settings(RECIPE_IMAGE_MAX_SIZE=16)
+    def test_multipart_size_limit(self):
+        response = self.post_multipart(b64decode(IMAGE.split(',')[1]))
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Recipe.objects.exists())
+
+    @override_settings(RECIPE_IMAGE_MAX_DIMENSION=0)
+    def test_dimension_limit(self):
+        for response in (
+            self.post_multipart(b64decode(IMAGE.split(',')[1])),
+            self.post([self.ingredients[0].id], [self.tag.id]),
+        ):
+            self.assertEqual(response.status_code, 400)
+            self.assertIn('image', response.data)
+
+
+@override_settings(BACKGROUND_TASKS_ASYNC=False, FEED_FANOUT_MAX_FOLLOWERS=1)
+class RecipeFeedTest(TestCase):
+    """Лента подписок: fan-out, дозаполнение и чтение популярных авторов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.reader, cls.author, cls.star, cls.fan = (
+            make_user(name) for name in ('reader', 'author', 'star', 'fan')
+        )
+        cls.tag = Tag.objects.create(name='Обед', color='#000001',
+                                     slug='lunch')
+        cls.ingredient = Ingredient.objects.create(
+            name='Соль', measurement_unit='г'
+        )
+
+    def setUp(self):
+        media = TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        media_settings = override_settings(MEDIA_ROOT=media.name)
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+        self.client = APIClient()
+
+    def create_recipe(self, author):
+        self.client.force_authenticate(author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(
+                RECIPES_URL,
+                {
+                    'name': 'Рецепт',
+                    'text': 'Текст',
+                    'cooking_time': 10,
+                    'image': IMAGE,
+                    'tags': [self.tag.id],
+                    'ingredients': [{'id': self.ingredient.id, 'amount': 1}],
+                },
+                format='json',
+            )
+        self.assertEqual(response.status_code, 201, response.data)
+        return response.data['id']
+
+    def subscribe(self, user, author):
+        self.client.force_authenticate(user)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post(f'/api/users/{author.id}/subscribe/')
+        self.assertEqual(response.status_code, 201, response.data)
+
+    def get_feed(self, query=''):
+        self.client.force_authenticate(self.reader)
+        response = self.client.get(f'{RECIPES_URL}feed/?{query}')
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_fan_out_and_backfill(self):
+        old = self.create_recipe(self.author)
+        self.subscribe(self.reader, self.author)
+        new = self.create_recipe(self.author)
+        self.create_recipe(self.fan)
+        self.assertEqual(
+            set(FeedItem.objects.filter(user=self.reader).values_list(
+                'recipe_id', flat=True
+            )),
+            {old, new},
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in self.get_feed()['results']],
+            [new, old],
+        )
+
+    def test_popular_author_is_pulled(self):
+        self.subscribe(self.fan, self.star)
+        self.subscribe(self.reader, self.star)
+        recipe = self.create_recipe(self.star)
+        self.assertFalse(FeedItem.objects.exists())
+        self.assertEqual(
+            [item['id'] for item in self.get_feed()['results']], [recipe]
+        )
+
+    def test_pulled_recipes_are_merged(self):
+        self.subscribe(self.fan, self.star)
+        self.subscribe(self.reader, self.star)
+        self.subscribe(self.reader, self.author)
+        created = [
+            self.create_recipe(author)
+            for author in (self.author, self.star, self.author, self.star)
+        ]
+        page = self.get_feed('limit=3')
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']], created[:0:-1]
+        )
+        page = self.get_feed(page['next'].split('?')[1])
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']], created[:1]
+        )
+        self.assertIsNone(page['next'])
+
+    def test_filters(self):
+        self.subscribe(self.fan, self.star)
+        self.subscribe(self.reader, self.star)
+        self.subscribe(self.reader, self.author)
+        recipes = [self.create_recipe(self.author) for _ in range(2)]
+        recipes += [self.create_recipe(self.star) for _ in range(2)]
+        for recipe in recipes[::2]:
+            Favorite.objects.create(user=self.reader, recipe_id=recipe)
+        self.assertEqual(
+            [
+                recipe['id']
+                for recipe in self.get_feed('is_favorited=1')['results']
+            ],
+            recipes[2::-2],
+        )
+
+    def test_unsubscribe_removes_recipes(self):
+        self.subscribe(self.reader, self.author)
+        self.create_recipe(self.author)
+        self.client.force_authenticate(self.reader)
+        self.client.delete(f'/api/users/{self.author.id}/subscribe/')
+        self.assertFalse(FeedItem.objects.exists())
+        self.assertEqual(self.get_feed()['results'], [])
+
+    def test_keyset_pages(self):
+        self.subscribe(self.reader, self.author)
+        created = [self.create_recipe(self.author) for _ in range(3)]
+        page = self.get_feed('limit=2')
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']], created[:0:-1]
+        )
+        page = self.get_feed(page['next'].split('?')[1])
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']], created[:1]
+        )
+        self.assertIsNone(page['next'])
+
+    def test_rebuild_command(self):
+        self.subscribe(self.reader, self.author)
+        recipe = self.create_recipe(self.author)
+        FeedItem.objects.all().delete()
+        call_command('rebuild_feeds', stdout=StringIO())
+        self.assertEqual(
+            list(FeedItem.objects.values_list('user_id', 'recipe_id')),
+            [(self.reader.id, recipe)],
+        )
+
+    def test_anonymous(self):
+        self.assertEqual(
+            self.client.get(f'{RECIPES_URL}feed/').status_code, 401
+        )
+
+
+class RecipeBatchTest(TestCase):
+    """Пакетное добавление в избранное и корзину и удаление из них."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        ingredients = [
+            Ingredient.objects.create(name=f'Ингредиент {i}',
+                                      measurement_unit='г')
+            for i in range(2)
+        ]
+        cls.recipes = []
+        for index in range(3):
+            recipe = make_recipe(
+                cls.user, name=f'Рецепт {index}',
+                ingredients=[
+                    (ingredient, index + 1) for ingredient in ingredients
+                ],
+            )
+            cls.recipes.append(recipe)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.ids = [recipe.id for recipe in self.recipes]
+
+    def request(self, method, relation, recipe_ids):
+        response = getattr(self.client, method)(
+            f'{RECIPES_URL}{relation}/', {'recipes': recipe_ids},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200, response.data)
+        return response.data
+
+    def test_favorites(self):
+        Favorite.objects.create(user=self.user, recipe=self.recipes[0])
+        self.assertEqual(
+            self.request('post', 'favorite', [*self.ids[:2], 9001]),
+            {self.ids[0]: 'already_added', self.ids[1]: 'added',
+             9001: 'not_found'},
+        )
+        self.assertEqual(
+            self.request('delete', 'favorite', self.ids[1:]),
+            {self.ids[1]: 'removed', self.ids[2]: 'not_added'},
+        )
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'favorites_count', flat=True
+            )),
+            [1, 0, 0],
+        )
+
+    def test_shopping_cart(self):
+        self.request('post', 'shopping_cart', self.ids)
+        self.request('delete', 'shopping_cart', self.ids[:1])
+        self.assertEqual(
+            ShoppingListItem.objects.stored_totals(),
+            ShoppingListItem.objects.live_totals(),
+        )
+        self.assertEqual(
+            set(ShoppingListItem.objects.values_list(
+                'total_amount', flat=True
+            )),
+            {5},
+        )
+        self.assertEqual(
+            list(Recipe.objects.order_by('id').values_list(
+                'in_carts_count', flat=True
+            )),
+            [0, 1, 1],
+        )
+
+    def test_validation(self):
+        for data in ({}, {'recipes': []}, {'recipes': ['x']},
+                     {'recipes': list(range(1, 102))}):
+            response = self.client.post(
+                f'{RECIPES_URL}favorite/', data, format='json'
+            )
+            self.assertEqual(response.status_code, 400, data)
+        self.client.force_authenticate(None)
+        response = self.client.post(
+            f'{RECIPES_URL}favorite/', {'recipes': self.ids}, format='json'
+        )
+        self.assertEqual(response.status_code, 401)
+
+
+class RecipeToggleTest(TestCase):
+    """Добавление в избранное и корзину одним запросом по ограничению БД."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+        cls.recipe = make_recipe(cls.user)
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def toggle(self, method, relation, recipe_id=None):
+        return getattr(self.client, method)(
+            f'{RECIPES_URL}{recipe_id or self.recipe.id}/{relation}/'
+        )
+
+    def test_toggles(self):
+        for relation, counter in (
+            ('favorite', 'favorites_count'),
+            ('shopping_cart', 'in_carts_count'),
+        ):
+            with self.subTest(relation=relation):
+                self.assertEqual(self.toggle('post', relation).status_code,
+                                 201)
+                response = self.toggle('post', relation)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('non_field_errors', response.data)
+                self.recipe.refresh_from_db()
+                self.assertEqual(getattr(self.recipe, counter), 1)
+                self.assertEqual(self.toggle('delete', relation).status_code,
+                                 204)
+                self.assertEqual(self.toggle('delete', relation).status_code,
+                                 400)
+                self.recipe.refresh_from_db()
+                self.assertEqual(getattr(self.recipe, counter), 0)
+                for method in ('post', 'delete'):
+                    self.assertEqual(
+                        self.toggle(method, relation, 9001).status_code, 404
+                    )
+
+    def test_anonymous(self):
+        self.client.force_authenticate(None)
+        self.assertEqual(self.toggle('post', 'favorite').status_code, 401)
+        self.assertFalse(Favorite.objects.exists())
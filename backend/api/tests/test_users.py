@@ -0,0 +1,105 @@
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from users.models import Subscription, User
+from .utils import make_recipe, make_user
+
+SUBSCRIPTIONS_URL = '/api/users/subscriptions/'
+
+
+class SubscriptionsTest(TestCase):
+    """Лента подписок: пагинация, recipes_limit и число запросов."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = make_user('reader')
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def create_authors(self, count, recipes_per_author):
+        for index in range(count):
+            author = make_user(f'author{User.objects.count()}')
+            Subscription.objects.create(user=self.user, author=author)
+            for number in range(recipes_per_author):
+                make_recipe(author, name=f'Рецепт {number}', cooking_time=5)
+
+    def get(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context), response
+
+    def test_only_page_is_serialized(self):
+        self.create_authors(4, 2)
+        _, response = self.get(f'{SUBSCRIPTIONS_URL}?limit=3')
+        self.assertEqual(response.data['count'], 4)
+        self.assertEqual(len(response.data['results']), 3)
+
+    def test_recipes_limit(self):
+        self.create_authors(2, 5)
+        _, response = self.get(f'{SUBSCRIPTIONS_URL}?recipes_limit=2')
+        for author in response.data['results']:
+            self.assertEqual(len(author['recipes']), 2)
+            self.assertEqual(author['recipes_count'], 5)
+            self.assertEqual(
+                set(author['recipes'][0]),
+                {'id', 'name', 'image', 'images', 'cooking_time'},
+            )
+
+    def test_queries_do_not_grow_with_page_size(self):
+        self.create_authors(1, 3)
+        single, _ = self.get(f'{SUBSCRIPTIONS_URL}?recipes_limit=3')
+        self.create_authors(5, 3)
+        full, _ = self.get(f'{SUBSCRIPTIONS_URL}?recipes_limit=3')
+        self.assertEqual(single, full)
+
+
+class SubscribeTest(TestCase):
+    """Подписка и отписка одним запросом с учетом счетчиков."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user, cls.first, cls.second = (
+            make_user(name) for name in ('reader', 'first', 'second')
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def subscribe(self, author_id, method='post'):
+        return getattr(self.client, method)(
+            f'/api/users/{author_id}/subscribe/'
+        )
+
+    def followers(self, author):
+        author.refresh_from_db(fields=['followers_count'])
+        return author.followers_count
+
+    def test_subscribe_to_several_authors(self):
+        for author in (self.first, self.second):
+            self.assertEqual(self.subscribe(author.id).status_code, 201)
+            self.assertEqual(self.followers(author), 1)
+        self.assertEqual(self.subscribe(self.first.id).status_code, 400)
+        self.assertEqual(self.followers(self.first), 1)
+
+    def test_errors(self):
+        self.assertEqual(self.subscribe(self.user.id).status_code, 400)
+        self.assertEqual(self.subscribe(9001).status_code, 404)
+        self.assertEqual(self.subscribe(9001, 'delete').status_code, 404)
+        self.assertEqual(
+            self.subscribe(self.first.id, 'delete').status_code, 400
+        )
+        self.assertFalse(Subscription.objects.exists())
+
+    def test_unsubscribe(self):
+        self.subscribe(self.first.id)
+        self.assertEqual(
+            self.subscribe(self.first.id, 'delete').status_code, 204
+        )
+        self.assertEqual(self.followers(self.first), 0)
+        self.assertFalse(Subscription.objects.exists())
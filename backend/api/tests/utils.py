@@ -0,0 +1,90 @@
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from recipes.models import IngredientInRecipe, Recipe
+from users.models import User
+
+QUERY_SIZES = (1, 10, 100)
+
+
+def make_user(username, **fields):
+    """Пользователь с почтой <username>@example.com и паролем pass."""
+    fields = {
+        'email': f'{username}@example.com', 'first_name': 'Имя',
+        'last_name': 'Фамилия', 'password': 'pass', **fields,
+    }
+    return User.objects.create_user(username=username, **fields)
+
+
+def make_recipe(author, tags=(), ingredients=(), **fields):
+    """Рецепт author с тегами tags и составом из пар (ингредиент, мера)."""
+    fields = {
+        'name': 'Рецепт', 'image': 'recipes/test.png', 'text': 'Текст',
+        'cooking_time': 10, **fields,
+    }
+    recipe = Recipe.objects.create(author=author, **fields)
+    if tags:
+        recipe.tags.set(tags)
+    for ingredient, amount in ingredients:
+        IngredientInRecipe.objects.create(
+            recipe=recipe, ingredient=ingredient, amount=amount
+        )
+    return recipe
+
+
+def format_queries(queries):
+    return '\n'.join(
+        f'{number}. {query["sql"]}'
+        for number, query in enumerate(queries, start=1)
+    )
+
+
+class QueryBudgetMixin:
+    """Проверки числа SQL-запросов для TestCase.
+
+    При превышении бюджета или росте числа запросов с объемом данных
+    в сообщение об ошибке попадает SQL всех выполненных запросов.
+    """
+
+    def capture_queries(self, request):
+        with CaptureQueriesContext(connection) as context:
+            response = request()
+        self.assertLess(
+            response.status_code, 400, getattr(response, 'data', None)
+        )
+        return context.captured_queries
+
+    def assertQueryBudget(self, budget, request, label=''):
+        queries = self.capture_queries(request)
+        if len(queries) > budget:
+            self.fail(
+                f'{label}: {len(queries)} SQL-запросов при бюджете '
+                f'{budget}:\n{format_queries(queries)}'
+            )
+        return len(queries)
+
+    def assertQueriesDoNotGrow(self, budget, populate, request,
+                               sizes=QUERY_SIZES):
+        """Бюджет соблюдается и число запросов одинаково для всех sizes.
+
+        populate(size) доводит число связанных строк до size, request()
+        выполняет проверяемый запрос и возвращает ответ.
+        """
+        counts, captured = {}, {}
+        for size in sizes:
+            populate(size)
+            captured[size] = self.capture_queries(request)
+            counts[size] = len(captured[size])
+            if counts[size] > budget:
+                self.fail(
+                    f'{counts[size]} SQL-запросов на {size} строк при '
+                    f'бюджете {budget}:\n{format_queries(captured[size])}'
+                )
+        if len(set(counts.values())) > 1:
+            largest = max(counts, key=counts.get)
+            self.fail(
+                f'Число SQL-запросов растет с объемом данных: {counts}. '
+                f'Запросы на {largest} строк:\n'
+                f'{format_queries(captured[largest])}'
+            )
+        return counts[sizes[-1]]
@@ -1,7 +1,7 @@
 from django.urls import include, path
 from rest_framework.routers import DefaultRouter
 
-from .views import (MainUserViewSet, IngredientViewSet,
+from .views import (MainUserViewSet, IngredientViewSet, MetricsView,
                     RecipeViewSet, TagViewSet)
 
 app_name = 'api'
@@ -23,6 +23,7 @@ router_v1.register(
 )
 
 urlpatterns = [
+    path('_metrics', MetricsView.as_view(), name='metrics'),
     path('', include(router_v1.urls)),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
@@ -1,32 +1,67 @@
-from django.db.models import Sum
-from django.http import HttpResponse
+from django.conf import settings
+from django.db.models import Exists, F, OuterRef, Prefetch, Subquery
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.utils.decorators import method_decorator
+from django.views.decorators.http import condition
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet
 from rest_framework import status, viewsets
 from rest_framework.decorators import action
-from rest_framework.permissions import AllowAny, IsAuthenticated
+from rest_framework.filters import OrderingFilter
+from rest_framework.parsers import JSONParser
+from rest_framework.permissions import (AllowAny, IsAdminUser,
+                                        IsAuthenticated)
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.views import APIView
 
+from .cache import (AnonymousResponseCacheMixin, ingredients_etag,
+                    recipe_etag, tags_etag)
+from .exports import EXPORTS
 from .filters import IngredientSearchFilter, RecipeFilter
-from recipes.models import (Favorite, Ingredient, Recipe,
-                            ShoppingCart, Tag)
+from .metrics import render_metrics
+from recipes.feed import feed_sources
+from recipes.models import (Favorite, Ingredient, IngredientInRecipe,
+                            Recipe, ShoppingCart, ShoppingListItem, Tag)
+from recipes.relations import (add_recipe, add_recipes, remove_recipe,
+                               remove_recipes, unsubscribe)
 from users.models import Subscription, User
-from .pagination import LimitPageNumberPagination
+from .pagination import (FeedPagination, KeysetPaginationMixin,
+                         LimitPageNumberPagination)
+from .parsers import ImageUploadLimitHandler, MultiPartJSONParser
 from .permissions import IsAuthorOrReadOnly
+from .renderers import (CSVRenderer, PDFRenderer, PlainTextRenderer,
+                        PrometheusRenderer)
+from .search import ingredient_index
 from .serializers import (IngredientSerializer, ShortRecipeResponseSerializer,
-                          RecipeMinifieldSerializer, RecipePostSerializer,
+                          RecipeIdsSerializer, RecipeMinifieldSerializer,
+                          RecipePostSerializer,
                           RecipeSerializer, SubscriptionsSerializer,
-                          TagSerializer, UserSerializer, FavoriteSerializer,
-                          ShoppingCartSerializer, FollowerSerializer)
+                          TagSerializer, UserSerializer, FollowerSerializer)
 
 
-class MainUserViewSet(UserViewSet):
+class MainUserViewSet(KeysetPaginationMixin, UserViewSet):
     """Вьюсет для пользователя."""
 
     queryset = User.objects.all()
     serializer_class = UserSerializer
     pagination_class = LimitPageNumberPagination
+    lookup_value_regex = r'\d+'
+    keyset_ordering = ('username', 'id')
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        user = self.request.user
+        if user.is_authenticated and self.action in ('list', 'retrieve'):
+            queryset = queryset.annotate(
+                is_subscribed=Exists(
+                    Subscription.objects.filter(
+                        user=user, author=OuterRef('pk')
+                    )
+                )
+            )
+        return queryset
 
     @action(
         detail=False,
@@ -34,15 +69,39 @@ class MainUserViewSet(UserViewSet):
         permission_classes=(IsAuthenticated,),
     )
     def subscriptions(self, request):
-        queryset = User.objects.filter(following__user=request.user)
+        queryset = User.objects.filter(
+            following__user=request.user
+        ).prefetch_related(
+            Prefetch('recipes', queryset=self.get_subscription_recipes())
+        )
         page = self.paginate_queryset(queryset)
         if page is not None:
-            serializer = FollowerSerializer(queryset, many=True)
+            serializer = FollowerSerializer(page, many=True)
             return self.get_paginated_response(serializer.data)
 
-        serializer = self.get_serializer(queryset, many=True)
+        serializer = FollowerSerializer(queryset, many=True)
         return Response(serializer.data, status=status.HTTP_200_OK)
 
+    def get_subscription_recipes(self):
+        """Рецепты авторов в подписках, не более recipes_limit на автора."""
+        recipes = Recipe.objects.only(
+            'id', 'author', 'name', 'image', 'renditions', 'cooking_time',
+            'pub_date',
+        )
+        try:
+            recipes_limit = int(self.request.query_params['recipes_limit'])
+        except (KeyError, ValueError):
+            return recipes
+        if recipes_limit < 0:
+            return recipes
+        return recipes.filter(
+            pk__in=Subquery(
+                Recipe.objects.filter(
+                    author=OuterRef('author')
+                ).values('pk')[:recipes_limit]
+            )
+        )
+
     @action(detail=True, methods=['post'],
             permission_classes=[IsAuthenticated])
     def subscribe(self, request, id=None):
@@ -56,20 +115,17 @@ class MainUserViewSet(UserViewSet):
 
     @subscribe.mapping.delete
     def delete_subscribe(self, request, id=None):
-        author = get_object_or_404(User, id=id)
-        subscription = Subscription.objects.filter(
-            user=request.user,
-            author=author
-        )
-        if subscription:
-            subscription.delete()
+        if unsubscribe(request.user.id, int(id)):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(User, id=id)
         return Response(
             {'Попытка удалить несуществующую подписку!'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
 
+@method_decorator(condition(etag_func=tags_etag), name='list')
+@method_decorator(condition(etag_func=tags_etag), name='retrieve')
 class TagViewSet(viewsets.ReadOnlyModelViewSet):
     """Вьюсет для тегов."""
 
@@ -78,16 +134,56 @@ class TagViewSet(viewsets.ReadOnlyModelViewSet):
     pagination_class = None
 
 
-class RecipeViewSet(viewsets.ModelViewSet):
+@method_decorator(condition(etag_func=recipe_etag), name='retrieve')
+class RecipeViewSet(AnonymousResponseCacheMixin, KeysetPaginationMixin,
+                    viewsets.ModelViewSet):
     """Вьюсет для рецептов."""
 
     queryset = Recipe.objects.all()
     permission_class = (IsAuthorOrReadOnly, IsAuthenticated,)
     pagination_classes = LimitPageNumberPagination
-    filter_backends = (DjangoFilterBackend,)
+    filter_backends = (DjangoFilterBackend, OrderingFilter)
     filterset_class = RecipeFilter
+    ordering_fields = ('pub_date', 'favorites_count', 'in_carts_count')
+    keyset_ordering = ('-pub_date', '-id')
+    lookup_value_regex = r'\d+'
+    parser_classes = (JSONParser, MultiPartJSONParser)
+    multipart_json_fields = ('ingredients', 'tags')
     serializer_class = RecipeSerializer, RecipeMinifieldSerializer
 
+    def initialize_request(self, request, *args, **kwargs):
+        request.upload_handlers.insert(0, ImageUploadLimitHandler(request))
+        return super().initialize_request(request, *args, **kwargs)
+
+    def get_queryset(self):
+        user = self.request.user
+        queryset = Recipe.objects.prefetch_related(
+            'tags',
+            Prefetch(
+                'recipesingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        )
+        if not user.is_authenticated:
+            return queryset.select_related('author')
+        authors = User.objects.annotate(
+            is_subscribed=Exists(
+                Subscription.objects.filter(user=user, author=OuterRef('pk'))
+            )
+        )
+        return queryset.prefetch_related(
+            Prefetch('author', queryset=authors)
+        ).annotate(
+            is_favorited=Exists(
+                Favorite.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+            is_in_shopping_cart=Exists(
+                ShoppingCart.objects.filter(user=user, recipe=OuterRef('pk'))
+            ),
+        )
+
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
 
@@ -99,60 +195,124 @@ class RecipeViewSet(viewsets.ModelViewSet):
     @action(
         detail=False,
         methods=['GET'],
-        permission_classes=(IsAuthenticated,)
+        permission_classes=(IsAuthenticated,),
+    )
+    def feed(self, request):
+        """Рецепты авторов из подписок, всегда с keyset-пагинацией."""
+        recipes = self.filter_queryset(Recipe.objects.all())
+        paginator = FeedPagination()
+        page = paginator.paginate_sources(
+            feed_sources(
+                request.user,
+                recipes if recipes.query.has_filters() else None,
+            ),
+            self.get_queryset(),
+            request,
+        )
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(
+        detail=False,
+        methods=['GET'],
+        permission_classes=(IsAuthenticated,),
+        renderer_classes=(
+            *api_settings.DEFAULT_RENDERER_CLASSES,
+            PlainTextRenderer, CSVRenderer, PDFRenderer,
+        ),
     )
     def download_shopping_cart(self, request):
-        shopping_cart = (
-            ShoppingCart.objects.filter(user=request.user)
+        renderer = request.accepted_renderer
+        if renderer.format not in EXPORTS:
+            renderer = PlainTextRenderer
+        ingredients = (
+            ShoppingListItem.objects.filter(user=request.user)
             .values(
-                'recipe__ingredients__name',
-                'recipe__ingredients__measurement_unit',
-            )
-            .annotate(amount=Sum('recipe__recipesingredients__amount'))
-            .order_by('recipe__ingredients__name')
-        )
-        page = ['Список покупок:\n--------------']
-        for index, recipe in enumerate(shopping_cart, start=1):
-            page.append(
-                f'{index}. {recipe["recipe__ingredients__name"]} - '
-                f'{recipe["amount"]} '
-                f'{recipe["recipe__ingredients__measurement_unit"]}.',
+                name=F('ingredient__name'),
+                measurement_unit=F('ingredient__measurement_unit'),
+                amount=F('total_amount'),
             )
-        response = HttpResponse(page, content_type='text/plain')
+            .order_by('name')
+        )
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            EXPORTS[renderer.format](ingredients.iterator()),
+            content_type=content_type,
+        )
         response['Content-Disposition'] = (
-            'attachment;filename=shopping_cart.txt'
+            f'attachment;filename=shopping_cart.{renderer.format}'
         )
         return response
 
     @staticmethod
-    def post_for_shopping_cart_and_favorite(request, pk, serializer_req):
+    def post_for_shopping_cart_and_favorite(request, pk, model, message):
         recipe = get_object_or_404(Recipe, pk=pk)
-        data = {'user': request.user.id, 'recipe': pk}
-        serializer = serializer_req(data=data, context={'request': request})
-        serializer.is_valid(raise_exception=True)
-        serializer.save()
+        if not add_recipe(model, request.user.id, recipe.id):
+            return Response(
+                {api_settings.NON_FIELD_ERRORS_KEY: [message]},
+                status=status.HTTP_400_BAD_REQUEST
+            )
         serializer_data = ShortRecipeResponseSerializer(recipe)
         return Response(serializer_data.data, status=status.HTTP_201_CREATED)
 
     @staticmethod
     def delete_for_shopping_cart_and_favorite(request, pk, location, model):
-        recipe = get_object_or_404(Recipe, pk=pk)
-        obj = model.objects.filter(
-            user=request.user,
-            recipe=recipe
-        )
-        if obj.exists():
-            obj.delete()
+        if remove_recipe(model, request.user.id, int(pk)):
             return Response(status=status.HTTP_204_NO_CONTENT)
+        get_object_or_404(Recipe, pk=pk)
         return Response(
             {'errors': f'Рецепт уже удален из {location}'},
             status=status.HTTP_400_BAD_REQUEST
         )
 
-    @action(methods=['post'], detail=True)
+    @staticmethod
+    def change_recipes_batch(request, change, model):
+        serializer = RecipeIdsSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        recipe_ids = serializer.validated_data['recipes']
+        return Response(change(model, request.user.id, recipe_ids))
+
+    @action(
+        methods=['post'],
+        detail=False,
+        url_path='favorite',
+        url_name='favorite-batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def favorite_batch(self, request):
+        return self.change_recipes_batch(request, add_recipes, Favorite)
+
+    @favorite_batch.mapping.delete
+    def delete_favorite_batch(self, request):
+        return self.change_recipes_batch(request, remove_recipes, Favorite)
+
+    @action(
+        methods=['post'],
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=(IsAuthenticated,),
+    )
+    def shopping_cart_batch(self, request):
+        return self.change_recipes_batch(request, add_recipes, ShoppingCart)
+
+    @shopping_cart_batch.mapping.delete
+    def delete_shopping_cart_batch(self, request):
+        return self.change_recipes_batch(
+            request, remove_recipes, ShoppingCart
+        )
+
+    @action(
+        methods=['post'],
+        detail=True,
+        permission_classes=(IsAuthenticated,),
+    )
     def favorite(self, request, pk):
         return self.post_for_shopping_cart_and_favorite(
-            request, pk, FavoriteSerializer
+            request, pk, Favorite,
+            'Вы уже добавляли это рецепт в избранное.',
         )
 
     @favorite.mapping.delete
@@ -161,10 +321,14 @@ class RecipeViewSet(viewsets.ModelViewSet):
             request, pk, 'избранного', Favorite
         )
 
-    @action(methods=['post'], detail=True,)
+    @action(
+        methods=['post'],
+        detail=True,
+        permission_classes=(IsAuthenticated,),
+    )
     def shopping_cart(self, request, pk):
         return self.post_for_shopping_cart_and_favorite(
-            request, pk, ShoppingCartSerializer
+            request, pk, ShoppingCart, 'Этот рецепт уже в списке покупок.'
         )
 
     @shopping_cart.mapping.delete
@@ -174,6 +338,8 @@ class RecipeViewSet(viewsets.ModelViewSet):
         )
 
 
+@method_decorator(condition(etag_func=ingredients_etag), name='list')
+@method_decorator(condition(etag_func=ingredients_etag), name='retrieve')
 class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     """Вьюсет для ингредиентов."""
 
@@ -182,3 +348,33 @@ class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
     permission_classes = (AllowAny,)
     pagination_class = None
     filterset_class = IngredientSearchFilter
+
+    def list(self, request, *args, **kwargs):
+        """Список и поиск по индексу справочника в памяти процесса.
+
+        Если индекс выключен (INGREDIENT_INDEX_ENABLED=False) или его
+        перестраивает другой поток, список и поиск идут через БД:
+        IngredientSearchFilter ищет по индексу pg_trgm.
+        """
+        if not (
+            settings.INGREDIENT_INDEX_ENABLED
+            and ingredient_index.refresh(wait=False)
+        ):
+            return super().list(request, *args, **kwargs)
+        name = request.query_params.get('name')
+        if name:
+            return Response(ingredient_index.search(name))
+        return Response(ingredient_index.all())
+
+
+class MetricsView(APIView):
+    """Метрики InstrumentationMiddleware для Prometheus, только для staff."""
+
+    permission_classes = (IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        return Response(
+            render_metrics(),
+            content_type='text/plain; version=0.0.4; charset=utf-8',
+        )
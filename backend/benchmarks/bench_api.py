@@ -0,0 +1,60 @@
+"""Замеры основных эндпоинтов API.
+
+Запуск из каталога backend:
+
+    pip install -r benchmarks/requirements.txt
+    pytest benchmarks
+
+Объемы данных задаются переменными BENCH_USERS, BENCH_RECIPES,
+BENCH_INGREDIENTS_PER_RECIPE, BENCH_FAVORITES, BENCH_CARTS и
+BENCH_SUBSCRIPTIONS, БД - как обычно (USE_SQLITE или PostgreSQL).
+Отчет pytest-benchmark пишется в benchmark-report.json, число
+SQL-запросов каждого сценария - в его extra_info. bench_connection
+замеряет цену соединения с БД на запрос в режимах new (CONN_MAX_AGE=0),
+persistent и pool.
+"""
+import pytest
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from api.benchmark import (close_connection, connection_modes,
+                           get_client, get_connection, perform,
+                           request_cycle)
+
+SCENARIOS = (
+    'recipes_list',
+    'recipes_list_filtered',
+    'recipes_list_anonymous',
+    'recipes_feed',
+    'subscriptions',
+    'ingredients_search',
+    'download_shopping_cart',
+    'recipe_create',
+    'recipe_update',
+)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('name', SCENARIOS)
+def bench_endpoint(benchmark, dataset, scenarios, name):
+    scenario = scenarios[name]
+    client = get_client(dataset, scenario)
+    perform(client, scenario)
+    with CaptureQueriesContext(connection) as context:
+        perform(client, scenario)
+    benchmark.extra_info['queries'] = len(context)
+    benchmark.extra_info['sizes'] = dataset.sizes
+    benchmark.extra_info['database'] = connection.vendor
+    benchmark(perform, client, scenario)
+
+
+@pytest.mark.django_db
+@pytest.mark.parametrize('mode', connection_modes())
+def bench_connection(benchmark, mode):
+    db = get_connection(mode)
+    try:
+        request_cycle(db)
+        benchmark.extra_info['database'] = connection.vendor
+        benchmark(request_cycle, db)
+    finally:
+        close_connection(db)
@@ -0,0 +1,40 @@
+import os
+from tempfile import TemporaryDirectory
+
+import pytest
+from django.test.utils import override_settings
+
+from api.benchmark import DEFAULT_SIZES, get_scenarios, seed
+
+
+def env_sizes():
+    """Объемы данных из переменных BENCH_USERS, BENCH_RECIPES и т.д."""
+    return {
+        name: int(os.getenv(f'BENCH_{name.upper()}', default))
+        for name, default in DEFAULT_SIZES.items()
+    }
+
+
+@pytest.fixture(scope='session', autouse=True)
+def bench_settings():
+    with TemporaryDirectory() as media, override_settings(
+        MEDIA_ROOT=media,
+        BACKGROUND_TASKS_ASYNC=False,
+        METRICS_ENABLED=False,
+    ):
+        yield
+
+
+@pytest.fixture(scope='session')
+def dataset(django_db_setup, django_db_blocker):
+    with django_db_blocker.unblock():
+        return seed(random_seed=int(os.getenv('BENCH_SEED', 0)),
+                    **env_sizes())
+
+
+@pytest.fixture(scope='session')
+def scenarios(dataset, django_db_blocker):
+    with django_db_blocker.unblock():
+        return {
+            scenario.name: scenario for scenario in get_scenarios(dataset)
+        }
@@ -0,0 +1,116 @@
+"""Нагрузочный тест запущенного сервера для сравнения режимов WSGI и ASGI.
+
+Держит --concurrency одновременных соединений и выполняет --requests
+GET-запросов по кругу к переданным путям. Печатает JSON с пропускной
+способностью, перцентилями задержки и числом ошибок. Нужна только
+стандартная библиотека:
+
+    python benchmarks/loadtest.py http://127.0.0.1:8000 \\
+        /api/recipes/ /api/tags/ '/api/ingredients/?name=соль' \\
+        --concurrency 64 --requests 5000 --label asgi
+"""
+import argparse
+import json
+import statistics
+import sys
+from concurrent.futures import ThreadPoolExecutor
+from http.client import HTTPConnection, HTTPSConnection
+from itertools import count
+from threading import Lock
+from time import perf_counter
+from urllib.parse import quote, urlsplit
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(len(values) * fraction), len(values) - 1)]
+
+
+class LoadTest:
+    def __init__(self, base_url, paths, total, headers):
+        url = urlsplit(base_url)
+        self.connection_class = (
+            HTTPSConnection if url.scheme == 'https' else HTTPConnection
+        )
+        self.netloc = url.netloc
+        self.paths = [quote(path, safe='/?=&') for path in paths]
+        self.total = total
+        self.headers = headers
+        self.counter = count()
+        self.lock = Lock()
+        self.timings = []
+        self.errors = 0
+
+    def next_path(self):
+        with self.lock:
+            number = next(self.counter)
+        if number >= self.total:
+            return None
+        return self.paths[number % len(self.paths)]
+
+    def worker(self):
+        connection = self.connection_class(self.netloc, timeout=60)
+        timings, errors = [], 0
+        while (path := self.next_path()) is not None:
+            started = perf_counter()
+            try:
+                connection.request('GET', path, headers=self.headers)
+                response = connection.getresponse()
+                response.read()
+                failed = response.status >= 400
+            except OSError:
+                connection.close()
+                failed = True
+            timings.append(perf_counter() - started)
+            errors += failed
+        connection.close()
+        with self.lock:
+            self.timings.extend(timings)
+            self.errors += errors
+
+    def run(self, concurrency):
+        started = perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            for _ in range(concurrency):
+                executor.submit(self.worker)
+        elapsed = perf_counter() - started
+        milliseconds = [timing * 1000 for timing in self.timings]
+        return {
+            'requests': len(milliseconds),
+            'errors': self.errors,
+            'elapsed_s': elapsed,
+            'throughput_rps': len(milliseconds) / elapsed,
+            'latency_ms': {
+                'median': statistics.median(milliseconds),
+                'p95': percentile(milliseconds, 0.95),
+                'p99': percentile(milliseconds, 0.99),
+                'max': max(milliseconds),
+            },
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('base_url')
+    parser.add_argument('paths', nargs='+')
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--token', help='Токен пользователя для запросов.')
+    parser.add_argument('--label', default='')
+    options = parser.parse_args()
+    headers = {'Accept': 'application/json'}
+    if options.token:
+        headers['Authorization'] = f'Token {options.token}'
+    report = LoadTest(
+        options.base_url, options.paths, options.requests, headers
+    ).run(options.concurrency)
+    json.dump(
+        {'label': options.label, 'concurrency': options.concurrency,
+         **report},
+        sys.stdout, ensure_ascii=False, indent=2,
+    )
+    sys.stdout.write('\n')
+
+
+if __name__ == '__main__':
+    main()
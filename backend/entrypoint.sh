@@ -2,4 +2,4 @@
 python manage.py migrate --noinput
 python manage.py collectstatic 
 cp -rf /app/static/. /static/static/ 
-gunicorn --bind 0.0.0.0:8000 foodgram.wsgi
\ No newline at end of file
+exec gunicorn "foodgram.${APP_SERVER:-wsgi}:application"
@@ -0,0 +1,8 @@
+"""Маршруты для ASGI: API через api.asyncviews, админка как есть."""
+from django.contrib import admin
+from django.urls import include, path
+
+urlpatterns = [
+    path('admin/', admin.site.urls),
+    path('api/', include('api.asgi_urls', namespace='api')),
+]
@@ -0,0 +1,177 @@
+"""PostgreSQL с проверкой постоянных соединений и пулом в процессе.
+
+В Django 3.2 нет ни CONN_HEALTH_CHECKS (появились в 4.1), ни пула
+соединений (5.1, только для psycopg 3). Здесь то же для psycopg2:
+
+- CONN_HEALTH_CHECKS: постоянное соединение (CONN_MAX_AGE > 0) перед
+  первым запросом к БД в новом HTTP-запросе проверяется SELECT 1, и
+  разорванное (перезапуск PostgreSQL или PgBouncer, таймаут сети)
+  открывается заново вместо ошибки 500. Поведение и ключ настройки те
+  же, что в Django 4.1, поэтому после обновления достаточно сменить
+  ENGINE;
+- POOL = {'max_size': N, 'timeout': секунды}: соединения берутся из
+  общего для процесса пула и возвращаются в него при закрытии, вместо
+  нового подключения с TLS и аутентификацией. Пул ограничивает число
+  соединений воркера с БД: поток, которому не хватило соединения,
+  ждет освобождения не дольше timeout.
+"""
+from functools import partial
+from threading import BoundedSemaphore, Lock
+
+from django.db.backends.postgresql import base
+from psycopg2.extensions import (TRANSACTION_STATUS_IDLE,
+                                 TRANSACTION_STATUS_UNKNOWN)
+
+Database = base.Database
+
+_pools = {}
+_pools_lock = Lock()
+
+
+def is_usable(connection):
+    """Соединение psycopg2 отвечает на запросы."""
+    try:
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT 1')
+    except Database.Error:
+        return False
+    return True
+
+
+def reset(connection):
+    """Откатывает незавершенную транзакцию; False, если соединение сломано."""
+    if connection.closed:
+        return False
+    status = connection.info.transaction_status
+    if status == TRANSACTION_STATUS_UNKNOWN:
+        return False
+    if status != TRANSACTION_STATUS_IDLE:
+        try:
+            connection.rollback()
+        except Database.Error:
+            return False
+    return True
+
+
+class ConnectionPool:
+    """Открытые соединения psycopg2 с одной базой, общие для потоков."""
+
+    def __init__(self, max_size, timeout=10):
+        self.max_size = max_size
+        self.timeout = timeout
+        self.slots = BoundedSemaphore(max_size)
+        self.idle = []
+        self.lock = Lock()
+
+    def acquire(self, connect, check=None):
+        """Свободное соединение, прошедшее check, или новое от connect()."""
+        if not self.slots.acquire(timeout=self.timeout):
+            raise Database.OperationalError(
+                f'Все {self.max_size} соединений пула заняты дольше '
+                f'{self.timeout} с.'
+            )
+        try:
+            while True:
+                with self.lock:
+                    connection = self.idle.pop() if self.idle else None
+                if connection is None:
+                    return connect()
+                if check is None or check(connection):
+                    return connection
+                connection.close()
+        except BaseException:
+            self.slots.release()
+            raise
+
+    def release(self, connection):
+        """Возвращает соединение в пул; сломанное закрывается."""
+        try:
+            if reset(connection):
+                with self.lock:
+                    self.idle.append(connection)
+            else:
+                connection.close()
+        finally:
+            self.slots.release()
+
+    def close(self):
+        """Закрывает свободные соединения."""
+        with self.lock:
+            idle, self.idle = self.idle, []
+        for connection in idle:
+            connection.close()
+
+
+def get_pool(alias, conn_params, options):
+    """Пул процесса для базы alias с параметрами подключения conn_params.
+
+    Ключ включает параметры подключения: при создании тестовой базы Django
+    подключается с тем же alias к служебной базе postgres.
+    """
+    key = (alias, repr(sorted(conn_params.items())))
+    with _pools_lock:
+        if key not in _pools:
+            _pools[key] = ConnectionPool(**options)
+        return _pools[key]
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.health_check_done = False
+        self.pool = None
+
+    @property
+    def health_check_enabled(self):
+        return self.settings_dict.get('CONN_HEALTH_CHECKS', False)
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict.get('POOL')
+        if not options:
+            return super().get_new_connection(conn_params)
+        self.pool = get_pool(self.alias, conn_params, options)
+        connection = self.pool.acquire(
+            partial(super().get_new_connection, conn_params),
+            lambda idle: (
+                (not self.health_check_enabled or is_usable(idle))
+                and reset(idle)
+            ),
+        )
+        # Как в родительском методе: уровень изоляции из OPTIONS или
+        # уровень соединения по умолчанию, в том числе для взятого из пула.
+        self.isolation_level = self.settings_dict['OPTIONS'].get(
+            'isolation_level', connection.isolation_level
+        )
+        return connection
+
+    def connect(self):
+        super().connect()
+        self.health_check_done = True
+
+    def _close(self):
+        if self.pool is None or self.connection is None:
+            return super()._close()
+        with self.wrap_database_errors:
+            self.pool.release(self.connection)
+
+    def close_if_unusable_or_obsolete(self):
+        if self.connection is not None:
+            self.health_check_done = False
+        super().close_if_unusable_or_obsolete()
+
+    def close_if_health_check_failed(self):
+        """Закрывает постоянное соединение, не прошедшее проверку."""
+        if (
+            self.connection is None
+            or not self.health_check_enabled
+            or self.health_check_done
+        ):
+            return
+        if not self.is_usable():
+            self.close()
+        self.health_check_done = True
+
+    def _cursor(self, name=None):
+        self.close_if_health_check_failed()
+        return super()._cursor(name)
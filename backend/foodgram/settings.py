@@ -32,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.InstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -41,7 +42,12 @@ MIDDLEWARE = [
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
 
-ROOT_URLCONF = 'foodgram.urls'
+# Под ASGI (foodgram.asgi) вью API выполняются в пуле потоков
+# api.asyncviews, см. foodgram.asgi_urls.
+ASYNC_VIEWS = os.getenv('ASYNC_VIEWS', 'False').lower() == 'true'
+ASYNC_VIEW_THREADS = int(os.getenv('ASYNC_VIEW_THREADS', 8))
+
+ROOT_URLCONF = 'foodgram.asgi_urls' if ASYNC_VIEWS else 'foodgram.urls'
 
 TEMPLATES = [
     {
@@ -62,17 +68,73 @@ TEMPLATES = [
 WSGI_APPLICATION = 'foodgram.wsgi.application'
 
 
+# Соединения с PostgreSQL (см. foodgram.backends.postgresql):
+# DB_CONN_MAX_AGE — сколько секунд держать соединение потока открытым
+# между запросами, перед переиспользованием оно проверяется SELECT 1;
+# DB_POOL_MAX_SIZE > 0 — общий пул соединений на процесс вместо
+# постоянных соединений потоков; DB_PGBOUNCER=True — подключение через
+# PgBouncer в режиме transaction, где серверные курсоры iterator()
+# работать не могут.
+DB_POOL_MAX_SIZE = int(os.getenv('DB_POOL_MAX_SIZE', 0))
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': 'foodgram.backends.postgresql',
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': int(
+            os.getenv('DB_CONN_MAX_AGE', 0 if DB_POOL_MAX_SIZE else 60)
+        ),
+        'CONN_HEALTH_CHECKS': True,
+        'POOL': {
+            'max_size': DB_POOL_MAX_SIZE,
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', 10)),
+        } if DB_POOL_MAX_SIZE else None,
+        'DISABLE_SERVER_SIDE_CURSORS': (
+            os.getenv('DB_PGBOUNCER', 'False').lower() == 'true'
+        ),
+    }
+}
+
+if os.getenv('USE_SQLITE', 'False').lower() == 'true':
+    DATABASES = {
+        'default': {
+            'ENGINE': 'django.db.backends.sqlite3',
+            'NAME': BASE_DIR / 'db.sqlite3',
+        }
+    }
+
+
+# Версии справочников и кеш ответов API (см. recipes.signals, api.cache)
+# должны быть общими для всех воркеров gunicorn, поэтому в проде нужен
+# разделяемый кеш: CACHE_BACKEND=django_redis.cache.RedisCache и
+# CACHE_LOCATION=redis://redis:6379/0 (так задано в docker-compose) или
+# FileBasedCache с каталогом. LocMemCache годится только для одного
+# процесса: разработки и тестов.
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
     }
 }
 
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
+INGREDIENT_INDEX_ENABLED = (
+    os.getenv('INGREDIENT_INDEX_ENABLED', 'True').lower() == 'true'
+)
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'False').lower() == 'true'
+METRICS_SLOW_REQUEST_SECONDS = float(
+    os.getenv('METRICS_SLOW_REQUEST_SECONDS', 1)
+)
+METRICS_SLOW_SQL_LIMIT = int(os.getenv('METRICS_SLOW_SQL_LIMIT', 50))
+
 
 AUTH_PASSWORD_VALIDATORS = [
     {
@@ -142,8 +204,28 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'static')
 MEDIA_URL = '/backend_media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+RECIPE_IMAGE_MAX_SIZE = int(os.getenv('RECIPE_IMAGE_MAX_SIZE', 10 * 2**20))
+RECIPE_IMAGE_MAX_DIMENSION = int(os.getenv('RECIPE_IMAGE_MAX_DIMENSION', 6000))
+
+IMAGE_RENDITION_SIZES = {'small': 320, 'medium': 640}
+
+BACKGROUND_TASK_WORKERS = int(os.getenv('BACKGROUND_TASK_WORKERS', 2))
+BACKGROUND_TASKS_ASYNC = (
+    os.getenv('BACKGROUND_TASKS_ASYNC', 'True').lower() == 'true'
+)
+
+FEED_FANOUT_MAX_FOLLOWERS = int(os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000))
+FEED_FANOUT_BATCH_SIZE = 1000
+FEED_BACKFILL_LIMIT = 100
+
+RECIPES_BATCH_MAX_SIZE = 100
+
 DATA_FILES_DIR = os.path.join(BASE_DIR, 'data')
 
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 CORS_ORIGIN_ALLOW_ALL = True
 CORS_URLS_REGEX = r'^/api/.*$'
 
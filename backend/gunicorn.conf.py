@@ -0,0 +1,18 @@
+"""Настройки gunicorn для обоих режимов запуска.
+
+APP_SERVER=wsgi (по умолчанию) - синхронные воркеры и foodgram.wsgi,
+APP_SERVER=asgi - воркеры uvicorn и foodgram.asgi, см. entrypoint.sh.
+"""
+import multiprocessing
+import os
+
+bind = '0.0.0.0:8000'
+workers = int(
+    os.getenv('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1)
+)
+timeout = int(os.getenv('GUNICORN_TIMEOUT', 30))
+graceful_timeout = timeout
+keepalive = 5
+
+if os.getenv('APP_SERVER', 'wsgi') == 'asgi':
+    worker_class = 'uvicorn.workers.UvicornWorker'
@@ -1,8 +1,10 @@
 from django.contrib import admin
 
 from users.models import Subscription
-from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
-                     ShoppingCart, Tag)
+from .feed import schedule_fan_out
+from .images import schedule_renditions
+from .models import (Favorite, FeedItem, Ingredient, IngredientInRecipe,
+                     Recipe, ShoppingCart, ShoppingListItem, Tag)
 
 
 class IngredientInRecipeInline(admin.TabularInline):
@@ -44,7 +46,10 @@ class RecipeAdmin(admin.ModelAdmin):
     """Админка рецептов."""
 
     inlines = (IngredientInRecipeInline,)
-    list_display = ('id', 'name', 'author', 'text', 'image', 'cooking_time')
+    list_display = (
+        'id', 'name', 'author', 'text', 'image', 'cooking_time',
+        'count_favorite',
+    )
     search_fields = ('name', 'author', 'tags')
     list_filter = ('name', 'author', 'tags')
     empty_value_display = '-пусто-'
@@ -52,7 +57,30 @@ class RecipeAdmin(admin.ModelAdmin):
     @admin.display(description='Количество добавлений в избранное')
     def count_favorite(self, recipe):
         """Метод подсчета общего числа добавлений этого рецепта в избранное."""
-        return recipe.favorites.all().count()
+        return recipe.favorites_count
+
+    def save_model(self, request, recipe, form, change):
+        super().save_model(request, recipe, form, change)
+        schedule_renditions(recipe)
+        if not change:
+            schedule_fan_out(recipe)
+
+    @staticmethod
+    def get_amounts(recipe):
+        return dict(recipe.recipesingredients.values_list(
+            'ingredient_id', 'amount'
+        ))
+
+    def save_related(self, request, form, formsets, change):
+        """Сохраняет состав рецепта и переносит его в списки покупок."""
+        if not change:
+            return super().save_related(request, form, formsets, change)
+        recipe = form.instance
+        old_amounts = self.get_amounts(recipe)
+        super().save_related(request, form, formsets, change)
+        ShoppingListItem.objects.change_recipe(
+            recipe, old_amounts, self.get_amounts(recipe)
+        )
 
 
 @admin.register(Favorite)
@@ -82,3 +110,21 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     search_fields = ('user',)
     list_filter = ('user',)
     empty_value_display = '-пусто-'
+
+
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    """Админка материализованных списков покупок."""
+
+    list_display = ('user', 'ingredient', 'total_amount')
+    search_fields = ('user__username',)
+    list_filter = ('user',)
+
+
+@admin.register(FeedItem)
+class FeedItemAdmin(admin.ModelAdmin):
+    """Админка лент подписок."""
+
+    list_display = ('user', 'recipe')
+    search_fields = ('user__username',)
+    raw_id_fields = ('user', 'recipe')
@@ -0,0 +1,73 @@
+from collections import Counter, defaultdict
+
+from django.db.models import Count, F, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+from users.models import Subscription, User
+from .models import Favorite, Recipe, ShoppingCart
+
+# (модель со счетчиком, поле счетчика, считаемая модель, поле связи)
+COUNTERS = (
+    (Recipe, 'favorites_count', Favorite, 'recipe'),
+    (Recipe, 'in_carts_count', ShoppingCart, 'recipe'),
+    (User, 'recipes_count', Recipe, 'author'),
+    (User, 'followers_count', Subscription, 'author'),
+)
+
+
+def change_counter(model, pk, field, delta):
+    """Атомарно меняет счетчик одной строки на delta."""
+    change_counters(model, [pk], field, delta)
+
+
+def change_counters(model, pks, field, delta):
+    """Атомарно меняет счетчики строк pks на delta одним UPDATE."""
+    queryset = model.objects.filter(pk__in=pks)
+    if delta < 0:
+        queryset = queryset.filter(**{f'{field}__gte': -delta})
+    queryset.update(**{field: F(field) + delta})
+
+
+def change_counters_by(model, pks, field, sign):
+    """Меняет счетчик каждой строки на число вхождений ее pk в pks.
+
+    Строки с одинаковым изменением обновляются одним UPDATE.
+    """
+    groups = defaultdict(list)
+    for pk, count in Counter(pks).items():
+        groups[count].append(pk)
+    for count, group in groups.items():
+        change_counters(model, group, field, sign * count)
+
+
+def live_count(counted_model, relation):
+    """Подзапрос с фактическим числом связанных строк."""
+    return Coalesce(
+        Subquery(
+            counted_model.objects.filter(**{relation: OuterRef('pk')})
+            .order_by()
+            .values(relation)
+            .annotate(count=Count('pk'))
+            .values('count')
+        ),
+        0,
+    )
+
+
+def reconcile_counters(fix=True):
+    """Сверяет счетчики с фактическими данными.
+
+    Возвращает словарь {поле: число разошедшихся строк}; при fix=True
+    разошедшиеся строки исправляются одним UPDATE на счетчик.
+    """
+    drift = {}
+    for model, field, counted_model, relation in COUNTERS:
+        stale = model.objects.annotate(
+            live=live_count(counted_model, relation)
+        ).exclude(**{field: F('live')})
+        drift[f'{model._meta.model_name}.{field}'] = stale.count()
+        if fix:
+            model.objects.filter(
+                pk__in=stale.values('pk')
+            ).update(**{field: live_count(counted_model, relation)})
+    return drift
@@ -0,0 +1,86 @@
+"""Удаление рецептов и пользователей с учетом каскада одной пачкой.
+
+При удалении рецепта или пользователя Django отправляет сигналы
+удаления для каждой каскадно удаляемой строки избранного, корзины и
+подписок, и их обработчики меняли бы счетчики и списки покупок запросом
+на строку, в том числе у рецептов, которые сейчас будут удалены.
+Аргумента origin у сигналов удаления нет до Django 4.1, поэтому
+удаление помечается здесь: пока оно идет, обработчики строк ничего не
+делают, а последствия каскада учитываются заранее, числом запросов,
+не зависящим от числа строк.
+"""
+from django.db import transaction
+
+from users.models import Subscription, User
+from .counters import change_counters_by
+from .models import Favorite, Recipe, ShoppingCart, ShoppingListItem
+from .signals import bump_user_versions, cascade
+
+
+def user_ids(model, **filters):
+    return list(
+        model.objects.filter(**filters).order_by().values_list(
+            'user_id', flat=True
+        )
+    )
+
+
+def forget_recipes(recipe_ids):
+    """Убирает рецепты из списков покупок тех, у кого они в корзине."""
+    if not recipe_ids:
+        return
+    cart_users = user_ids(ShoppingCart, recipe_id__in=recipe_ids)
+    if cart_users:
+        ShoppingListItem.objects.remove_carts(
+            ShoppingCart.objects.filter(recipe_id__in=recipe_ids)
+        )
+    bump_user_versions(
+        cart_users + user_ids(Favorite, recipe_id__in=recipe_ids)
+    )
+
+
+def delete_recipes(rows, delete, using):
+    """Удаляет рецепты вызовом delete().
+
+    rows - пары (id рецепта, id автора) всех удаляемых рецептов.
+    """
+    with transaction.atomic(using=using), cascade():
+        forget_recipes([pk for pk, _ in rows])
+        change_counters_by(
+            User, [author for _, author in rows], 'recipes_count', -1
+        )
+        return delete()
+
+
+def forget_relations(model, field, users, recipe_ids):
+    """Уменьшает счетчик field рецептов, уходящих вместе с users."""
+    change_counters_by(
+        Recipe,
+        model.objects.filter(user__in=users).exclude(
+            recipe_id__in=recipe_ids
+        ).order_by().values_list('recipe_id', flat=True),
+        field, -1,
+    )
+
+
+def delete_users(users, delete):
+    """Удаляет пользователей queryset users вызовом delete()."""
+    with transaction.atomic(using=users.db), cascade():
+        pks = list(users.order_by().values_list('pk', flat=True))
+        recipe_ids = list(
+            Recipe.objects.filter(author_id__in=pks).order_by().values_list(
+                'pk', flat=True
+            )
+        )
+        forget_recipes(recipe_ids)
+        forget_relations(Favorite, 'favorites_count', pks, recipe_ids)
+        forget_relations(ShoppingCart, 'in_carts_count', pks, recipe_ids)
+        change_counters_by(
+            User,
+            Subscription.objects.filter(user_id__in=pks).exclude(
+                author_id__in=pks
+            ).order_by().values_list('author_id', flat=True),
+            'followers_count', -1,
+        )
+        bump_user_versions(user_ids(Subscription, author_id__in=pks))
+        return delete()
@@ -0,0 +1,122 @@
+"""Лента рецептов авторов, на которых подписан пользователь.
+
+Рецепт при публикации раскладывается по лентам подписчиков (FeedItem)
+в фоне, поэтому чтение ленты не соединяет подписки с рецептами: страница
+читается из FeedItem по индексу (user, -pub_date, -recipe). Авторы с
+числом подписчиков больше FEED_FANOUT_MAX_FOLLOWERS не раскладываются:
+их рецепты читаются из Recipe по индексу (-pub_date, -id) и сливаются
+с лентой при чтении (гибридная схема).
+"""
+from itertools import islice
+
+from django.conf import settings
+
+from users.models import Subscription, User
+from .models import FeedItem, Recipe
+from .tasks import run_after_commit
+
+
+def is_popular(followers_count):
+    return followers_count > settings.FEED_FANOUT_MAX_FOLLOWERS
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def add_to_feeds(user_ids, recipes):
+    """Добавляет рецепты в ленты пользователей, пропуская уже добавленные.
+
+    recipes - пары (id рецепта, дата публикации).
+    """
+    FeedItem.objects.bulk_create(
+        (
+            FeedItem(user_id=user_id, recipe_id=recipe_id, pub_date=pub_date)
+            for user_id in user_ids
+            for recipe_id, pub_date in recipes
+        ),
+        batch_size=settings.FEED_FANOUT_BATCH_SIZE,
+        ignore_conflicts=True,
+    )
+
+
+def latest_recipes(author_id):
+    """Последние рецепты автора для дозаполнения лент: (id, pub_date)."""
+    return list(
+        Recipe.objects.filter(author_id=author_id).order_by(
+            '-pub_date', '-id'
+        ).values_list('id', 'pub_date')[:settings.FEED_BACKFILL_LIMIT]
+    )
+
+
+def fan_out(recipe_id):
+    """Раскладывает рецепт по лентам подписчиков автора пачками."""
+    recipe = Recipe.objects.filter(pk=recipe_id).values(
+        'author_id', 'pub_date', 'author__followers_count'
+    ).first()
+    if recipe is None or is_popular(recipe['author__followers_count']):
+        return
+    followers = Subscription.objects.filter(
+        author_id=recipe['author_id']
+    ).values_list('user_id', flat=True).order_by('id')
+    for user_ids in batched(
+        followers.iterator(chunk_size=settings.FEED_FANOUT_BATCH_SIZE),
+        settings.FEED_FANOUT_BATCH_SIZE,
+    ):
+        add_to_feeds(user_ids, [(recipe_id, recipe['pub_date'])])
+
+
+def backfill(user_id, author_id):
+    """Добавляет в ленту последние рецепты автора после подписки."""
+    author = User.objects.filter(pk=author_id).values(
+        'followers_count'
+    ).first()
+    if author is None or is_popular(author['followers_count']):
+        return
+    if not Subscription.objects.filter(
+        user_id=user_id, author_id=author_id
+    ).exists():
+        return
+    add_to_feeds([user_id], latest_recipes(author_id))
+
+
+def remove_author(user_id, author_id):
+    """Убирает рецепты автора из ленты после отписки."""
+    FeedItem.objects.filter(
+        user_id=user_id, recipe__author_id=author_id
+    ).delete()
+
+
+def schedule_fan_out(recipe):
+    run_after_commit(fan_out, recipe.pk)
+
+
+def schedule_backfill(user_id, author_id):
+    run_after_commit(backfill, user_id, author_id)
+
+
+def feed_sources(user, recipes=None):
+    """Источники ленты: пары (queryset, сортировка).
+
+    values_list по полям сортировки дает ключи (pub_date, id рецепта) в
+    порядке убывания. Первый источник - разложенные рецепты FeedItem,
+    второй - рецепты популярных авторов из подписок, еще не попавшие в
+    ленту (автор мог стать популярным после раскладки). recipes -
+    queryset рецептов, которыми ограничить ленту, например по фильтрам.
+    """
+    items = FeedItem.objects.filter(user=user)
+    pulled = Recipe.objects.filter(
+        author__in=Subscription.objects.filter(
+            user=user,
+            author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values('author_id')
+    ).exclude(feed_items__user=user)
+    if recipes is not None:
+        items = items.filter(recipe__in=recipes.values('pk'))
+        pulled = pulled.filter(pk__in=recipes.values('pk'))
+    return (
+        (items, ('-pub_date', '-recipe_id')),
+        (pulled, ('-pub_date', '-id')),
+    )
@@ -0,0 +1,127 @@
+import logging
+import os
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageOps
+
+from .models import Recipe
+from .tasks import run_after_commit
+
+logger = logging.getLogger(__name__)
+
+RENDITIONS_DIR = 'recipes/renditions'
+FORMATS = {
+    'webp': ('WEBP', {'quality': 80, 'method': 4}),
+    'jpeg': ('JPEG', {'quality': 82, 'optimize': True, 'progressive': True}),
+}
+
+
+def renditions_dir(recipe_id):
+    return f'{RENDITIONS_DIR}/{recipe_id}'
+
+
+def rendition_name(recipe_id, source, size, extension):
+    """Имя копии в каталоге рецепта; расширение исходника входит в имя."""
+    stem = os.path.basename(source).replace('.', '_')
+    return f'{renditions_dir(recipe_id)}/{stem}_{size}.{extension}'
+
+
+def rendition_files(renditions):
+    """Имена файлов копий из Recipe.renditions."""
+    return {
+        name
+        for files in renditions.values() if isinstance(files, dict)
+        for name in files.values()
+    }
+
+
+def delete_own_files(recipe_id, names):
+    """Удаляет файлы копий, лежащие в каталоге рецепта recipe_id."""
+    prefix = f'{renditions_dir(recipe_id)}/'
+    for name in names:
+        if name.startswith(prefix):
+            default_storage.delete(name)
+
+
+def open_image(name, size):
+    """Открывает изображение, по возможности декодируя JPEG с уменьшением."""
+    with default_storage.open(name, 'rb') as file:
+        image = Image.open(file)
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.load()
+    return image.convert('RGB')
+
+
+def render(recipe_id, source):
+    """Сохраняет уменьшенные копии source во всех размерах и форматах.
+
+    Существующие файлы не перезаписываются: хранилище выбирает свободное
+    имя. Возвращает словарь {размер: {формат: имя файла в хранилище}}.
+    """
+    largest = max(settings.IMAGE_RENDITION_SIZES.values())
+    original = open_image(source, largest)
+    renditions = {}
+    for size_name, size in settings.IMAGE_RENDITION_SIZES.items():
+        image = original.copy()
+        image.thumbnail((size, size), Image.LANCZOS)
+        renditions[size_name] = {}
+        for extension, (image_format, options) in FORMATS.items():
+            buffer = BytesIO()
+            image.save(buffer, image_format, **options)
+            renditions[size_name][extension] = default_storage.save(
+                rendition_name(recipe_id, source, size_name, extension),
+                ContentFile(buffer.getvalue()),
+            )
+    return renditions
+
+
+def make_renditions(recipe_id, source):
+    """Строит копии изображения и записывает их имена в рецепт.
+
+    Запись выполняется, только если изображение рецепта не сменилось за
+    время обработки, иначе новые копии удаляются; после записи удаляются
+    прежние копии рецепта. Сигналы при update не отправляются, поэтому
+    поколение данных рецептов меняется явно.
+    """
+    from .signals import bump_recipes_version
+
+    previous = Recipe.objects.filter(pk=recipe_id).values_list(
+        'renditions', flat=True
+    ).first() or {}
+    try:
+        renditions = render(recipe_id, source)
+    except OSError as error:
+        logger.warning('Не удалось обработать изображение %s: %s',
+                       source, error)
+        return False
+    updated = Recipe.objects.filter(pk=recipe_id, image=source).update(
+        renditions={'source': source, **renditions}
+    )
+    if updated:
+        bump_recipes_version()
+        stale = rendition_files(previous) - rendition_files(renditions)
+    else:
+        stale = rendition_files(renditions)
+    delete_own_files(recipe_id, stale)
+    return bool(updated)
+
+
+def renditions_outdated(recipe):
+    return (
+        bool(recipe.image)
+        and recipe.renditions.get('source') != recipe.image.name
+    )
+
+
+def schedule_renditions(recipe):
+    """Ставит построение копий в очередь после фиксации транзакции.
+
+    Ничего не делает, если копии текущего изображения уже построены.
+    """
+    if not renditions_outdated(recipe):
+        return
+    run_after_commit(make_renditions, recipe.pk, recipe.image.name)
@@ -0,0 +1,34 @@
+from django.core.management.base import BaseCommand
+
+from recipes.images import make_renditions, renditions_outdated
+from recipes.models import Recipe
+
+
+class Command(BaseCommand):
+    """Построение уменьшенных копий изображений рецептов."""
+
+    help = (
+        'Строит копии изображений рецептов, у которых их еще нет, '
+        'например после import_recipes или смены размеров.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Перестроить копии всех рецептов.',
+        )
+
+    def handle(self, *args, **options):
+        built = failed = 0
+        recipes = Recipe.objects.only('id', 'image', 'renditions')
+        for recipe in recipes.iterator():
+            if not (options['force'] and recipe.image
+                    or renditions_outdated(recipe)):
+                continue
+            if make_renditions(recipe.id, recipe.image.name):
+                built += 1
+            else:
+                failed += 1
+        self.stdout.write(self.style.SUCCESS(
+            f'Построено: {built}, с ошибками: {failed}.'
+        ))
@@ -0,0 +1,103 @@
+import json
+import os
+import shutil
+import sys
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Prefetch
+
+from recipes.models import IngredientInRecipe, Recipe
+
+
+def recipe_to_dict(recipe):
+    return {
+        'id': recipe.id,
+        'author': recipe.author.email,
+        'name': recipe.name,
+        'text': recipe.text,
+        'cooking_time': recipe.cooking_time,
+        'pub_date': recipe.pub_date.isoformat(),
+        'image': recipe.image.name,
+        'tags': [tag.slug for tag in recipe.tags.all()],
+        'ingredients': [
+            {
+                'name': item.ingredient.name,
+                'measurement_unit': item.ingredient.measurement_unit,
+                'amount': item.amount,
+            }
+            for item in recipe.recipesingredients.all()
+        ],
+    }
+
+
+class Command(BaseCommand):
+    """Выгрузка рецептов в формате JSON Lines."""
+
+    help = (
+        'Выгружает рецепты по одному JSON-объекту на строку, '
+        'при --media копирует файлы изображений.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', help='Файл выгрузки, "-" для вывода в stdout.'
+        )
+        parser.add_argument(
+            '--media',
+            help='Каталог, куда скопировать изображения рецептов.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Сколько рецептов читать из БД за раз.',
+        )
+
+    def handle(self, *args, **options):
+        if options['path'] == '-':
+            exported = self.export(sys.stdout, options)
+        else:
+            with open(options['path'], 'w', encoding='utf-8') as file:
+                exported = self.export(file, options)
+        self.stderr.write(f'Выгружено рецептов: {exported}.')
+
+    def export(self, file, options):
+        exported = 0
+        for recipes in self.iter_chunks(options['chunk_size']):
+            for recipe in recipes:
+                file.write(
+                    json.dumps(recipe_to_dict(recipe), ensure_ascii=False)
+                    + '\n'
+                )
+                if options['media']:
+                    self.copy_image(recipe.image.name, options['media'])
+            exported += len(recipes)
+        return exported
+
+    @staticmethod
+    def iter_chunks(chunk_size):
+        """Рецепты пачками по диапазонам id, каждая пачка - 4 запроса."""
+        queryset = Recipe.objects.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipesingredients',
+                queryset=IngredientInRecipe.objects.select_related(
+                    'ingredient'
+                ),
+            ),
+        ).order_by('id')
+        last_id = 0
+        while recipes := list(
+            queryset.filter(id__gt=last_id)[:chunk_size]
+        ):
+            yield recipes
+            last_id = recipes[-1].id
+
+    @staticmethod
+    def copy_image(name, media_dir):
+        if not name or not default_storage.exists(name):
+            return
+        destination = os.path.join(media_dir, name)
+        os.makedirs(os.path.dirname(destination), exist_ok=True)
+        with default_storage.open(name, 'rb') as source:
+            with open(destination, 'wb') as target:
+                shutil.copyfileobj(source, target)
@@ -0,0 +1,213 @@
+import json
+import os
+from collections import Counter
+from hashlib import sha256
+from itertools import islice
+
+from django.core.files import File
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.utils.dateparse import parse_datetime
+
+from recipes.counters import change_counter
+from recipes.models import (ImportCheckpoint, Ingredient, IngredientInRecipe,
+                            Recipe, Tag)
+from recipes.signals import bump_recipes_version
+from users.models import User
+
+
+class Command(BaseCommand):
+    """Загрузка рецептов из выгрузки export_recipes."""
+
+    help = (
+        'Загружает рецепты из файла JSON Lines пачками, каждая пачка в '
+        'своей транзакции. Номер последней загруженной строки пишется в '
+        'БД в той же транзакции, повторный запуск продолжает с него.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='Файл выгрузки export_recipes.')
+        parser.add_argument(
+            '--media',
+            help='Каталог с изображениями, выгруженными export_recipes.',
+        )
+        parser.add_argument(
+            '--chunk-size', type=int, default=500,
+            help='Сколько рецептов загружать в одной транзакции.',
+        )
+        parser.add_argument(
+            '--checkpoint',
+            help=(
+                'Имя контрольной точки, по умолчанию абсолютный путь '
+                'к файлу выгрузки.'
+            ),
+        )
+        parser.add_argument(
+            '--default-author',
+            help='Email автора для рецептов, чьих авторов нет в БД.',
+        )
+
+    def handle(self, *args, **options):
+        self.options = options
+        self.images = {}
+        checkpoint = options['checkpoint'] or os.path.abspath(
+            options['path']
+        )
+        done = ImportCheckpoint.objects.filter(
+            name=checkpoint
+        ).values_list('line_number', flat=True).first() or 0
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {
+            (name, measurement_unit): pk
+            for pk, name, measurement_unit in Ingredient.objects.values_list(
+                'id', 'name', 'measurement_unit'
+            )
+        }
+        self.default_author = None
+        if options['default_author']:
+            self.default_author = User.objects.filter(
+                email=options['default_author']
+            ).values_list('id', flat=True).first()
+            if self.default_author is None:
+                raise CommandError(
+                    f'Пользователь {options["default_author"]} не найден.'
+                )
+        imported = 0
+        with open(options['path'], encoding='utf-8') as file:
+            lines = islice(enumerate(file, start=1), done, None)
+            while chunk := list(islice(lines, options['chunk_size'])):
+                with transaction.atomic():
+                    imported += self.import_chunk(chunk)
+                    done = chunk[-1][0]
+                    ImportCheckpoint.objects.update_or_create(
+                        name=checkpoint, defaults={'line_number': done}
+                    )
+        if imported:
+            bump_recipes_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Загружено рецептов: {imported}, обработано строк: {done}.'
+        ))
+
+    def parse(self, chunk):
+        records = []
+        for number, line in chunk:
+            if not line.strip():
+                continue
+            try:
+                records.append((number, json.loads(line)))
+            except ValueError:
+                raise CommandError(f'Строка {number}: некорректный JSON.')
+        return records
+
+    def import_chunk(self, chunk):
+        records = self.parse(chunk)
+        authors = dict(
+            User.objects.filter(
+                email__in={data['author'] for _, data in records}
+            ).values_list('email', 'id')
+        )
+        recipes, tags, ingredients = [], [], []
+        for number, data in records:
+            try:
+                recipes.append(self.build_recipe(data, authors))
+                tags.append([self.tags[slug] for slug in data['tags']])
+                ingredients.append([
+                    (
+                        self.ingredients[
+                            (item['name'], item['measurement_unit'])
+                        ],
+                        item['amount'],
+                    )
+                    for item in data['ingredients']
+                ])
+            except KeyError as error:
+                raise CommandError(
+                    f'Строка {number}: не найдено {error.args[0]!r}.'
+                )
+        self.insert(recipes)
+        Recipe.tags.through.objects.bulk_create(
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag)
+            for recipe, recipe_tags in zip(recipes, tags)
+            for tag in recipe_tags
+        )
+        IngredientInRecipe.objects.bulk_create(
+            IngredientInRecipe(
+                recipe_id=recipe.id, ingredient_id=ingredient, amount=amount
+            )
+            for recipe, recipe_ingredients in zip(recipes, ingredients)
+            for ingredient, amount in recipe_ingredients
+        )
+        for author, count in Counter(
+            recipe.author_id for recipe in recipes
+        ).items():
+            change_counter(User, author, 'recipes_count', count)
+        return len(recipes)
+
+    def build_recipe(self, data, authors):
+        author = authors.get(data['author'], self.default_author)
+        if author is None:
+            raise KeyError(data['author'])
+        return Recipe(
+            author_id=author,
+            name=data['name'],
+            text=data['text'],
+            cooking_time=data['cooking_time'],
+            pub_date=parse_datetime(data['pub_date']),
+            image=self.import_image(data['image']),
+        )
+
+    def import_image(self, name):
+        """Копирует файл изображения в хранилище без перекодирования.
+
+        Файл с тем же именем переиспользуется, только если совпадает
+        содержимое; иначе хранилище выбирает свободное имя.
+        """
+        media = self.options['media']
+        if not media or not name:
+            return name
+        if name not in self.images:
+            path = os.path.join(media, name)
+            if not os.path.exists(path):
+                raise KeyError(path)
+            with open(path, 'rb') as file:
+                self.images[name] = (
+                    name if self.same_file(name, File(file))
+                    else default_storage.save(name, File(file))
+                )
+        return self.images[name]
+
+    @staticmethod
+    def digest(file):
+        hasher = sha256()
+        for chunk in file.chunks():
+            hasher.update(chunk)
+        return hasher.digest()
+
+    def same_file(self, name, file):
+        """Файл хранилища name совпадает с file по размеру и SHA-256."""
+        if (
+            not default_storage.exists(name)
+            or default_storage.size(name) != file.size
+        ):
+            return False
+        with default_storage.open(name, 'rb') as stored:
+            return self.digest(stored) == self.digest(file)
+
+    @staticmethod
+    def insert(recipes):
+        """Вставляет рецепты, сохраняя исходные даты публикации.
+
+        bulk_create проставляет pub_date (auto_now_add), поэтому даты
+        восстанавливаются одним bulk_update. СУБД, которые не возвращают
+        id из пакетной вставки (SQLite), получают построчные raw-вставки.
+        """
+        if not connection.features.can_return_rows_from_bulk_insert:
+            for recipe in recipes:
+                recipe.save_base(raw=True, force_insert=True)
+            return
+        pub_dates = [recipe.pub_date for recipe in recipes]
+        Recipe.objects.bulk_create(recipes)
+        for recipe, pub_date in zip(recipes, pub_dates):
+            recipe.pub_date = pub_date
+        Recipe.objects.bulk_update(recipes, ['pub_date'])
@@ -1,30 +1,156 @@
+import csv
 import json
 import os
+from io import StringIO
+from itertools import chain, islice
+from time import monotonic
 
-from django.core.management.base import BaseCommand
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
 
-from foodgram.settings import DATA_FILES_DIR
 from recipes.models import Ingredient
+from recipes.signals import bump_ingredients_version
+
+DEFAULT_FILE_NAME = 'ingredients.json'
+READ_CHUNK_SIZE = 64 * 1024
+SEPARATORS = ' \t\r\n,'
+
+
+def skip_separators(buffer, position):
+    while position < len(buffer) and buffer[position] in SEPARATORS:
+        position += 1
+    return position
+
+
+def iter_json_array(file):
+    """Потоково разбирает JSON-массив объектов, не читая файл целиком."""
+    decoder = json.JSONDecoder()
+    head = file.read(READ_CHUNK_SIZE).lstrip()
+    if not head.startswith('['):
+        raise ValueError('Ожидается JSON-массив.')
+    chunks = chain([head[1:]], iter(lambda: file.read(READ_CHUNK_SIZE), ''))
+    buffer, position = '', 0
+    for chunk in chunks:
+        buffer = buffer[position:] + chunk
+        position = skip_separators(buffer, 0)
+        while position < len(buffer):
+            if buffer[position] == ']':
+                return
+            try:
+                item, position = decoder.raw_decode(buffer, position)
+            except json.JSONDecodeError:
+                break
+            yield item
+            position = skip_separators(buffer, position)
+    raise ValueError('Файл оборван.')
+
+
+def iter_ingredients(path):
+    """Пары (название, единица измерения) из JSON- или CSV-файла."""
+    with open(path, encoding='utf-8', newline='') as file:
+        if path.endswith('.csv'):
+            for row in csv.reader(file):
+                if row:
+                    yield row[0].strip(), row[1].strip()
+        else:
+            for item in iter_json_array(file):
+                yield item['name'].strip(), item['measurement_unit'].strip()
+
+
+def unique(ingredients, stats):
+    seen = set()
+    for ingredient in ingredients:
+        stats['read'] += 1
+        if ingredient not in seen:
+            seen.add(ingredient)
+            yield ingredient
 
 
 class Command(BaseCommand):
-    """Загрузчик в БД из JSON файла."""
+    """Загрузчик ингредиентов в БД из JSON или CSV файла."""
+
+    help = (
+        'Загружает ингредиенты пачками, пропуская уже существующие. '
+        'Повторный запуск безопасен.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'path', nargs='?',
+            default=os.path.join(settings.DATA_FILES_DIR, DEFAULT_FILE_NAME),
+            help='JSON или CSV файл, по умолчанию data/ingredients.json.',
+        )
+        parser.add_argument(
+            '--batch-size', type=int, default=1000,
+            help='Размер пачки для bulk_create.',
+        )
+        parser.add_argument(
+            '--copy', action='store_true',
+            help='Загрузить через COPY и INSERT ... ON CONFLICT (PostgreSQL).',
+        )
 
     def handle(self, *args, **options):
-        file_name = 'ingredients.json'
-        json_path = os.path.join(DATA_FILES_DIR, file_name)
+        path = options['path']
+        if not os.path.exists(path):
+            raise CommandError(f'Файл {path} не найден.')
+        stats = {'read': 0}
+        ingredients = unique(iter_ingredients(path), stats)
+        started = monotonic()
         try:
-            with open(json_path, 'rb') as file:
-                data = json.load(file)
-            for ingredient in data:
-                obj, created = Ingredient.objects.get_or_create(
-                    name=ingredient["name"],
-                    measurement_unit=ingredient["measurement_unit"]
-                )
-                if not created:
-                    print(
-                        f'Ингридиент {ingredient["name"]} уже есть в базе')
-            print('finished')
-        except FileNotFoundError:
-            print(f'Файл {file_name} не найден.')
-            return
+            with transaction.atomic():
+                if options['copy']:
+                    inserted = self.copy(ingredients)
+                else:
+                    inserted = self.bulk_create(
+                        ingredients, options['batch_size']
+                    )
+        except (ValueError, KeyError, IndexError) as error:
+            raise CommandError(f'Некорректный файл {path}: {error!r}')
+        elapsed = monotonic() - started
+        if inserted:
+            bump_ingredients_version()
+        self.stdout.write(self.style.SUCCESS(
+            f'Прочитано: {stats["read"]}, добавлено: {inserted}, '
+            f'пропущено: {stats["read"] - inserted}, '
+            f'{stats["read"] / max(elapsed, 1e-6):.0f} строк/с.'
+        ))
+
+    @staticmethod
+    def bulk_create(ingredients, batch_size):
+        before = Ingredient.objects.count()
+        while batch := list(islice(ingredients, batch_size)):
+            Ingredient.objects.bulk_create(
+                (
+                    Ingredient(name=name, measurement_unit=measurement_unit)
+                    for name, measurement_unit in batch
+                ),
+                ignore_conflicts=True,
+            )
+        return Ingredient.objects.count() - before
+
+    @staticmethod
+    def copy(ingredients):
+        if connection.vendor != 'postgresql':
+            raise CommandError('--copy поддерживается только в PostgreSQL.')
+        data = StringIO()
+        csv.writer(data).writerows(ingredients)
+        data.seek(0)
+        table = Ingredient._meta.db_table
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'CREATE TEMP TABLE ingredients_staging '
+                '(name varchar(200), measurement_unit varchar(200)) '
+                'ON COMMIT DROP'
+            )
+            cursor.copy_expert(
+                'COPY ingredients_staging (name, measurement_unit) '
+                'FROM STDIN WITH (FORMAT csv)',
+                data,
+            )
+            cursor.execute(
+                f'INSERT INTO {table} (name, measurement_unit) '
+                'SELECT name, measurement_unit FROM ingredients_staging '
+                'ON CONFLICT (name, measurement_unit) DO NOTHING'
+            )
+            return cursor.rowcount
@@ -0,0 +1,39 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from recipes.feed import add_to_feeds, latest_recipes
+from recipes.models import FeedItem
+from users.models import Subscription, User
+
+
+class Command(BaseCommand):
+    """Пересборка лент подписок."""
+
+    help = (
+        'Заново раскладывает последние рецепты авторов по лентам '
+        'подписчиков, например после import_recipes или потери фоновых '
+        'задач при перезапуске. Авторы с числом подписчиков больше '
+        'FEED_FANOUT_MAX_FOLLOWERS пропускаются: их рецепты читаются '
+        'при запросе ленты.'
+    )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        FeedItem.objects.all().delete()
+        authors = User.objects.filter(
+            followers_count__gt=0,
+            followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS,
+        ).values_list('id', flat=True)
+        for author_id in authors:
+            recipes = latest_recipes(author_id)
+            if recipes:
+                add_to_feeds(
+                    Subscription.objects.filter(
+                        author_id=author_id
+                    ).values_list('user_id', flat=True),
+                    recipes,
+                )
+        self.stdout.write(self.style.SUCCESS(
+            f'Строк в лентах: {FeedItem.objects.count()}.'
+        ))
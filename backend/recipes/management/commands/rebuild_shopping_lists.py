@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.models import ShoppingListItem
+
+
+class Command(BaseCommand):
+    """Сверка и пересборка материализованных списков покупок."""
+
+    help = (
+        'Сверяет таблицу ShoppingListItem с корзинами пользователей '
+        'и пересобирает ее при расхождениях.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить, завершиться с ошибкой при расхождениях.',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        live = ShoppingListItem.objects.live_totals()
+        stored = ShoppingListItem.objects.select_for_update().stored_totals()
+        drift = [
+            key for key in live.keys() | stored.keys()
+            if live.get(key) != stored.get(key)
+        ]
+        self.stdout.write(
+            f'Строк в списках покупок: {len(stored)}, '
+            f'ожидается: {len(live)}, расхождений: {len(drift)}.'
+        )
+        if not drift:
+            return
+        if options['check']:
+            raise CommandError('Списки покупок расходятся с корзинами.')
+        ShoppingListItem.objects.all().delete()
+        ShoppingListItem.objects.bulk_create(
+            (
+                ShoppingListItem(
+                    user_id=user, ingredient_id=ingredient,
+                    total_amount=total_amount,
+                )
+                for (user, ingredient), total_amount in live.items()
+            ),
+            batch_size=1000,
+        )
+        self.stdout.write(self.style.SUCCESS('Списки покупок пересобраны.'))
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from recipes.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    """Сверка и исправление денормализованных счетчиков."""
+
+    help = (
+        'Пересчитывает счетчики избранного, списков покупок, рецептов '
+        'и подписчиков и исправляет расхождения.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только сверить, завершиться с ошибкой при расхождениях.',
+        )
+
+    @transaction.atomic
+    def handle(self, *args, **options):
+        drift = reconcile_counters(fix=not options['check'])
+        for counter, count in drift.items():
+            self.stdout.write(f'{counter}: расхождений {count}')
+        if options['check'] and any(drift.values()):
+            raise CommandError('Счетчики расходятся с данными.')
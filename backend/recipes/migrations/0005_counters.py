@@ -0,0 +1,46 @@
+# Generated by Django 3.2 on 2026-10-18 16:46
+
+from django.db import migrations, models
+from django.db.models.functions import Coalesce
+
+COUNTERS = (
+    ('recipes', 'Recipe', 'favorites_count', 'recipes', 'Favorite', 'recipe'),
+    ('recipes', 'Recipe', 'in_carts_count',
+     'recipes', 'ShoppingCart', 'recipe'),
+    ('users', 'User', 'recipes_count', 'recipes', 'Recipe', 'author'),
+    ('users', 'User', 'followers_count', 'users', 'Subscription', 'author'),
+)
+
+
+def fill_counters(apps, schema_editor):
+    for app, model, field, counted_app, counted_model, relation in COUNTERS:
+        counted = apps.get_model(counted_app, counted_model).objects.filter(
+            **{relation: models.OuterRef('pk')}
+        ).order_by().values(relation).annotate(
+            count=models.Count('pk')
+        ).values('count')
+        apps.get_model(app, model).objects.update(
+            **{field: Coalesce(models.Subquery(counted), 0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0004_shoppinglistitem'),
+        ('users', '0002_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в избранное'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='in_carts_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество добавлений в списки покупок'),
+        ),
+        migrations.RunPython(fill_counters, migrations.RunPython.noop),
+    ]
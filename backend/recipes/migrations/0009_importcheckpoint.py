@@ -0,0 +1,25 @@
+# Generated by Django 3.2 on 2026-10-18 17:51
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0008_feeditem'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='Абсолютный путь к файлу или имя из --checkpoint.', max_length=255, unique=True, verbose_name='Выгрузка')),
+                ('line_number', models.PositiveIntegerField(default=0, verbose_name='Загружено строк')),
+            ],
+            options={
+                'verbose_name': 'Контрольная точка загрузки',
+                'verbose_name_plural': 'Контрольные точки загрузки',
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+from django.db import migrations
+
+OLD_INDEX_NAME = 'recipes_ingredient_name_trgm'
+INDEX_NAME = 'recipes_ingredient_search_trgm'
+
+
+def create_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {OLD_INDEX_NAME}')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {INDEX_NAME} ON recipes_ingredient '
+        "USING gin (REPLACE(LOWER(name), 'ё', 'е') gin_trgm_ops)"
+    )
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute(f'DROP INDEX IF EXISTS {INDEX_NAME}')
+    schema_editor.execute(
+        f'CREATE INDEX IF NOT EXISTS {OLD_INDEX_NAME} '
+        'ON recipes_ingredient USING gin (UPPER(name::text) gin_trgm_ops)'
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recipes', '0009_importcheckpoint'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -1,11 +1,21 @@
+from functools import partial
+
 from colorfield.fields import ColorField
 from django.core.validators import MinValueValidator, MaxValueValidator
-from django.db import models
+from django.db import models, router, transaction
 from django.contrib.auth import get_user_model
 from django.db.models import (
+    Case,
     CharField,
+    F,
     Model,
+    OuterRef,
+    Subquery,
+    Sum,
+    Value,
+    When,
 )
+from django.db.models.functions import Coalesce, Greatest
 MINIMAL_INGREDIENST_AMOUNT = 1
 MAX_INGREDIENTS_AMOUNT = 50
 MINIMAL_COOKING_TIME = 1
@@ -66,6 +76,18 @@ class Ingredient(Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
+class RecipeQuerySet(models.QuerySet):
+
+    def delete(self):
+        """Удаляет рецепты, учитывая каскад одной пачкой (recipes.deletion)."""
+        from .deletion import delete_recipes
+        with transaction.atomic(using=self.db):
+            return delete_recipes(
+                list(self.order_by().values_list('pk', 'author_id')),
+                super().delete, self.db,
+            )
+
+
 class Recipe(Model):
     """Модель для рецептов."""
     author = models.ForeignKey(
@@ -114,15 +136,45 @@ class Recipe(Model):
         auto_now_add=True,
         verbose_name='Дата создания рецепта',
     )
+    favorites_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество добавлений в избранное',
+    )
+    in_carts_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество добавлений в списки покупок',
+    )
+    renditions = models.JSONField(
+        default=dict,
+        editable=False,
+        verbose_name='Уменьшенные копии изображения',
+    )
+
+    objects = RecipeQuerySet.as_manager()
 
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_id_idx'
+            ),
+        ]
 
     def __str__(self) -> str:
         return f'{self.name} - {self.author}'
 
+    def delete(self, using=None, keep_parents=False):
+        from .deletion import delete_recipes
+        using = using or router.db_for_write(Recipe, instance=self)
+        return delete_recipes(
+            [(self.pk, self.author_id)],
+            partial(super().delete, using, keep_parents), using,
+        )
+
 
 class IngredientInRecipe(models.Model):
     """Модель количества ингредиентов в рецепте."""
@@ -226,3 +278,242 @@ class ShoppingCart(models.Model):
                 fields=['user', 'recipe'], name='unique_shopping_cart'
             )
         ]
+
+
+class ShoppingListItemQuerySet(models.QuerySet):
+    """Операции над материализованными списками покупок."""
+
+    def change_amounts(self, user_ids, amounts):
+        """Прибавляет к спискам покупок пользователей количества ингредиентов.
+
+        amounts - словарь {id ингредиента: изменение количества}, изменения
+        могут быть отрицательными. Строки с нулевым количеством удаляются.
+        """
+        amounts = {
+            ingredient: amount for ingredient, amount in amounts.items()
+            if amount
+        }
+        if not amounts:
+            return
+        user_ids = list(user_ids)
+        if not user_ids:
+            return
+        self.bulk_create(
+            [
+                ShoppingListItem(
+                    user_id=user_id, ingredient_id=ingredient, total_amount=0
+                )
+                for user_id in user_ids
+                for ingredient, amount in amounts.items()
+                if amount > 0
+            ],
+            ignore_conflicts=True,
+        )
+        items = self.filter(user_id__in=user_ids, ingredient_id__in=amounts)
+        items.update(
+            total_amount=Greatest(
+                F('total_amount') + Case(
+                    *[
+                        When(ingredient_id=ingredient, then=Value(amount))
+                        for ingredient, amount in amounts.items()
+                    ],
+                    output_field=models.IntegerField(),
+                ),
+                0,
+            )
+        )
+        items.filter(total_amount=0).delete()
+
+    def change_recipe(self, recipe, old_amounts, amounts):
+        """Переносит изменение состава рецепта в списки покупок.
+
+        old_amounts и amounts - прежний и новый состав рецепта
+        {id ингредиента: количество}.
+        """
+        self.change_amounts(
+            recipe.shoppingcart.values_list('user_id', flat=True),
+            {
+                ingredient: (
+                    amounts.get(ingredient, 0)
+                    - old_amounts.get(ingredient, 0)
+                )
+                for ingredient in amounts.keys() | old_amounts.keys()
+            },
+        )
+
+    def add_recipe(self, user_ids, recipe_id, sign=1):
+        """Добавляет (sign=1) или вычитает (sign=-1) ингредиенты рецепта."""
+        self.add_recipes(user_ids, [recipe_id], sign)
+
+    def add_recipes(self, user_ids, recipe_ids, sign=1):
+        """То же для нескольких рецептов, одним запросом к их составу."""
+        amounts = IngredientInRecipe.objects.filter(
+            recipe_id__in=recipe_ids
+        ).values('ingredient_id').annotate(
+            total=Sum('amount')
+        ).values_list('ingredient_id', 'total').order_by()
+        self.change_amounts(
+            user_ids,
+            {ingredient: sign * amount for ingredient, amount in amounts},
+        )
+
+    def remove_carts(self, carts):
+        """Вычитает рецепты корзин carts из списков покупок их владельцев.
+
+        Один UPDATE на все корзины: из каждой строки списка вычитается
+        количество ингредиента в рецептах корзин ее пользователя.
+        """
+        removed = carts.filter(
+            user=OuterRef('user'),
+            recipe__recipesingredients__ingredient=OuterRef('ingredient'),
+        ).order_by().values('user').annotate(
+            total=Sum('recipe__recipesingredients__amount')
+        ).values('total')
+        items = self.filter(
+            user__in=carts.values('user'),
+            ingredient__in=IngredientInRecipe.objects.filter(
+                recipe__in=carts.values('recipe')
+            ).values('ingredient'),
+        )
+        items.update(
+            total_amount=Greatest(
+                F('total_amount') - Coalesce(
+                    Subquery(removed), 0,
+                    output_field=models.IntegerField(),
+                ),
+                0,
+            )
+        )
+        items.filter(total_amount=0).delete()
+
+    def stored_totals(self):
+        return {
+            (user, ingredient): total_amount
+            for user, ingredient, total_amount in self.values_list(
+                'user_id', 'ingredient_id', 'total_amount'
+            )
+        }
+
+    def live_totals(self):
+        """Списки покупок, посчитанные по корзинам и рецептам."""
+        return {
+            (item['user'], item['ingredient']): item['total_amount']
+            for item in IngredientInRecipe.objects.filter(
+                recipe__shoppingcart__isnull=False
+            ).values(
+                'ingredient', user=F('recipe__shoppingcart__user'),
+            ).annotate(
+                total_amount=Sum('amount'),
+            ).values('user', 'ingredient', 'total_amount')
+        }
+
+
+class ShoppingListItem(models.Model):
+    """Материализованный список покупок пользователя.
+
+    Обновляется при изменении корзины и состава рецептов в ней,
+    пересобирается командой rebuild_shopping_lists.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name='Ингредиент',
+    )
+    total_amount = models.PositiveIntegerField(
+        verbose_name='Общее количество',
+    )
+
+    objects = ShoppingListItemQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = 'Ингредиент в списке покупок'
+        verbose_name_plural = 'Ингредиенты в списках покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='unique_shopping_list_item',
+            )
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user} - {self.ingredient}, {self.total_amount}'
+
+
+class FeedItem(models.Model):
+    """Рецепт в ленте подписок пользователя.
+
+    Заполняется при публикации рецепта (fan-out на подписчиков) и при
+    подписке на автора, пересобирается командой rebuild_feeds. Рецепты
+    авторов с числом подписчиков больше FEED_FANOUT_MAX_FOLLOWERS сюда
+    не попадают и читаются из Recipe при запросе ленты.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Пользователь',
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='feed_items',
+        verbose_name='Рецепт',
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата создания рецепта',
+        help_text='Копия Recipe.pub_date для чтения ленты по индексу.',
+    )
+
+    class Meta:
+        verbose_name = 'Рецепт в ленте'
+        verbose_name_plural = 'Ленты подписок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'], name='unique_feed_item'
+            )
+        ]
+        indexes = [
+            models.Index(
+                fields=['user', '-pub_date', '-recipe'],
+                name='feed_item_user_pub_date_idx',
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f'{self.user} - {self.recipe}'
+
+
+class ImportCheckpoint(models.Model):
+    """Контрольная точка команды import_recipes.
+
+    Номер последней загруженной строки выгрузки пишется в той же
+    транзакции, что и пачка рецептов, поэтому после сбоя повторный
+    запуск не загружает пачку второй раз.
+    """
+
+    name = models.CharField(
+        max_length=255,
+        unique=True,
+        verbose_name='Выгрузка',
+        help_text='Абсолютный путь к файлу или имя из --checkpoint.',
+    )
+    line_number = models.PositiveIntegerField(
+        default=0,
+        verbose_name='Загружено строк',
+    )
+
+    class Meta:
+        verbose_name = 'Контрольная точка загрузки'
+        verbose_name_plural = 'Контрольные точки загрузки'
+
+    def __str__(self) -> str:
+        return f'{self.name}: {self.line_number}'
@@ -0,0 +1,179 @@
+"""Избранное, корзина и подписки: добавление и удаление одним запросом.
+
+Уникальность связи проверяет UniqueConstraint в БД: строки вставляются
+через INSERT ... ON CONFLICT DO NOTHING и удаляются одним DELETE, а
+RETURNING сообщает, какие связи действительно изменились. Так повторные
+и одновременные нажатия не приводят ни к ошибкам, ни к двойному учету.
+
+Эти запросы не отправляют сигналы, поэтому счетчики, списки покупок,
+ленты подписок и версии данных пользователя поддерживаются здесь явно,
+одним запросом на всю пачку.
+"""
+from django.db import connection, transaction
+
+from users.models import Subscription, User
+from .counters import change_counters
+from .feed import remove_author, schedule_backfill
+from .models import Favorite, Recipe, ShoppingCart, ShoppingListItem
+from .signals import bump_user_version
+
+ADDED = 'added'
+REMOVED = 'removed'
+ALREADY_ADDED = 'already_added'
+NOT_ADDED = 'not_added'
+NOT_FOUND = 'not_found'
+
+COUNTER_FIELDS = {
+    Favorite: 'favorites_count',
+    ShoppingCart: 'in_carts_count',
+}
+
+
+def get_columns(model, target_field):
+    """Таблица связи, ее колонки user и target, таблица и pk цели."""
+    quote = connection.ops.quote_name
+    meta = model._meta
+    field = meta.get_field(target_field)
+    target = field.related_model._meta
+    return (
+        quote(meta.db_table),
+        quote(meta.get_field('user').column),
+        quote(field.column),
+        quote(target.db_table),
+        quote(target.pk.column),
+    )
+
+
+def link(model, user_id, target_field, target_ids):
+    """Связывает пользователя с существующими объектами, один INSERT.
+
+    Несуществующие и уже связанные id пропускаются. Возвращает множество
+    id, связь с которыми создана этим запросом.
+    """
+    if not target_ids:
+        return set()
+    table, user, target, target_table, target_pk = get_columns(
+        model, target_field
+    )
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'INSERT INTO {table} ({user}, {target}) '
+            f'SELECT %s, {target_pk} FROM {target_table} '
+            f'WHERE {target_pk} IN ({placeholders}) '
+            f'ON CONFLICT DO NOTHING RETURNING {target}',
+            [user_id, *target_ids],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def unlink(model, user_id, target_field, target_ids):
+    """Удаляет связи пользователя с объектами, один DELETE.
+
+    Возвращает множество id, связь с которыми удалена этим запросом.
+    """
+    if not target_ids:
+        return set()
+    table, user, target, _, _ = get_columns(model, target_field)
+    placeholders = ', '.join(['%s'] * len(target_ids))
+    with connection.cursor() as cursor:
+        cursor.execute(
+            f'DELETE FROM {table} '
+            f'WHERE {user} = %s AND {target} IN ({placeholders}) '
+            f'RETURNING {target}',
+            [user_id, *target_ids],
+        )
+        return {row[0] for row in cursor.fetchall()}
+
+
+def recipes_changed(model, user_id, recipe_ids, sign):
+    """То же, что сигналы сохранения и удаления, для всей пачки рецептов."""
+    if not recipe_ids:
+        return
+    change_counters(Recipe, recipe_ids, COUNTER_FIELDS[model], sign)
+    if model is ShoppingCart:
+        ShoppingListItem.objects.add_recipes([user_id], recipe_ids, sign)
+    bump_user_version(user_id)
+
+
+def results(recipe_ids, changed, done, skipped):
+    """Итог по каждому id: done, skipped или not_found.
+
+    Существование рецептов проверяется, только если изменились не все.
+    """
+    rest = [recipe_id for recipe_id in recipe_ids if recipe_id not in changed]
+    found = set(
+        Recipe.objects.filter(pk__in=rest).values_list('pk', flat=True)
+    ) if rest else set()
+    return {
+        recipe_id: (
+            done if recipe_id in changed
+            else skipped if recipe_id in found
+            else NOT_FOUND
+        )
+        for recipe_id in recipe_ids
+    }
+
+
+@transaction.atomic
+def add_recipes(model, user_id, recipe_ids):
+    """Добавляет рецепты в избранное или корзину пользователя.
+
+    Возвращает {id рецепта: added | already_added | not_found}.
+    """
+    added = link(model, user_id, 'recipe', recipe_ids)
+    recipes_changed(model, user_id, added, 1)
+    return results(recipe_ids, added, ADDED, ALREADY_ADDED)
+
+
+@transaction.atomic
+def remove_recipes(model, user_id, recipe_ids):
+    """Убирает рецепты из избранного или корзины пользователя.
+
+    Возвращает {id рецепта: removed | not_added | not_found}.
+    """
+    removed = unlink(model, user_id, 'recipe', recipe_ids)
+    recipes_changed(model, user_id, removed, -1)
+    return results(recipe_ids, removed, REMOVED, NOT_ADDED)
+
+
+@transaction.atomic
+def add_recipe(model, user_id, recipe_id):
+    """Добавляет один рецепт; False, если он уже был добавлен."""
+    added = link(model, user_id, 'recipe', [recipe_id])
+    recipes_changed(model, user_id, added, 1)
+    return bool(added)
+
+
+@transaction.atomic
+def remove_recipe(model, user_id, recipe_id):
+    """Убирает один рецепт; False, если его не было."""
+    removed = unlink(model, user_id, 'recipe', [recipe_id])
+    recipes_changed(model, user_id, removed, -1)
+    return bool(removed)
+
+
+@transaction.atomic
+def subscribe(user_id, author_id):
+    """Подписывает на автора; False, если подписка уже есть.
+
+    Несуществующий автор тоже дает False, его отличают отдельным
+    запросом только в этом случае.
+    """
+    if not link(Subscription, user_id, 'author', [author_id]):
+        return False
+    change_counters(User, [author_id], 'followers_count', 1)
+    schedule_backfill(user_id, author_id)
+    bump_user_version(user_id)
+    return True
+
+
+@transaction.atomic
+def unsubscribe(user_id, author_id):
+    """Отписывает от автора; False, если подписки не было."""
+    if not unlink(Subscription, user_id, 'author', [author_id]):
+        return False
+    change_counters(User, [author_id], 'followers_count', -1)
+    remove_author(user_id, author_id)
+    bump_user_version(user_id)
+    return True
@@ -0,0 +1,222 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from uuid import uuid4
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models.signals import (m2m_changed, post_delete, post_init,
+                                      post_save, pre_delete)
+from django.dispatch import receiver
+
+from users.models import Subscription, User
+from .counters import change_counter
+from .feed import remove_author, schedule_backfill
+from .models import (Favorite, Ingredient, IngredientInRecipe, Recipe,
+                     ShoppingCart, ShoppingListItem, Tag)
+
+INGREDIENTS_VERSION_KEY = 'recipes:ingredients:version'
+RECIPES_VERSION_KEY = 'recipes:recipes:version'
+TAGS_VERSION_KEY = 'recipes:tags:version'
+USER_VERSION_KEY = 'recipes:users:{}:version'
+# Поля автора, которые выдаются в составе рецептов (api.UserSerializer).
+AUTHOR_FIELDS = ('email', 'username', 'first_name', 'last_name')
+
+_cascade = ContextVar('recipes_delete_cascade', default=False)
+
+
+def get_version(key):
+    """Текущая версия (поколение) данных, общая для всех процессов."""
+    version = cache.get(key)
+    if version is None:
+        version = uuid4().hex
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(key):
+    """Помечает данные измененными после фиксации транзакции."""
+    transaction.on_commit(lambda: cache.set(key, uuid4().hex, None))
+
+
+def get_ingredients_version():
+    """Текущая версия справочника ингредиентов."""
+    return get_version(INGREDIENTS_VERSION_KEY)
+
+
+def bump_ingredients_version():
+    """Помечает справочник ингредиентов измененным во всех процессах.
+
+    Вызывается из сигналов и вручную после bulk-операций, которые
+    сигналы не отправляют.
+    """
+    bump_version(INGREDIENTS_VERSION_KEY)
+    bump_recipes_version()
+
+
+def get_recipes_version():
+    """Текущее поколение публичных данных рецептов."""
+    return get_version(RECIPES_VERSION_KEY)
+
+
+def bump_recipes_version():
+    bump_version(RECIPES_VERSION_KEY)
+
+
+def get_tags_version():
+    return get_version(TAGS_VERSION_KEY)
+
+
+def get_user_version(user_id):
+    """Версия избранного, корзины и подписок пользователя."""
+    return get_version(USER_VERSION_KEY.format(user_id))
+
+
+def bump_user_version(user_id):
+    bump_version(USER_VERSION_KEY.format(user_id))
+
+
+def bump_user_versions(user_ids):
+    """То же для нескольких пользователей, одной записью в кеш."""
+    keys = {USER_VERSION_KEY.format(user_id) for user_id in user_ids}
+    if keys:
+        transaction.on_commit(lambda: cache.set_many(
+            {key: uuid4().hex for key in keys}, None
+        ))
+
+
+@contextmanager
+def cascade():
+    """Удаление, последствия каскада которого учтены вызывающим.
+
+    Обработчики удаления строк избранного, корзины, подписок и рецептов
+    внутри него ничего не делают (см. recipes.deletion).
+    """
+    token = _cascade.set(True)
+    try:
+        yield
+    finally:
+        _cascade.reset(token)
+
+
+def in_cascade():
+    return _cascade.get()
+
+
+@receiver(post_save, sender=Ingredient)
+@receiver(post_delete, sender=Ingredient)
+def ingredient_changed(**kwargs):
+    bump_ingredients_version()
+
+
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+def tag_changed(**kwargs):
+    bump_version(TAGS_VERSION_KEY)
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_delete, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+@receiver(post_delete, sender=ShoppingCart)
+@receiver(post_save, sender=Subscription)
+@receiver(post_delete, sender=Subscription)
+def user_relations_changed(instance, **kwargs):
+    if not in_cascade():
+        bump_user_version(instance.user_id)
+
+
+@receiver(post_save, sender=Recipe)
+@receiver(post_delete, sender=Recipe)
+@receiver(post_save, sender=Tag)
+@receiver(post_delete, sender=Tag)
+@receiver(post_save, sender=IngredientInRecipe)
+@receiver(post_delete, sender=IngredientInRecipe)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def recipe_changed(**kwargs):
+    bump_recipes_version()
+
+
+def author_fields(user):
+    """Значения AUTHOR_FIELDS; отложенные поля не загружаются."""
+    return tuple(user.__dict__.get(field) for field in AUTHOR_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_author_fields(instance, **kwargs):
+    instance._author_fields = author_fields(instance)
+
+
+@receiver(post_save, sender=User)
+def author_changed(instance, created, update_fields=None, **kwargs):
+    """Меняет версию рецептов, только если изменились поля автора.
+
+    Вход, смена пароля и новый пользователь без рецептов не сбрасывают
+    кеш ответов и ETag рецептов.
+    """
+    if update_fields is not None and not set(update_fields) & set(
+        AUTHOR_FIELDS
+    ):
+        return
+    fields = author_fields(instance)
+    if not created and fields != instance._author_fields:
+        bump_recipes_version()
+    instance._author_fields = fields
+
+
+@receiver(post_save, sender=ShoppingCart)
+def recipe_added_to_cart(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        ShoppingListItem.objects.add_recipe(
+            [instance.user_id], instance.recipe_id
+        )
+        change_counter(Recipe, instance.recipe_id, 'in_carts_count', 1)
+
+
+@receiver(pre_delete, sender=ShoppingCart)
+def recipe_removed_from_cart(instance, **kwargs):
+    if in_cascade():
+        return
+    ShoppingListItem.objects.add_recipe(
+        [instance.user_id], instance.recipe_id, sign=-1
+    )
+    change_counter(Recipe, instance.recipe_id, 'in_carts_count', -1)
+
+
+@receiver(post_save, sender=Favorite)
+def recipe_added_to_favorites(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', 1)
+
+
+@receiver(post_delete, sender=Favorite)
+def recipe_removed_from_favorites(instance, **kwargs):
+    if not in_cascade():
+        change_counter(Recipe, instance.recipe_id, 'favorites_count', -1)
+
+
+@receiver(post_save, sender=Recipe)
+def recipe_created(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(User, instance.author_id, 'recipes_count', 1)
+
+
+@receiver(post_delete, sender=Recipe)
+def recipe_deleted(instance, **kwargs):
+    if not in_cascade():
+        change_counter(User, instance.author_id, 'recipes_count', -1)
+
+
+@receiver(post_save, sender=Subscription)
+def subscription_created(instance, created, raw=False, **kwargs):
+    if created and not raw:
+        change_counter(User, instance.author_id, 'followers_count', 1)
+        schedule_backfill(instance.user_id, instance.author_id)
+
+
+@receiver(post_delete, sender=Subscription)
+def subscription_deleted(instance, **kwargs):
+    if in_cascade():
+        return
+    change_counter(User, instance.author_id, 'followers_count', -1)
+    remove_author(instance.user_id, instance.author_id)
@@ -0,0 +1,48 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = Lock()
+
+
+def get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(
+                max_workers=settings.BACKGROUND_TASK_WORKERS,
+                thread_name_prefix='background',
+            )
+    return _executor
+
+
+def run_task(func, *args):
+    close_old_connections()
+    try:
+        func(*args)
+    except Exception:
+        logger.exception('Ошибка фоновой задачи %s%r', func.__name__, args)
+    finally:
+        close_old_connections()
+
+
+def run_after_commit(func, *args):
+    """Выполняет func(*args) в пуле потоков после фиксации транзакции.
+
+    Очередь живет в памяти процесса: задачи, не выполненные к остановке
+    воркера, теряются, поэтому у каждой задачи есть команда пересборки.
+    При BACKGROUND_TASKS_ASYNC=False задача выполняется сразу после
+    фиксации в текущем потоке (тесты, бенчмарки).
+    """
+    if settings.BACKGROUND_TASKS_ASYNC:
+        transaction.on_commit(
+            lambda: get_executor().submit(run_task, func, *args)
+        )
+    else:
+        transaction.on_commit(lambda: func(*args))
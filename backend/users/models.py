@@ -1,7 +1,25 @@
-from django.contrib.auth.models import AbstractUser
+from functools import partial
+
+from django.contrib.auth.models import AbstractUser, UserManager
 from django.db import models
 
 
+class UserQuerySet(models.QuerySet):
+
+    def delete(self):
+        """Удаляет пользователей, учитывая каскад одной пачкой.
+
+        Счетчики, списки покупок и версии данных других пользователей
+        поддерживает recipes.deletion.
+        """
+        from recipes.deletion import delete_users
+        return delete_users(self, super().delete)
+
+
+class CustomUserManager(UserManager.from_queryset(UserQuerySet)):
+    pass
+
+
 class User(AbstractUser):
     """Модель пользователя."""
 
@@ -23,9 +41,21 @@ class User(AbstractUser):
         max_length=150,
         verbose_name='Фамилия',
     )
+    recipes_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество рецептов',
+    )
+    followers_count = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Количество подписчиков',
+    )
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name', 'password']
 
+    objects = CustomUserManager()
+
     class Meta:
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
@@ -34,6 +64,13 @@ class User(AbstractUser):
     def __str__(self) -> str:
         return self.username
 
+    def delete(self, using=None, keep_parents=False):
+        from recipes.deletion import delete_users
+        return delete_users(
+            User.objects.using(using).filter(pk=self.pk),
+            partial(super().delete, using, keep_parents),
+        )
+
 
 class Subscription(models.Model):
     """Модель подписок."""